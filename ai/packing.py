@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from paper_notes.trace import traced
+
+# Context window sizes (tokens) for models we commonly target; unknown models use DEFAULT_CONTEXT.
+MODEL_CONTEXT: Dict[str, int] = {
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+    "gpt-4.1": 1_000_000,
+    "gpt-4.1-mini": 1_000_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-3.5-turbo": 16_385,
+}
+DEFAULT_CONTEXT = 16_000
+DUPLICATE_JACCARD = 0.8
+MIN_PARTIAL_TOKENS = 48
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?。！？])\s+|\n{2,}|\n(?=#)")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+@lru_cache(maxsize=8)
+def get_token_counter(model: str = "gpt-4o-mini") -> Callable[[str], int]:
+    """Fast token counter for ``model``: tiktoken if installed, else a regex estimate.
+
+    The estimate counts ASCII words as ~1.3 tokens and every other non-space
+    character (CJK, punctuation) as one, which tracks BPE tokenizers closely
+    enough for budgeting.
+    """
+    try:
+        import tiktoken  # type: ignore
+
+        try:
+            enc = tiktoken.encoding_for_model(model)
+        except KeyError:
+            enc = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    except Exception:
+        pass
+
+    def estimate(text: str) -> int:
+        n = 0.0
+        for w in _WORD_RE.findall(text):
+            n += 1.3 if w[0].isascii() and w[0].isalnum() else 1.0
+        return int(n + 0.5)
+
+    return estimate
+
+
+def default_budget(model: str, *, reserve_output: int = 2_000, prompt_overhead: int = 1_000,
+                   cap: int = 12_000) -> int:
+    """Context-token budget for ``model``: window minus output/prompt reserve, capped for latency/cost."""
+    window = MODEL_CONTEXT.get(model, DEFAULT_CONTEXT)
+    return max(256, min(cap, window - reserve_output - prompt_overhead))
+
+
+def _shingles(text: str, n: int = 5) -> Set[int]:
+    toks = _WORD_RE.findall(text.lower())
+    if len(toks) < n:
+        toks = toks + [""] * (n - len(toks))
+    return {
+        int.from_bytes(hashlib.blake2b("\0".join(toks[i : i + n]).encode("utf-8"), digest_size=8).digest(), "little")
+        for i in range(len(toks) - n + 1)
+    }
+
+
+def _is_duplicate(sh: Set[int], kept: List[Set[int]], threshold: float) -> bool:
+    for other in kept:
+        inter = len(sh & other)
+        if inter and inter / (len(sh) + len(other) - inter) >= threshold:
+            return True
+    return False
+
+
+def _fit_sentences(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """Longest prefix of whole sentences of ``text`` that fits in ``budget`` tokens."""
+    out = ""
+    used = 0
+    pos = 0
+    for m in list(_SENTENCE_RE.finditer(text)) + [None]:
+        end = m.start() if m else len(text)
+        piece = text[pos:end]
+        cost = count(piece)
+        if used + cost > budget:
+            break
+        out = text[:end]
+        used += cost
+        pos = m.end() if m else len(text)
+    return out.rstrip()
+
+
+@traced("packing.pack_chunks")
+def pack_chunks(chunks: Sequence[Tuple[str, str, float]], budget: int, *, model: str = "gpt-4o-mini",
+                dedupe_threshold: float = DUPLICATE_JACCARD) -> Tuple[str, Dict[str, int]]:
+    """Greedily pack (paper_id, text, score) chunks into ``budget`` tokens, best score first.
+
+    Near-duplicate chunks (word 5-gram Jaccard >= ``dedupe_threshold``) are
+    skipped; a chunk that does not fit whole is cut at the last sentence
+    boundary that fits, and dropped if less than ``MIN_PARTIAL_TOKENS`` remain.
+    Returns the context text and packing stats.
+    """
+    count = get_token_counter(model)
+    sep = "\n\n---\n\n"
+    sep_cost = count(sep)
+    stats = {"budget": budget, "tokens_used": 0, "chunks_in": len(chunks), "chunks_used": 0,
+             "dropped_duplicate": 0, "dropped_budget": 0, "truncated": 0}
+    parts: List[str] = []
+    kept: List[Set[int]] = []
+    used = 0
+    for pid, text, score in sorted(chunks, key=lambda c: c[2], reverse=True):
+        sh = _shingles(text)
+        if _is_duplicate(sh, kept, dedupe_threshold):
+            stats["dropped_duplicate"] += 1
+            continue
+        header = f"# [{pid}] (score={score:.3f})\n"
+        overhead = count(header) + (sep_cost if parts else 0)
+        remaining = budget - used - overhead
+        cost = count(text)
+        if cost > remaining:
+            if remaining < MIN_PARTIAL_TOKENS:
+                stats["dropped_budget"] += 1
+                continue
+            text = _fit_sentences(text, remaining, count)
+            if not text:
+                stats["dropped_budget"] += 1
+                continue
+            cost = count(text)
+            stats["truncated"] += 1
+        parts.append(header + text)
+        kept.append(sh)
+        used += overhead + cost
+        stats["chunks_used"] += 1
+    stats["tokens_used"] = used
+    return sep.join(parts), stats
+
+
+def pack_documents(docs: Sequence[Tuple[str, str, float]], budget: int, *, model: str = "gpt-4o-mini",
+                   prompt: Optional[str] = None, embedder=None) -> Tuple[str, Dict[str, int]]:
+    """Pack (paper_id, text, weight) docs into ``budget`` tokens.
+
+    With a ``prompt`` candidates are retrieved chunks scored by relevance ×
+    weight; without one every chunk competes by weight, earlier chunks of a
+    document first.
+    """
+    from ai.vectors import chunk_text, retrieve
+
+    if prompt:
+        candidates = retrieve(prompt, list(docs), k=64, embedder=embedder)
+    else:
+        candidates = []
+        for pid, text, w in docs:
+            if float(w) <= 0:
+                continue
+            for i, (_, _, chunk) in enumerate(chunk_text(pid, text)):
+                candidates.append((pid, chunk, float(w) / (1 + 0.01 * i)))
+    return pack_chunks(candidates, budget, model=model)
@@ -1,46 +1,277 @@
 from __future__ import annotations
 
-from typing import List, Tuple
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
+from paper_notes.trace import count, traced
 
-def generate_with_langchain(prompt: str, context: str, *, model: str = "gpt-4o-mini", temperature: float = 0.2) -> str:
-    """Generate output using LangChain + OpenAI chat model with the given context.
+RESPONSE_CACHE_PATH = Path("data") / "cache" / "llm_responses.sqlite"
+# Bump when PROMPT_TEMPLATE changes so cached answers to the old template are not reused.
+TEMPLATE_VERSION = 1
 
-    Falls back by raising an explanatory error if dependencies or API key are missing.
+
+SYSTEM_PROMPT = (
+    "You are a helpful research assistant. Use the provided Context to answer. "
+    "Cite paper_ids inline if possible. Be concise but accurate."
+)
+PROMPT_TEMPLATE = (
+    "SYSTEM:\n" + SYSTEM_PROMPT + "\n\n"
+    "USER:\n"
+    "Prompt:\n{prompt}\n\n"
+    "Context:\n{context}\n\n"
+    "Instructions:\n"
+    "- Synthesize across documents; avoid repetition.\n"
+    "- Include a short bullet list of key points.\n"
+    "- If context is insufficient, say so explicitly.\n"
+)
+FAKE_MODEL = "fake"
+
+
+class FakeStreamingChain:
+    """Offline stand-in for the LangChain chain (model name ``fake`` or ``PAPER_NOTES_FAKE_LLM=1``).
+
+    Answers deterministically from the inputs and streams word by word with
+    an optional per-token delay, so the UI and callers can be exercised
+    without network access or an API key.
     """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+
+    def _answer(self, inputs: Dict[str, str]) -> str:
+        ids = sorted(set(re.findall(r"# \[([^\]]+)\]", inputs.get("context", ""))))
+        return (
+            f"(fake LLM) Prompt: {inputs.get('prompt', '').strip()[:200]}\n\n"
+            f"- Context: {len(inputs.get('context', ''))} chars from {len(ids)} document(s)\n"
+            f"- Papers: {', '.join(ids) or 'none'}\n"
+        )
+
+    def invoke(self, inputs: Dict[str, str]) -> str:
+        return self._answer(inputs)
+
+    def stream(self, inputs: Dict[str, str]) -> Iterator[str]:
+        for tok in re.findall(r"\S+\s*|\s+", self._answer(inputs)):
+            if self.delay:
+                time.sleep(self.delay)
+            yield tok
+
+    async def astream(self, inputs: Dict[str, str]) -> AsyncIterator[str]:
+        for tok in re.findall(r"\S+\s*|\s+", self._answer(inputs)):
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield tok
+
+
+def effective_model(model: str) -> str:
+    """``model``, or ``FAKE_MODEL`` while ``PAPER_NOTES_FAKE_LLM=1`` overrides it."""
+    return FAKE_MODEL if os.getenv("PAPER_NOTES_FAKE_LLM") == "1" else model
+
+
+def get_chain(model: str = "gpt-4o-mini", temperature: float = 0.2):
+    """Return the prompt | chat model | parser chain, built once per (model, temperature).
+
+    The fake-model override is resolved on every call, so toggling
+    ``PAPER_NOTES_FAKE_LLM`` takes effect without restarting the process.
+    Raises an explanatory RuntimeError if dependencies or API key are missing.
+    """
+    model = effective_model(model)
+    if model == FAKE_MODEL:
+        return FakeStreamingChain(delay=float(os.getenv("PAPER_NOTES_FAKE_LLM_DELAY", "0") or 0))
+    return _build_chain(model, temperature)
+
+
+@lru_cache(maxsize=16)
+def _build_chain(model: str, temperature: float):
     try:
         from langchain_core.prompts import PromptTemplate
         from langchain_openai import ChatOpenAI
         from langchain_core.output_parsers import StrOutputParser
-        import os
     except Exception as e:
         raise RuntimeError(f"LangChain/OpenAI not available: {e}")
 
     if not (os.getenv("OPENAI_API_KEY") or os.getenv("AZURE_OPENAI_API_KEY")):
         raise RuntimeError("OPENAI_API_KEY (or AZURE_OPENAI_API_KEY) is not set")
 
-    sys_pt = (
-        "You are a helpful research assistant. Use the provided Context to answer. "
-        "Cite paper_ids inline if possible. Be concise but accurate."
-    )
-    template = (
-        "SYSTEM:\n" + sys_pt + "\n\n"
-        "USER:\n"
-        "Prompt:\n{prompt}\n\n"
-        "Context:\n{context}\n\n"
-        "Instructions:\n"
-        "- Synthesize across documents; avoid repetition.\n"
-        "- Include a short bullet list of key points.\n"
-        "- If context is insufficient, say so explicitly.\n"
-    )
-    pt = PromptTemplate.from_template(template)
-    llm = ChatOpenAI(model=model, temperature=temperature)
-    chain = pt | llm | StrOutputParser()
-    return chain.invoke({"prompt": prompt, "context": context})
-
-
-def build_context_from_docs(docs: List[Tuple[str, str, float]], *, top_k: int = 5, per_doc_chars: int = 2000) -> str:
-    """Create a plain-text context from (paper_id, text, weight)."""
+    pt = PromptTemplate.from_template(PROMPT_TEMPLATE)
+    llm = ChatOpenAI(model=model, temperature=temperature, streaming=True)
+    return pt | llm | StrOutputParser()
+
+
+class ResponseCache:
+    """Persistent LLM response cache with TTL and size-bounded LRU eviction.
+
+    Keys hash (prompt, context, model, temperature, TEMPLATE_VERSION), with
+    ``model`` being the effective one (``fake`` under the override); entries
+    older than ``ttl`` seconds are ignored and purged, and once more than
+    ``max_entries`` are stored the least recently used ones are evicted.
+    ``hits``/``misses`` count lookups in this process.
+    """
+
+    def __init__(self, path: Path = RESPONSE_CACHE_PATH, *, ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 2_000) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        return conn
+
+    @staticmethod
+    def key(prompt: str, context: str, model: str, temperature: float) -> str:
+        raw = "\0".join([prompt, context, model, repr(float(temperature)), str(TEMPLATE_VERSION)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, *, model: str = "") -> None:
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock, closing(self._connect()) as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache (``PAPER_NOTES_LLM_CACHE_TTL`` / ``_MAX`` override the defaults)."""
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        _RESPONSE_CACHE = ResponseCache(
+            ttl=float(os.getenv("PAPER_NOTES_LLM_CACHE_TTL", 7 * 24 * 3600)),
+            max_entries=int(os.getenv("PAPER_NOTES_LLM_CACHE_MAX", 2_000)),
+        )
+    return _RESPONSE_CACHE
+
+
+@traced("rag.generate")
+def generate_with_langchain(prompt: str, context: str, *, model: str = "gpt-4o-mini", temperature: float = 0.2,
+                            use_cache: bool = True) -> str:
+    """Generate output using LangChain + OpenAI chat model with the given context.
+
+    Answers are served from / stored in the response cache unless ``use_cache`` is False.
+    Falls back by raising an explanatory error if dependencies or API key are missing.
+    """
+    model = effective_model(model)
+    cache = get_response_cache() if use_cache else None
+    key = ResponseCache.key(prompt, context, model, temperature)
+    if cache is not None:
+        hit = cache.get(key)
+        count("cache_hits" if hit is not None else "cache_misses")
+        if hit is not None:
+            return hit
+    out = get_chain(model, temperature).invoke({"prompt": prompt, "context": context})
+    if cache is not None:
+        cache.put(key, out, model=model)
+    return out
+
+
+@traced("rag.stream")
+def stream_with_langchain(prompt: str, context: str, *, model: str = "gpt-4o-mini",
+                          temperature: float = 0.2, use_cache: bool = True) -> Iterator[str]:
+    """Like ``generate_with_langchain`` but yields text chunks as the model produces them.
+
+    A cached answer is yielded as a single chunk; a fresh one is cached once fully streamed.
+    """
+    model = effective_model(model)
+    cache = get_response_cache() if use_cache else None
+    key = ResponseCache.key(prompt, context, model, temperature)
+    if cache is not None:
+        hit = cache.get(key)
+        count("cache_hits" if hit is not None else "cache_misses")
+        if hit is not None:
+            yield hit
+            return
+    chain = get_chain(model, temperature)
+    parts: List[str] = []
+    for chunk in chain.stream({"prompt": prompt, "context": context}):
+        parts.append(chunk)
+        yield chunk
+    if cache is not None:
+        cache.put(key, "".join(parts), model=model)
+
+
+async def astream_with_langchain(prompt: str, context: str, *, model: str = "gpt-4o-mini",
+                                 temperature: float = 0.2, use_cache: bool = True) -> AsyncIterator[str]:
+    """Async variant of ``stream_with_langchain``."""
+    model = effective_model(model)
+    cache = get_response_cache() if use_cache else None
+    key = ResponseCache.key(prompt, context, model, temperature)
+    if cache is not None:
+        hit = await asyncio.to_thread(cache.get, key)
+        if hit is not None:
+            yield hit
+            return
+    chain = get_chain(model, temperature)
+    parts: List[str] = []
+    async for chunk in chain.astream({"prompt": prompt, "context": context}):
+        parts.append(chunk)
+        yield chunk
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, "".join(parts), model=model)
+
+
+@traced("rag.build_context")
+def build_context_from_docs(docs: List[Tuple[str, str, float]], *, top_k: int = 5, per_doc_chars: int = 2000,
+                            prompt: Optional[str] = None, embedder=None) -> str:
+    """Create a plain-text context from (paper_id, text, weight).
+
+    With ``prompt``, the context is the ``top_k`` most prompt-relevant chunks
+    (vector similarity × weight, see ``ai.vectors.retrieve``); otherwise the
+    first ``per_doc_chars`` of the ``top_k`` highest-weighted docs.
+    """
+    if prompt:
+        from ai.vectors import retrieve
+
+        hits = retrieve(prompt, docs, k=top_k, embedder=embedder, max_chars=min(per_doc_chars, 1000))
+        return "\n\n---\n\n".join(f"# [{pid}] (score={score:.3f})\n{text}" for pid, text, score in hits)
     docs = sorted(docs, key=lambda x: x[2], reverse=True)
     parts: List[str] = []
     for pid, text, w in docs[: min(top_k, len(docs))]:
@@ -48,3 +279,16 @@ def build_context_from_docs(docs: List[Tuple[str, str, float]], *, top_k: int =
         parts.append(f"# [{pid}] (w={w})\n{snippet}")
     return "\n\n---\n\n".join(parts)
 
+
+@traced("rag.build_packed_context")
+def build_packed_context(docs: List[Tuple[str, str, float]], *, prompt: Optional[str] = None,
+                         model: str = "gpt-4o-mini", token_budget: Optional[int] = None,
+                         embedder=None) -> Tuple[str, Dict[str, int]]:
+    """Token-budgeted context for ``model`` plus packing stats (see ``ai.packing.pack_chunks``).
+
+    ``token_budget`` defaults to ``ai.packing.default_budget(model)``.
+    """
+    from ai.packing import default_budget, pack_documents
+
+    budget = token_budget or default_budget(model)
+    return pack_documents(docs, budget, model=model, prompt=prompt, embedder=embedder)
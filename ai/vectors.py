@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+from array import array
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from paper_notes.trace import count, traced
+
+EMBED_CACHE_PATH = Path("data") / "cache" / "embeddings.sqlite"
+VECTOR_DIR = Path("data") / "cache" / "chroma"
+
+Chunk = Tuple[str, str, str]  # (chunk_id, paper_id, text)
+
+
+def chunk_text(paper_id: str, text: str, *, max_chars: int = 1000, overlap: int = 200) -> List[Chunk]:
+    """Split a note into heading/paragraph-aligned chunks of at most ``max_chars``.
+
+    Paragraphs are packed greedily; an oversized paragraph is cut into windows
+    with ``overlap`` characters of carry-over. Chunk ids hash paper_id + text,
+    so unchanged chunks keep their id (and cached embedding) across edits.
+    """
+    paras = [p.strip() for p in re.split(r"\n\s*\n|\n(?=#{1,6}\s)", text) if p.strip()]
+    pieces: List[str] = []
+    for p in paras:
+        if len(p) <= max_chars:
+            pieces.append(p)
+            continue
+        step = max(1, max_chars - overlap)
+        pieces.extend(p[i : i + max_chars] for i in range(0, len(p), step))
+    chunks: List[str] = []
+    buf = ""
+    for p in pieces:
+        if buf and len(buf) + len(p) + 2 > max_chars:
+            chunks.append(buf)
+            buf = ""
+        buf = f"{buf}\n\n{p}" if buf else p
+    if buf:
+        chunks.append(buf)
+    out: List[Chunk] = []
+    for c in chunks:
+        cid = hashlib.sha1(f"{paper_id}\0{c}".encode("utf-8")).hexdigest()
+        out.append((cid, paper_id, c))
+    return out
+
+
+class HashingEmbedder:
+    """Dependency-free local embedder: signed feature hashing of BM25 tokens, L2-normalized."""
+
+    def __init__(self, dim: int = 512) -> None:
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        from paper_notes.search import tokenize
+
+        out: List[List[float]] = []
+        for t in texts:
+            vec = [0.0] * self.dim
+            for tok in tokenize(t):
+                h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+                vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            out.append([v / norm for v in vec])
+        return out
+
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model (``pip install sentence-transformers``)."""
+
+    def __init__(self, model: str = "intfloat/multilingual-e5-small", batch_size: int = 32) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer  # type: ignore
+        except Exception as e:
+            raise RuntimeError(f"sentence-transformers not available: {e}")
+        self.model = SentenceTransformer(model)
+        self.batch_size = batch_size
+        self.name = f"st-{model.replace('/', '_')}"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vecs = self.model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True)
+        return [list(map(float, v)) for v in vecs]
+
+
+_EMBEDDERS: Dict[str, object] = {}
+
+
+def get_embedder(spec: str = "hashing"):
+    """Return a cached embedder: ``hashing[:dim]`` or ``st:<sentence-transformers model>``."""
+    if spec not in _EMBEDDERS:
+        kind, _, arg = spec.partition(":")
+        if kind == "hashing":
+            _EMBEDDERS[spec] = HashingEmbedder(int(arg) if arg else 512)
+        elif kind == "st":
+            _EMBEDDERS[spec] = SentenceTransformerEmbedder(arg) if arg else SentenceTransformerEmbedder()
+        else:
+            raise ValueError(f"Unknown embedder: {spec}")
+    return _EMBEDDERS[spec]
+
+
+def _connect_cache(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+    return conn
+
+
+@traced("vectors.embed")
+def embed_texts(embedder, texts: Sequence[str], *, batch_size: int = 64,
+                cache_path: Path = EMBED_CACHE_PATH) -> List[List[float]]:
+    """Embed ``texts`` in batches, reusing vectors cached by (embedder, text) hash."""
+    keys = [hashlib.sha256(f"{embedder.name}\0{t}".encode("utf-8")).hexdigest() for t in texts]
+    found: Dict[str, List[float]] = {}
+    with closing(_connect_cache(cache_path)) as conn:
+        for i in range(0, len(keys), 500):
+            part = keys[i : i + 500]
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part)
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        todo = [(k, t) for k, t in dict(zip(keys, texts)).items() if k not in found]
+        count("texts", len(keys))
+        count("embedded", len(todo))
+        for i in range(0, len(todo), batch_size):
+            batch = todo[i : i + batch_size]
+            vecs = embedder.embed([t for _, t in batch])
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(k, array("f", v).tobytes()) for (k, _), v in zip(batch, vecs)],
+                )
+            for (k, _), v in zip(batch, vecs):
+                found[k] = v
+    return [found[k] for k in keys]
+
+
+class MemoryVectorStore:
+    """Brute-force cosine store used when chromadb is not installed."""
+
+    def __init__(self) -> None:
+        self.items: Dict[str, Tuple[str, str, List[float]]] = {}
+
+    def missing(self, ids: Sequence[str]) -> List[str]:
+        return [i for i in ids if i not in self.items]
+
+    def upsert(self, chunks: Sequence[Chunk], vectors: Sequence[List[float]]) -> None:
+        for (cid, pid, text), vec in zip(chunks, vectors):
+            self.items[cid] = (pid, text, vec)
+
+    def prune(self, paper_ids: Sequence[str], live: set) -> int:
+        allowed = set(paper_ids)
+        stale = [cid for cid, (pid, _, _) in self.items.items() if pid in allowed and cid not in live]
+        for cid in stale:
+            del self.items[cid]
+        return len(stale)
+
+    def query(self, vector: List[float], k: int, paper_ids: Sequence[str]) -> List[Tuple[str, str, str, float]]:
+        allowed = set(paper_ids)
+        scored = [
+            (cid, pid, text, sum(a * b for a, b in zip(vector, vec)))
+            for cid, (pid, text, vec) in self.items.items()
+            if pid in allowed
+        ]
+        scored.sort(key=lambda x: x[3], reverse=True)
+        return scored[:k]
+
+
+class ChromaVectorStore:
+    """Persistent chromadb collection (cosine space) per embedder."""
+
+    def __init__(self, name: str, path: Path = VECTOR_DIR) -> None:
+        import chromadb  # type: ignore
+
+        path.mkdir(parents=True, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=str(path))
+        self.collection = self.client.get_or_create_collection(name=f"notes-{name}", metadata={"hnsw:space": "cosine"})
+
+    def missing(self, ids: Sequence[str]) -> List[str]:
+        if not ids:
+            return []
+        have = set(self.collection.get(ids=list(ids), include=[])["ids"])
+        return [i for i in ids if i not in have]
+
+    def upsert(self, chunks: Sequence[Chunk], vectors: Sequence[List[float]]) -> None:
+        if not chunks:
+            return
+        self.collection.upsert(
+            ids=[c[0] for c in chunks],
+            embeddings=[list(v) for v in vectors],
+            documents=[c[2] for c in chunks],
+            metadatas=[{"paper_id": c[1]} for c in chunks],
+        )
+
+    def prune(self, paper_ids: Sequence[str], live: set) -> int:
+        if not paper_ids:
+            return 0
+        have = self.collection.get(where=self._where(paper_ids), include=[])["ids"]
+        stale = [cid for cid in have if cid not in live]
+        if stale:
+            self.collection.delete(ids=stale)
+        return len(stale)
+
+    @staticmethod
+    def _where(paper_ids: Sequence[str]) -> dict:
+        return {"paper_id": {"$in": list(paper_ids)}} if len(paper_ids) > 1 else {"paper_id": paper_ids[0]}
+
+    def query(self, vector: List[float], k: int, paper_ids: Sequence[str]) -> List[Tuple[str, str, str, float]]:
+        if not paper_ids:
+            return []
+        res = self.collection.query(query_embeddings=[vector], n_results=k, where=self._where(paper_ids),
+                                    include=["documents", "metadatas", "distances"])
+        out = []
+        for cid, doc, meta, dist in zip(res["ids"][0], res["documents"][0], res["metadatas"][0], res["distances"][0]):
+            out.append((cid, str(meta.get("paper_id", "")), doc or "", 1.0 - float(dist)))
+        return out
+
+
+_STORES: Dict[str, object] = {}
+_STORE_LOCK = threading.Lock()
+
+
+def get_vector_store(embedder):
+    """Persistent chromadb store for ``embedder`` if available, else an in-process store."""
+    with _STORE_LOCK:
+        if embedder.name not in _STORES:
+            try:
+                _STORES[embedder.name] = ChromaVectorStore(embedder.name)
+            except Exception:
+                _STORES[embedder.name] = MemoryVectorStore()
+        return _STORES[embedder.name]
+
+
+@traced("vectors.retrieve")
+def retrieve(prompt: str, docs: List[Tuple[str, str, float]], *, k: int = 8, embedder=None,
+             max_chars: int = 1000, store=None) -> List[Tuple[str, str, float]]:
+    """Top-``k`` chunks for ``prompt`` across (paper_id, text, weight) docs.
+
+    Chunks are embedded once (cached by hash) and upserted into the vector
+    store, and stored chunks of these papers that no longer occur in their
+    text (edited notes) are deleted; the ranking score is cosine similarity ×
+    the document weight, and documents with weight 0 are excluded. Returns
+    (paper_id, chunk_text, score).
+    """
+    embedder = embedder or get_embedder()
+    store = store or get_vector_store(embedder)
+    weights = {pid: float(w) for pid, _, w in docs if float(w) > 0}
+    chunks = [c for pid, text, _ in docs if pid in weights for c in chunk_text(pid, text, max_chars=max_chars)]
+    if not chunks:
+        return []
+    live = {c[0] for c in chunks}
+    new_ids = set(store.missing([c[0] for c in chunks]))
+    new_chunks = [c for c in chunks if c[0] in new_ids]
+    if new_chunks:
+        store.upsert(new_chunks, embed_texts(embedder, [c[2] for c in new_chunks]))
+    count("pruned", store.prune(list(weights), live))
+    qvec = embed_texts(embedder, [prompt])[0]
+    # Over-fetch so weighting can reorder candidates beyond the raw top-k.
+    hits = store.query(qvec, max(k * 4, k), list(weights))
+    scored = [(pid, text, sim * weights.get(pid, 0.0)) for cid, pid, text, sim in hits if cid in live and sim > 0]
+    scored.sort(key=lambda x: x[2], reverse=True)
+    return scored[:k]
@@ -0,0 +1,264 @@
+"""Site build pipeline: tag index pages, the mkdocs nav and configured reviews.
+
+The corpus is loaded once (notes index + records). Every output is a node
+whose input hash covers exactly what it renders from: note content hashes
+(memoized per (mtime, size) in the build state), render options and
+``RENDER_VERSION``. An output is rebuilt only when its input hash changed or
+the file on disk no longer matches what the last build wrote; dirty reviews
+are rendered in parallel worker processes with the fragment cache.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from paper_notes.filters import get_filter_index, parse_year_range
+from paper_notes.fragments import RENDER_VERSION
+from paper_notes.index import scan_fingerprints
+from paper_notes.records import Note, list_records
+from paper_notes.review import NOTES_DIR, REVIEWS_DIR, resolve_local_pdf
+
+TAGS_DIR = Path('tags')
+MKDOCS_PATH = Path('site') / 'mkdocs.yml'
+REVIEWS_CONFIG = REVIEWS_DIR / 'reviews.toml'
+BUILD_STATE_PATH = Path('data') / 'cache' / 'build_state.json'
+BUILD_VERSION = 1
+
+_TAG_TITLE_RE = re.compile(r'^#\s+(.+?)\s+Tag Index\s*$', re.MULTILINE)
+_NAV_TAG_RE = re.compile(r'^\s*-\s+(.+?):\s+tags/(.+?)\.md\s*$')
+
+
+def _sha(*parts: object) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _file_sha(path: Path) -> str:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ''
+
+
+def load_state(path: Path = BUILD_STATE_PATH) -> Dict[str, Dict]:
+    try:
+        state = json.loads(path.read_text(encoding='utf-8'))
+        if state.get('version') == BUILD_VERSION:
+            return state
+    except (OSError, ValueError):
+        pass
+    return {'version': BUILD_VERSION, 'notes': {}, 'outputs': {}}
+
+
+def save_state(state: Dict[str, Dict], path: Path = BUILD_STATE_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def note_hashes(notes_dir: Path, state: Dict[str, Dict]) -> Dict[str, str]:
+    """Content hash per note file name, re-hashing only notes whose (mtime, size) changed."""
+    memo = state['notes']
+    out: Dict[str, str] = {}
+    for name, fp in scan_fingerprints(notes_dir).items():
+        prev = memo.get(name)
+        if prev and tuple(prev[0]) == fp:
+            out[name] = prev[1]
+        else:
+            out[name] = _file_sha(notes_dir / name)
+        memo[name] = [list(fp), out[name]]
+    for name in [n for n in memo if n not in out]:
+        del memo[name]
+    return out
+
+
+def tag_slug(tag: str) -> str:
+    return re.sub(r'\s+', '-', tag.strip().lower())
+
+
+def tag_display_names(tags_dir: Path = TAGS_DIR) -> Dict[str, str]:
+    """Display name per tag slug, taken from existing ``tags/*.md`` headings."""
+    names: Dict[str, str] = {}
+    for p in sorted(tags_dir.glob('*.md')):
+        m = _TAG_TITLE_RE.search(p.read_text(encoding='utf-8', errors='ignore'))
+        names[p.stem] = m.group(1) if m else p.stem
+    return names
+
+
+def render_tag_page(display: str, notes: List[Note]) -> str:
+    lines = [f'# {display} Tag Index', '']
+    if notes:
+        lines += [f'- [{n.paper_id}](../{NOTES_DIR.as_posix()}/{Path(n.path).name})'
+                  for n in sorted(notes, key=lambda n: n.paper_id)]
+    else:
+        lines.append('*(No entries yet)*')
+    return '\n'.join(lines) + '\n'
+
+
+def _yaml_str(text: str) -> str:
+    return json.dumps(text, ensure_ascii=False) if re.search(r'[:#\[\]{}&*!|>\'"%@`,]', text) else text
+
+
+def render_nav(records: List[Note], tags: List[Tuple[str, str]], reviews: List[Tuple[str, str]]) -> str:
+    lines = ['nav:', '  - Home: README.md', '  - Notes:']
+    for r in sorted(records, key=lambda r: r.paper_id):
+        lines.append(f'      - {_yaml_str(r.paper_id)}: {NOTES_DIR.as_posix()}/{Path(r.path).name}')
+    lines.append('  - Tags:')
+    for display, slug in tags:
+        lines.append(f'      - {_yaml_str(display)}: {TAGS_DIR.as_posix()}/{slug}.md')
+    lines.append('  - Reviews:')
+    lines.append(f'      - Overview: {REVIEWS_DIR.as_posix()}/README.md')
+    for title, output in reviews:
+        lines.append(f'      - {_yaml_str(title)}: {Path(output).as_posix()}')
+    return '\n'.join(lines) + '\n'
+
+
+def replace_nav(mkdocs_text: str, nav: str) -> str:
+    """Swap the top-level ``nav:`` block of mkdocs.yml, keeping every other key."""
+    lines = mkdocs_text.splitlines(keepends=True)
+    start = next((i for i, l in enumerate(lines) if l.startswith('nav:')), None)
+    if start is None:
+        return mkdocs_text.rstrip('\n') + '\n' + nav
+    end = start + 1
+    while end < len(lines) and (not lines[end].strip() or lines[end][0] in ' \t-'):
+        end += 1
+    return ''.join(lines[:start]) + nav + ''.join(lines[end:])
+
+
+def existing_tag_order(mkdocs_text: str) -> List[str]:
+    return [m.group(2) for m in map(_NAV_TAG_RE.match, mkdocs_text.splitlines()) if m]
+
+
+def load_review_configs(path: Path = REVIEWS_CONFIG) -> List[Dict[str, object]]:
+    if not path.exists():
+        return []
+    with open(path, 'rb') as f:
+        return list(tomllib.load(f).get('review', []))
+
+
+def _build_review(cfg: Dict[str, object], notes_dir: Path = NOTES_DIR) -> Tuple[str, str, str]:
+    """Render one configured review of ``notes_dir`` to its output file; returns (output, summary, output sha)."""
+    from paper_notes.fragments import FragmentCache
+    from paper_notes.review import generate_review, write_review
+
+    out_path = Path(str(cfg['output']))
+    fragments = FragmentCache()
+    chunks, items = generate_review(
+        str(cfg.get('title', 'Literature Review')), list(cfg.get('tags', [])), None, list(cfg.get('papers', [])),
+        bool(cfg.get('abstract', False)), tag_expr=str(cfg.get('where', '')),
+        year_range=parse_year_range(str(cfg['year'])) if cfg.get('year') else None, stream=True, fragments=fragments,
+        notes_dir=notes_dir,
+    )
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(f'.{out_path.name}.{os.getpid()}.tmp')
+    try:
+        with tmp.open('w', encoding='utf-8') as f:
+            write_review(chunks, f)
+        os.replace(tmp, out_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return str(out_path), f'{len(items)} paper(s), {fragments.summary()}', _file_sha(out_path)
+
+
+class Build:
+    """One build run: decides per output whether it is dirty and records what was written."""
+
+    def __init__(self, state: Dict[str, Dict], force: bool = False) -> None:
+        self.state = state
+        self.force = force
+        self.written: List[str] = []
+        self.skipped: List[str] = []
+
+    def dirty(self, output: str, input_hash: str) -> bool:
+        prev = self.state['outputs'].get(output)
+        if self.force or not prev or prev[0] != input_hash:
+            return True
+        return _file_sha(Path(output)) != prev[1]
+
+    def record(self, output: str, input_hash: str, output_sha: str) -> None:
+        self.state['outputs'][output] = [input_hash, output_sha]
+
+    def write_text(self, output: str, input_hash: str, render: Callable[[], str]) -> None:
+        if not self.dirty(output, input_hash):
+            self.skipped.append(output)
+            return
+        path = Path(output)
+        text = render()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists() or path.read_text(encoding='utf-8') != text:
+            tmp = path.with_name(f'.{path.name}.tmp')
+            tmp.write_text(text, encoding='utf-8')
+            os.replace(tmp, path)
+        self.record(output, input_hash, _file_sha(path))
+        self.written.append(output)
+
+
+def build_site(*, notes_dir: Path = NOTES_DIR, force: bool = False, workers: Optional[int] = None,
+               state_path: Path = BUILD_STATE_PATH, log: Callable[[str], None] = print) -> Dict[str, int]:
+    """Regenerate tag pages, the mkdocs nav and configured reviews; returns counts."""
+    state = load_state(state_path)
+    build = Build(state, force=force)
+    hashes = note_hashes(notes_dir, state)
+    index = get_filter_index(notes_dir)
+    records = list_records([notes_dir / n for n in sorted(index.names_of(index.live))])
+    by_name = {Path(r.path).name: r for r in records}
+
+    # Tag pages: one per tag used by any note, plus hand-made pages that already exist.
+    displays = tag_display_names()
+    members: Dict[str, List[Note]] = {}
+    for r in records:
+        for t in r.tags:
+            members.setdefault(tag_slug(t), []).append(r)
+            displays.setdefault(tag_slug(t), '-'.join(w.capitalize() for w in tag_slug(t).split('-')))
+    for slug, display in displays.items():
+        notes = members.get(slug, [])
+        key = _sha('tag', BUILD_VERSION, display, sorted((n.paper_id, Path(n.path).name) for n in notes))
+        build.write_text((TAGS_DIR / f'{slug}.md').as_posix(), key, lambda d=display, ns=notes: render_tag_page(d, ns))
+
+    # Reviews: dirty ones are rendered in parallel.
+    configs = load_review_configs()
+    todo: List[Tuple[Dict[str, object], str]] = []
+    for cfg in configs:
+        year_range = parse_year_range(str(cfg['year'])) if cfg.get('year') else None
+        names = index.select(list(cfg.get('tags', [])), None, list(cfg.get('papers', [])),
+                             tag_expr=str(cfg.get('where', '')), year_range=year_range)
+        # Every item prints its resolved local PDF; with abstracts its contents matter too.
+        pdfs = []
+        for n in names:
+            pdf = resolve_local_pdf(by_name[n].meta) if n in by_name else None
+            st = pdf.stat() if pdf and cfg.get('abstract') else None
+            pdfs.append((str(pdf), st.st_mtime_ns, st.st_size) if st else str(pdf))
+        key = _sha('review', BUILD_VERSION, RENDER_VERSION, cfg, [(n, hashes.get(n, '')) for n in names], pdfs)
+        output = Path(str(cfg['output'])).as_posix()
+        if build.dirty(output, key):
+            todo.append((cfg, key))
+        else:
+            build.skipped.append(output)
+    if len(todo) > 1 and (workers or os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_build_review, [cfg for cfg, _ in todo], [notes_dir] * len(todo)))
+    else:
+        results = [_build_review(cfg, notes_dir) for cfg, _ in todo]
+    for (cfg, key), (output, summary, sha) in zip(todo, results):
+        build.record(Path(output).as_posix(), key, sha)
+        build.written.append(Path(output).as_posix())
+        log(f'review {output}: {summary}')
+
+    # mkdocs nav: existing tag order first, new tags appended alphabetically.
+    mkdocs_text = MKDOCS_PATH.read_text(encoding='utf-8') if MKDOCS_PATH.exists() else 'site_name: Paper Notes\n'
+    order = [s for s in existing_tag_order(mkdocs_text) if s in displays]
+    order += sorted(s for s in displays if s not in order)
+    tags_nav = [(displays[s], s) for s in order]
+    reviews_nav = [(str(c.get('title', 'Literature Review')), str(c['output'])) for c in configs]
+    nav_key = _sha('nav', BUILD_VERSION, sorted((r.paper_id, Path(r.path).name) for r in records), tags_nav,
+                   reviews_nav, _sha(replace_nav(mkdocs_text, '')))
+    build.write_text(MKDOCS_PATH.as_posix(), nav_key,
+                     lambda: replace_nav(mkdocs_text, render_nav(records, tags_nav, reviews_nav)))
+
+    save_state(state, state_path)
+    return {'written': len(build.written), 'skipped': len(build.skipped), 'notes': len(records)}
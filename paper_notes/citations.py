@@ -0,0 +1,434 @@
+"""Citation graph over the notes corpus.
+
+References come from two places: the reference list at the end of each
+paper's PDF (found by reading pages backwards until a "References" heading;
+the text is cached per PDF hash) and the note's BibTeX entries after the
+first, which is the paper's own entry. Both are
+resolved to existing paper_ids by DOI, arXiv id (version-less) and normalized
+title, the latter through an index on the first four title words so a
+reference list is scanned in one pass over its words.
+
+The graph is stored in ``data/cache/citations/`` as CSR arrays (``indptr`` and
+``indices`` int32 for outgoing and incoming edges) that are memory-mapped on
+load, plus ``graph.json`` with the node list and a fingerprint of the inputs
+(note and PDF stats); ``build_graph`` only re-resolves when it changes.
+Queries: ``cites``, ``cited_by``, ``co_cited``, ``coupled`` and
+``neighborhood``. ``review_sections`` groups the papers of a review by the
+connected components of the graph restricted to them.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from paper_notes.dedupe import MIN_TITLE_KEY, arxiv_id, normalize
+from paper_notes.trace import count, traced
+
+if TYPE_CHECKING:
+    from paper_notes.records import Note
+
+CITATIONS_DIR = Path('data') / 'cache' / 'citations'
+REFS_CACHE_NAME = 'references.sqlite'
+GRAPH_VERSION = 2
+# Bump when reference-list extraction changes; cached texts are keyed by it.
+REFS_VERSION = 1
+REF_PAGES = 8
+TITLE_PREFIX = 4
+
+_DOI_RE = re.compile(r'10\.\d{4,9}/[^\s"<>{}]+')
+_ARXIV_REF_RE = re.compile(r'arxiv(?:\.org/(?:abs|pdf)/|\s*:\s*|\s+)(\d{4}\.\d{4,5})', re.IGNORECASE)
+_ENTRY_RE = re.compile(r'^\s*@', re.MULTILINE)
+
+
+def _doi(text: str) -> str:
+    m = _DOI_RE.fullmatch(text.strip().lower())
+    return m.group(0) if m else ''
+
+
+def cited_bibtex(bibtex: str) -> str:
+    """The note's BibTeX without its first entry, which describes the paper itself."""
+    starts = [m.start() for m in _ENTRY_RE.finditer(bibtex)]
+    return bibtex[starts[1]:].strip() if len(starts) > 1 else ''
+
+
+class Resolver:
+    """Maps reference text to the paper_ids of the corpus it mentions."""
+
+    def __init__(self) -> None:
+        self.by_doi: Dict[str, Set[str]] = {}
+        self.by_arxiv: Dict[str, Set[str]] = {}
+        self._titles: Dict[Tuple[str, ...], List[Tuple[Tuple[str, ...], str]]] = {}
+
+    def add(self, paper_id: str, title: str, doi: str = '', hints: Iterable[str] = ()) -> None:
+        doi = _doi(doi)
+        if doi:
+            self.by_doi.setdefault(doi, set()).add(paper_id)
+        arxiv = arxiv_id([paper_id, *hints])
+        if arxiv:
+            self.by_arxiv.setdefault(arxiv, set()).add(paper_id)
+        key = normalize(title)
+        words = tuple(key.split())
+        if len(key) >= MIN_TITLE_KEY and len(words) >= TITLE_PREFIX:
+            self._titles.setdefault(words[:TITLE_PREFIX], []).append((words, paper_id))
+
+    def resolve(self, text: str) -> Set[str]:
+        """paper_ids whose DOI, arXiv id or full title occurs in ``text`` (longest title wins)."""
+        found: Set[str] = set()
+        for m in _DOI_RE.finditer(text.lower()):
+            found.update(self.by_doi.get(m.group(0).rstrip('.,;)]'), ()))
+        for m in _ARXIV_REF_RE.finditer(text):
+            found.update(self.by_arxiv.get(m.group(1), ()))
+        words = normalize(text).split()
+        titles = self._titles
+        # A title inside a longer matched one ("Attention Is All You Need" in
+        # "... In Speech Separation") is part of that reference, not another.
+        covered = 0
+        for i in range(len(words) - TITLE_PREFIX + 1):
+            cands = titles.get(tuple(words[i:i + TITLE_PREFIX]))
+            if cands:
+                hits = [(len(title), pid) for title, pid in cands if tuple(words[i:i + len(title)]) == title]
+                if hits:
+                    n = max(hits)[0]
+                    if i + n > covered:
+                        found.update(pid for k, pid in hits if k == n)
+                        covered = i + n
+        return found
+
+
+class CitationGraph:
+    """Read-only citation graph in CSR form; ``out`` edges point from citing to cited paper."""
+
+    def __init__(self, nodes: List[str], out_ptr: Sequence[int], out_idx: Sequence[int],
+                 in_ptr: Sequence[int], in_idx: Sequence[int], fingerprint: str = '') -> None:
+        self.nodes = nodes
+        self.ids = {pid: i for i, pid in enumerate(nodes)}
+        self.out_ptr, self.out_idx = out_ptr, out_idx
+        self.in_ptr, self.in_idx = in_ptr, in_idx
+        self.fingerprint = fingerprint
+        self._maps: List[mmap.mmap] = []
+
+    @classmethod
+    def from_edges(cls, nodes: List[str], edges: Iterable[Tuple[int, int]], fingerprint: str = '') -> 'CitationGraph':
+        edges = sorted(set(edges))
+        out_ptr, out_idx = _csr(len(nodes), edges)
+        in_ptr, in_idx = _csr(len(nodes), sorted((b, a) for a, b in edges))
+        return cls(nodes, out_ptr, out_idx, in_ptr, in_idx, fingerprint)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.out_idx)
+
+    def _out(self, i: int) -> Sequence[int]:
+        return self.out_idx[self.out_ptr[i]:self.out_ptr[i + 1]]
+
+    def _in(self, i: int) -> Sequence[int]:
+        return self.in_idx[self.in_ptr[i]:self.in_ptr[i + 1]]
+
+    def cites(self, paper_id: str) -> List[str]:
+        i = self.ids.get(paper_id)
+        return [] if i is None else [self.nodes[j] for j in self._out(i)]
+
+    def cited_by(self, paper_id: str) -> List[str]:
+        i = self.ids.get(paper_id)
+        return [] if i is None else [self.nodes[j] for j in self._in(i)]
+
+    def in_degree(self, paper_id: str) -> int:
+        i = self.ids.get(paper_id)
+        return 0 if i is None else self.in_ptr[i + 1] - self.in_ptr[i]
+
+    def _ranked(self, counts: Dict[int, int], k: int) -> List[Tuple[str, int]]:
+        ranked = sorted(counts.items(), key=lambda t: (-t[1], self.nodes[t[0]]))
+        return [(self.nodes[j], n) for j, n in ranked[:k]]
+
+    def co_cited(self, paper_id: str, k: int = 10) -> List[Tuple[str, int]]:
+        """Papers most often cited together with ``paper_id``, with the number of shared citing papers."""
+        i = self.ids.get(paper_id)
+        if i is None:
+            return []
+        counts: Dict[int, int] = {}
+        for c in self._in(i):
+            for j in self._out(c):
+                if j != i:
+                    counts[j] = counts.get(j, 0) + 1
+        return self._ranked(counts, k)
+
+    def coupled(self, paper_id: str, k: int = 10) -> List[Tuple[str, int]]:
+        """Papers sharing the most references with ``paper_id`` (bibliographic coupling)."""
+        i = self.ids.get(paper_id)
+        if i is None:
+            return []
+        counts: Dict[int, int] = {}
+        for r in self._out(i):
+            for j in self._in(r):
+                if j != i:
+                    counts[j] = counts.get(j, 0) + 1
+        return self._ranked(counts, k)
+
+    def neighborhood(self, paper_id: str, hops: int = 2) -> Dict[str, int]:
+        """{paper_id: distance} within ``hops`` edges in either direction, excluding ``paper_id``."""
+        i = self.ids.get(paper_id)
+        if i is None:
+            return {}
+        dist = {i: 0}
+        queue = deque([i])
+        while queue:
+            v = queue.popleft()
+            if dist[v] == hops:
+                continue
+            for w in (*self._out(v), *self._in(v)):
+                if w not in dist:
+                    dist[w] = dist[v] + 1
+                    queue.append(w)
+        return {self.nodes[j]: d for j, d in dist.items() if j != i}
+
+    def save(self, cache_dir: Path = CITATIONS_DIR) -> None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, ptr, idx in (('out', self.out_ptr, self.out_idx), ('in', self.in_ptr, self.in_idx)):
+            _write_atomic(cache_dir / f'{name}.i32', array('i', ptr).tobytes() + array('i', idx).tobytes())
+        meta = {'version': GRAPH_VERSION, 'fingerprint': self.fingerprint, 'edges': self.edge_count,
+                'nodes': self.nodes}
+        _write_atomic(cache_dir / 'graph.json', json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    @classmethod
+    def load(cls, cache_dir: Path = CITATIONS_DIR) -> Optional['CitationGraph']:
+        """The saved graph with its arrays memory-mapped, or None if missing or stale."""
+        try:
+            meta = json.loads((cache_dir / 'graph.json').read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != GRAPH_VERSION:
+            return None
+        nodes, m = meta['nodes'], meta['edges']
+        arrays: List[Sequence[int]] = []
+        maps: List[mmap.mmap] = []
+        for name in ('out', 'in'):
+            try:
+                with open(cache_dir / f'{name}.i32', 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size != 4 * (len(nodes) + 1 + m):
+                        return None
+                    if size == 0:
+                        view: Sequence[int] = array('i')
+                    else:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        maps.append(mm)
+                        view = memoryview(mm).cast('i')
+            except OSError:
+                return None
+            arrays += [view[:len(nodes) + 1], view[len(nodes) + 1:]]
+        graph = cls(nodes, *arrays, fingerprint=meta.get('fingerprint', ''))
+        graph._maps = maps
+        return graph
+
+
+def _csr(n: int, edges: List[Tuple[int, int]]) -> Tuple[array, array]:
+    """(indptr, indices) for ``edges`` sorted by source."""
+    ptr = array('i', [0]) * (n + 1)
+    for a, _ in edges:
+        ptr[a + 1] += 1
+    for i in range(n):
+        ptr[i + 1] += ptr[i]
+    return ptr, array('i', [b for _, b in edges])
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def references_text(pdf_path: Path, max_pages: int = REF_PAGES) -> str:
+    """Reference list of one PDF ('' if none was found or the file cannot be read)."""
+    from paper_notes.pdf_text import PdfDocument
+    try:
+        with PdfDocument(pdf_path) as doc:
+            return doc.references(max_pages)
+    except Exception:
+        return ''
+
+
+def _references_worker(path_str: str) -> str:
+    return references_text(Path(path_str))
+
+
+def _connect_refs(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    conn.execute('CREATE TABLE IF NOT EXISTS refs (sha256 TEXT NOT NULL, version INTEGER NOT NULL, '
+                 'text TEXT NOT NULL, PRIMARY KEY (sha256, version))')
+    return conn
+
+
+@traced('citations.references')
+def reference_texts(pdfs: Iterable[Path], *, cache_dir: Path = CITATIONS_DIR,
+                    workers: Optional[int] = None) -> Dict[Path, str]:
+    """{pdf: reference list text}; texts are cached by content hash, misses parsed in a process pool."""
+    from paper_notes.pdf_cache import CACHE_PATH, connect as connect_pdf_cache, hash_paths
+
+    paths = list(dict.fromkeys(Path(p) for p in pdfs))
+    workers = workers or os.cpu_count() or 1
+    with closing(connect_pdf_cache(CACHE_PATH)) as conn:
+        hashes = {p: sha for p, sha in hash_paths(conn, paths, min(workers, 8)).items() if isinstance(sha, str)}
+    out: Dict[Path, str] = {}
+    with closing(_connect_refs(cache_dir / REFS_CACHE_NAME)) as conn:
+        texts: Dict[str, str] = {}
+        shas = sorted(set(hashes.values()))
+        for i in range(0, len(shas), 500):
+            part = shas[i:i + 500]
+            texts.update(conn.execute(f"SELECT sha256, text FROM refs WHERE version = ? AND sha256 IN "
+                                      f"({', '.join('?' * len(part))})", [REFS_VERSION, *part]))
+        misses = {sha: p for p, sha in hashes.items() if sha not in texts}
+        count('reference_misses', len(misses))
+        if len(misses) == 1 or workers == 1:
+            fresh = {sha: references_text(p) for sha, p in misses.items()}
+        elif misses:
+            with ProcessPoolExecutor(max_workers=min(workers, len(misses))) as pool:
+                fresh = dict(zip(misses, pool.map(_references_worker, [str(p) for p in misses.values()])))
+        else:
+            fresh = {}
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO refs (sha256, version, text) VALUES (?, ?, ?)',
+                             [(sha, REFS_VERSION, text) for sha, text in fresh.items()])
+        texts.update(fresh)
+    for p, sha in hashes.items():
+        out[p] = texts.get(sha, '')
+    return out
+
+
+def _fingerprint(stats: List[Tuple[str, object, object]]) -> str:
+    h = hashlib.sha256(f'{GRAPH_VERSION}:{REFS_VERSION}'.encode())
+    for row in sorted(stats, key=lambda r: r[0]):
+        h.update(json.dumps(row, default=str).encode('utf-8'))
+    return h.hexdigest()
+
+
+@traced('citations.build')
+def build_graph(notes_dir: Optional[Path] = None, *, cache_dir: Path = CITATIONS_DIR,
+                force: bool = False) -> CitationGraph:
+    """Load the saved graph, rebuilding it first if any note or PDF changed (or ``force``)."""
+    from paper_notes.dedupe import synced_names
+    from paper_notes.filters import get_filter_index
+    from paper_notes.records import list_records
+    from paper_notes.review import NOTES_DIR, resolve_local_pdf
+
+    notes_dir = notes_dir or NOTES_DIR
+    fi = get_filter_index(notes_dir)
+    names = fi.names_of(fi.live)
+    records = list_records([notes_dir / n for n in names])
+    pdfs: Dict[str, Path] = {}
+    stats: List[Tuple[str, object, object]] = []
+    for name, rec in zip(names, records):
+        pdf = resolve_local_pdf(rec.meta)
+        st = None
+        if pdf is not None:
+            try:
+                s = pdf.stat()
+                st = (str(pdf), s.st_size, s.st_mtime_ns)
+                pdfs[rec.paper_id] = pdf
+            except OSError:
+                pass
+        stats.append((name, fi.fingerprints.get(name), st))
+    fingerprint = _fingerprint(stats)
+    if not force:
+        saved = CitationGraph.load(cache_dir)
+        if saved is not None and saved.fingerprint == fingerprint:
+            count('graph_reused')
+            return saved
+
+    resolver = Resolver()
+    synced = synced_names()
+    for rec in records:
+        hints = [Path(str(rec.get('local_hint') or '')).stem] + synced.get(rec.paper_id, [])
+        resolver.add(rec.paper_id, rec.title, str(rec.get('doi') or ''), hints)
+    texts = reference_texts(pdfs.values(), cache_dir=cache_dir)
+    nodes = sorted({rec.paper_id for rec in records if rec.paper_id})
+    ids = {pid: i for i, pid in enumerate(nodes)}
+    edges: Set[Tuple[int, int]] = set()
+    for rec in records:
+        src = ids.get(rec.paper_id)
+        if src is None:
+            continue
+        # Braces are BibTeX case protection ({M}ulti-{A}gent), not word breaks.
+        text = re.sub(r'[{}]', '', cited_bibtex(rec.bibtex))
+        pdf = pdfs.get(rec.paper_id)
+        if pdf is not None:
+            text += '\n' + texts.get(pdf, '')
+        for pid in resolver.resolve(text):
+            if pid != rec.paper_id:
+                edges.add((src, ids[pid]))
+    graph = CitationGraph.from_edges(nodes, edges, fingerprint)
+    graph.save(cache_dir)
+    count('edges', graph.edge_count)
+    return graph
+
+
+def review_sections(items: Sequence['Note'], graph: CitationGraph) -> Tuple[List['Note'], List[Tuple[str, int]]]:
+    """Order ``items`` into groups of papers linked by citations among themselves.
+
+    Returns the reordered items and [(heading, item count)] sections in that
+    order. Groups are connected components of the citation graph restricted
+    to ``items``, largest first; within a group papers run oldest first, ties
+    broken by how often the others cite them. Each group is named after its
+    most cited paper; papers with no links to the rest come last under
+    "Other papers". Returns no sections when no two items are linked.
+    """
+    pos = {it.paper_id: i for i, it in enumerate(items)}
+    parent = list(range(len(items)))
+    indeg = [0] * len(items)
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, it in enumerate(items):
+        for pid in graph.cites(it.paper_id):
+            j = pos.get(pid)
+            if j is None or j == i:
+                continue
+            indeg[j] += 1
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+    members: Dict[int, List[int]] = {}
+    for i in range(len(items)):
+        members.setdefault(find(i), []).append(i)
+    groups = [g for g in members.values() if len(g) > 1]
+    if not groups:
+        return list(items), []
+
+    def year(i: int) -> int:
+        try:
+            return int(items[i].year or 0)  # type: ignore[arg-type]
+        except (TypeError, ValueError):
+            return 0
+
+    groups.sort(key=lambda g: (-len(g), min(year(i) for i in g), g[0]))
+    ordered: List['Note'] = []
+    sections: List[Tuple[str, int]] = []
+    for g in groups:
+        g.sort(key=lambda i: (year(i), -indeg[i], i))
+        anchor = items[min(g, key=lambda i: (-indeg[i], year(i), i))]
+        sections.append((f'{anchor.title or anchor.paper_id} and related work', len(g)))
+        ordered.extend(items[i] for i in g)
+    rest = [it for it, root in zip(items, map(find, range(len(items)))) if len(members[root]) == 1]
+    if rest:
+        sections.append(('Other papers', len(rest)))
+        ordered.extend(rest)
+    return ordered, sections
@@ -0,0 +1,191 @@
+"""Thematic grouping of review papers by TF-IDF similarity.
+
+Term counts come from the full-text search index (``paper_notes.search``:
+note body, title and TL;DR weighted up, tags and cached PDF text), so no note
+is re-read. Each selected paper becomes a TF-IDF row over the (at most
+``MAX_FEATURES``) most frequent terms that occur in at least two and at most
+half of the selection; rows are L2-normalized and clustered with spherical
+k-means (k-means++ seeding, fixed seed). Rows are kept as one dense float32
+matrix (n x ``MAX_FEATURES`` at most, 80 MB for 10k papers), so every
+similarity and centroid update is a single matrix product.
+
+Sections are named after the tag most of their papers share (tags on more
+than half of the whole review are ignored) plus the heaviest centroid terms.
+NumPy is required.
+"""
+
+import math
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from paper_notes.trace import count, traced
+
+if TYPE_CHECKING:
+    from paper_notes.records import Note
+    from paper_notes.search import SearchIndex
+
+MIN_ITEMS = 6
+MAX_GROUPS = 20
+MAX_FEATURES = 2048
+MAX_DF = 0.5
+MAX_ITER = 50
+# Stop once fewer than this share of papers change cluster in an iteration.
+TOL = 0.001
+# Squared cosine distance below which two rows count as the same direction.
+SAME_DIRECTION = 1e-6
+HEADING_TERMS = 3
+TAG_SHARE = 0.5
+
+
+def _numpy():
+    try:
+        import numpy as np  # type: ignore
+        return np
+    except ImportError:
+        raise RuntimeError('Grouping a review by topics needs NumPy (pip install numpy)') from None
+
+
+@traced('clusters.tfidf')
+def tfidf_matrix(items: Sequence['Note'], index: 'SearchIndex'):
+    """(rows, terms): L2-normalized TF-IDF rows for ``items`` (zero rows for notes missing from ``index``)."""
+    np = _numpy()
+    docs = [index.ids.get(Path(it.path).name) for it in items]
+    df: Counter = Counter()
+    for doc in docs:
+        if doc is not None:
+            df.update(index.doc_terms.get(doc, ()))
+    n = len(items)
+    eligible = [(d, t) for t, d in df.items() if 2 <= d <= max(2, MAX_DF * n)]
+    terms = sorted(t for _, t in sorted(eligible, key=lambda e: (-e[0], e[1]))[:MAX_FEATURES])
+    ids = {t: i for i, t in enumerate(terms)}
+    postings, doc_terms = index.postings, index.doc_terms
+    entries = [(r, t, postings[term][doc]) for r, doc in enumerate(docs) if doc is not None
+               for term in doc_terms.get(doc, ()) if (t := ids.get(term)) is not None]
+    triples = np.array(entries, dtype=np.int64).reshape(-1, 3)
+    idf = np.log((1 + n) / (1 + np.array([df[t] for t in terms], dtype=np.float32))) + 1
+    x = np.zeros((n, len(terms)), dtype=np.float32)
+    x[triples[:, 0], triples[:, 1]] = (1 + np.log(triples[:, 2].astype(np.float32))) * idf[triples[:, 1]]
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    np.divide(x, norms, out=x, where=norms > 0)
+    count('terms', len(terms))
+    return x, terms
+
+
+def _centroids(np, x, labels, k: int):
+    """Unit-length mean direction of each label's rows (zero for empty clusters); label -1 is ignored."""
+    onehot = (labels[:, None] == np.arange(k)).astype(np.float32)
+    cent = onehot.T @ x
+    norms = np.linalg.norm(cent, axis=1, keepdims=True)
+    return np.divide(cent, norms, out=np.zeros_like(cent), where=norms > 0)
+
+
+@traced('clusters.kmeans')
+def spherical_kmeans(x, k: int, seed: int = 0, max_iter: int = MAX_ITER):
+    """Cluster the non-zero rows of ``x`` into ``k`` groups; returns (labels, centroids, similarities).
+
+    Zero rows get label -1. A cluster that runs empty takes the paper that
+    fits its current cluster worst (from clusters with more than one paper).
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    live = np.flatnonzero(x.any(axis=1))
+    labels = np.full(n, -1, dtype=np.int64)
+    sims = np.zeros(n, dtype=np.float32)
+    if not len(live):
+        return labels, np.zeros((0, x.shape[1]), dtype=np.float32), sims
+    xl = x[live]
+    k = min(k, len(live))
+    # k-means++ seeding: each next seed is drawn with probability proportional to its squared distance
+    chosen = [int(rng.integers(len(live)))]
+    best = np.zeros(len(live), dtype=np.float32)
+    for _ in range(1, k):
+        best = np.maximum(best, xl @ xl[chosen[-1]])
+        dist = np.clip(1 - best, 0, None) ** 2
+        dist[dist < SAME_DIRECTION] = 0  # float32 rounding: do not seed a copy of an existing seed
+        total = float(dist.sum())
+        if total <= 0:
+            break
+        chosen.append(int(rng.choice(len(live), p=dist / total)))
+    cent = xl[chosen]
+    current = np.full(len(live), -1, dtype=np.int64)
+    for it in range(max_iter):
+        scores = xl @ cent.T
+        new = scores.argmax(axis=1)
+        sims[live] = scores[np.arange(len(live)), new]
+        sizes = np.bincount(new, minlength=len(cent))
+        for c in np.flatnonzero(sizes == 0):
+            movable = np.flatnonzero(sizes[new] > 1)
+            if not len(movable):
+                break
+            worst = movable[np.argmin(sims[live][movable])]
+            sizes[new[worst]] -= 1
+            new[worst], sizes[c] = c, 1
+        moved = np.count_nonzero(new != current)
+        current = new
+        cent = _centroids(np, xl, current, len(cent))
+        if moved <= TOL * len(live):
+            break
+    count('kmeans_iterations', it + 1)
+    labels[live] = current
+    return labels, cent, sims
+
+
+def _tag_counts(items: Sequence['Note']) -> Counter:
+    return Counter(t for it in items for t in dict.fromkeys(it.tags))
+
+
+def _heading(members: Sequence['Note'], centroid, terms: List[str], common: set, np) -> str:
+    """Dominant tag (ignoring ``common`` tags shared by most of the review) plus top centroid terms."""
+    tag = ''
+    for top, n in _tag_counts(members).most_common():
+        if top not in common:
+            if n >= TAG_SHARE * len(members):
+                tag = top
+            break
+    tag_words = set(tag.lower().replace('-', ' ').split())
+    words = [terms[i] for i in np.argsort(-centroid)[:HEADING_TERMS + len(tag_words)]
+             if centroid[i] > 0 and terms[i] not in tag_words][:HEADING_TERMS]
+    if tag and words:
+        return f"{tag}: {', '.join(words)}"
+    return tag or ', '.join(words) or 'Papers'
+
+
+def topic_sections(items: Sequence['Note'], index: Optional['SearchIndex'] = None,
+                   n_groups: Optional[int] = None, seed: int = 0) -> Tuple[List['Note'], List[Tuple[str, int]]]:
+    """Group ``items`` into thematic sections; same contract as ``citations.review_sections``.
+
+    ``n_groups`` defaults to about sqrt(n / 2), capped at ``MAX_GROUPS``.
+    Larger groups come first and papers closest to their group's centroid
+    lead it; papers without indexed text end up under "Other papers".
+    Returns no sections for fewer than ``MIN_ITEMS`` papers or when fewer
+    than two groups form (e.g. no term is shared by enough of the papers).
+    """
+    if len(items) < MIN_ITEMS:
+        return list(items), []
+    np = _numpy()
+    if index is None:
+        from paper_notes.search import get_search_index
+        index = get_search_index()
+    x, terms = tfidf_matrix(items, index)
+    k = n_groups or max(2, min(MAX_GROUPS, round(math.sqrt(len(items) / 2))))
+    labels, cent, sims = spherical_kmeans(x, k, seed)
+    groups: Dict[int, List[int]] = {}
+    for i, label in enumerate(labels.tolist()):
+        groups.setdefault(label, []).append(i)
+    rest = groups.pop(-1, [])
+    if len(groups) < 2:
+        return list(items), []
+    common = {t for t, c in _tag_counts(items).items() if c > MAX_DF * len(items)}
+    ordered: List['Note'] = []
+    sections: List[Tuple[str, int]] = []
+    for label, g in sorted(groups.items(), key=lambda t: (-len(t[1]), t[1][0])):
+        g.sort(key=lambda i: (-float(sims[i]), i))
+        members = [items[i] for i in g]
+        sections.append((_heading(members, cent[label], terms, common, np), len(g)))
+        ordered.extend(members)
+    if rest:
+        sections.append(('Other papers', len(rest)))
+        ordered.extend(items[i] for i in rest)
+    return ordered, sections
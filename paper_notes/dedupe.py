@@ -0,0 +1,349 @@
+"""Near-duplicate paper detection with MinHash + LSH.
+
+Each paper is reduced to character 5-gram shingles of its title and first
+PDF page (from the PDF extraction cache) and a 128-value MinHash signature.
+Signatures are split into 32 bands of 4 rows; papers sharing any band bucket
+are candidates, so a lookup only touches a few buckets instead of the whole
+corpus. Candidates are kept when the estimated Jaccard similarity reaches the
+threshold. Exact keys (DOI, arXiv id without its version suffix,
+``2306.08302v1`` vs ``v3``, and the normalized title) accept a match at the
+lower ``EXACT_THRESHOLD``; on their own, when one copy has no text to
+compare, they are reported but never used for automatic linking.
+
+Signatures are cached in ``data/cache/minhash.sqlite`` by the hash of the
+shingled text. NumPy is used when available; the pure-Python fallback yields
+identical signatures.
+"""
+
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import unicodedata
+from array import array
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from paper_notes.trace import count, traced
+
+SIGNATURE_CACHE_PATH = Path('data') / 'cache' / 'minhash.sqlite'
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+MAX_TEXT = 4000
+THRESHOLD = 0.5
+MIN_TITLE_KEY = 20
+# An exact key (DOI, arXiv id, title) only counts when the MinHash estimate
+# agrees this far, if both papers have a signature.
+EXACT_THRESHOLD = 0.2
+# Bump when shingling or hashing changes; cached signatures are keyed by it.
+SIGNATURE_VERSION = 1
+
+_BASE = 1_000_003
+_MASK64 = (1 << 64) - 1
+# New-style arXiv ids are YYMM.NNNN (2007-2014) or YYMM.NNNNN (2015-). In names
+# the separator must be '.', unless the id follows 'arxiv'/'abs' or is the whole
+# name (``unknown-2306-08302v3``, the paper_id inferred from ``2306.08302v3.pdf``),
+# so year ranges such as ``survey-2020-2023`` are not mistaken for ids.
+_YYMM = r'(\d{2}(?:0[1-9]|1[0-2]))'
+_ARXIV_NAME_RES = (
+    re.compile(rf'(?<![\d.]){_YYMM}\.(\d{{4,5}})(?:v\d+)?(?!\.?\d)'),
+    re.compile(rf'(?:arxiv|abs)[-_.:/ ]*{_YYMM}[-_.](\d{{4,5}})(?:v\d+)?(?!\d)', re.IGNORECASE),
+    re.compile(rf'^(?:unknown-)?{_YYMM}-(\d{{4,5}})(?:v\d+)?$'),
+)
+_ARXIV_TEXT_RE = re.compile(rf'arxiv:\s*{_YYMM}\.(\d{{4,5}})', re.IGNORECASE)
+
+Signature = Tuple[int, ...]
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).lower()
+    return re.sub(r'[\W_]+', ' ', text).strip()
+
+
+def _numpy():
+    try:
+        import numpy as np  # type: ignore
+        return np
+    except ImportError:
+        return None
+
+
+def shingle_hashes(text: str, k: int = SHINGLE) -> List[int]:
+    """Distinct 64-bit polynomial hashes of the character ``k``-grams of normalized ``text``."""
+    text = normalize(text)
+    if not text:
+        return []
+    k = min(k, len(text))
+    n = len(text) - k + 1
+    np = _numpy()
+    if np is not None:
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        h = np.zeros(n, dtype=np.uint64)
+        for i in range(k):
+            h *= np.uint64(_BASE)
+            h += codes[i:i + n]
+        return np.unique(h).tolist()
+    out = set()
+    for i in range(n):
+        h = 0
+        for c in text[i:i + k]:
+            h = (h * _BASE + ord(c)) & _MASK64
+        out.add(h)
+    return sorted(out)
+
+
+def _arxiv_match(m: Optional['re.Match[str]']) -> str:
+    """``YYMM.NNNNN`` for a match whose number has the length used in that month, else ''."""
+    if m is None:
+        return ''
+    yymm, num = m.group(1), m.group(2)
+    return f'{yymm}.{num}' if len(num) == (4 if yymm < '1501' else 5) and yymm >= '0704' else ''
+
+
+def arxiv_id(names: Iterable[str], text: str = '') -> str:
+    """arXiv id without version from paper_ids/file names (``2306.08302v3``, ``arxiv-2306-08302``) or an ``arXiv:`` stamp."""
+    for name in names:
+        for regex in _ARXIV_NAME_RES:
+            for m in regex.finditer(name):
+                found = _arxiv_match(m)
+                if found:
+                    return found
+    for m in _ARXIV_TEXT_RE.finditer(text):
+        found = _arxiv_match(m)
+        if found:
+            return found
+    return ''
+
+
+class MinHasher:
+    """``num_perm`` multiply-add-shift hashes ((a*x + b) mod 2**64) >> 32 with odd ``a``."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1) -> None:
+        rnd = random.Random(seed)
+        self.a = [rnd.getrandbits(64) | 1 for _ in range(num_perm)]
+        self.b = [rnd.getrandbits(64) for _ in range(num_perm)]
+        self._np = _numpy()
+        if self._np is not None:
+            self._a = self._np.array(self.a, dtype=self._np.uint64)[:, None]
+            self._b = self._np.array(self.b, dtype=self._np.uint64)[:, None]
+
+    def signature(self, hashes: List[int]) -> Signature:
+        if self._np is not None:
+            np = self._np
+            # uint64 arithmetic wraps, exactly like the masked pure-Python version below
+            phv = np.array(hashes, dtype=np.uint64)[None, :] * self._a
+            phv += self._b
+            phv >>= np.uint64(32)
+            return tuple(phv.min(axis=1).tolist())
+        return tuple(min(((a * x + b) & _MASK64) >> 32 for x in hashes) for a, b in zip(self.a, self.b))
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class SignatureCache:
+    def __init__(self, path: Path = SIGNATURE_CACHE_PATH) -> None:
+        self.path = Path(path)
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute('CREATE TABLE IF NOT EXISTS signatures (key TEXT PRIMARY KEY, sig BLOB NOT NULL)')
+        return conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, Signature]:
+        out: Dict[str, Signature] = {}
+        with closing(self.connect()) as conn:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                for key, blob in conn.execute(
+                        f"SELECT key, sig FROM signatures WHERE key IN ({', '.join('?' * len(part))})", part):
+                    out[key] = tuple(array('I', blob))
+        return out
+
+    def put_many(self, sigs: Dict[str, Signature]) -> None:
+        if not sigs:
+            return
+        with closing(self.connect()) as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO signatures (key, sig) VALUES (?, ?)',
+                             [(k, array('I', v).tobytes()) for k, v in sigs.items()])
+
+
+class Paper:
+    """What the index knows about one paper."""
+
+    __slots__ = ('paper_id', 'title_key', 'doi', 'arxiv', 'sig')
+
+    def __init__(self, paper_id: str, title_key: str, doi: str, arxiv: str, sig: Optional[Signature]) -> None:
+        self.paper_id = paper_id
+        self.title_key = title_key
+        self.doi = doi
+        self.arxiv = arxiv
+        self.sig = sig
+
+
+def _doc_text(title: str, first_page: str) -> str:
+    return f'{title}\n{first_page[:MAX_TEXT]}'
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(f'{SIGNATURE_VERSION}:{NUM_PERM}:{SHINGLE}:{text}'.encode('utf-8')).hexdigest()
+
+
+class DuplicateIndex:
+    """LSH buckets plus exact-key maps over papers; ``query`` returns ranked matches."""
+
+    def __init__(self, hasher: Optional[MinHasher] = None, bands: int = BANDS) -> None:
+        self.hasher = hasher or MinHasher()
+        self.bands = bands
+        self.rows = len(self.hasher.a) // bands
+        self.papers: Dict[str, Paper] = {}
+        self._buckets: List[Dict[Signature, List[str]]] = [{} for _ in range(bands)]
+        self._exact: Dict[Tuple[str, str], List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.papers)
+
+    def features(self, paper_id: str, title: str, first_page: str = '', doi: str = '', hints: Iterable[str] = (),
+                 sig: Optional[Signature] = None) -> Paper:
+        title_key = normalize(title)
+        if sig is None:
+            hashes = shingle_hashes(_doc_text(title, first_page))
+            sig = self.hasher.signature(hashes) if hashes else None
+        return Paper(paper_id, title_key if len(title_key) >= MIN_TITLE_KEY else '', doi.strip().lower(),
+                     arxiv_id([paper_id, *hints], first_page[:MAX_TEXT]), sig)
+
+    def _keys(self, paper: Paper) -> List[Tuple[str, str]]:
+        return [(kind, val) for kind, val in (('doi', paper.doi), ('arxiv', paper.arxiv), ('title', paper.title_key))
+                if val]
+
+    def _bands(self, sig: Signature) -> Iterable[Tuple[int, Signature]]:
+        for i in range(self.bands):
+            yield i, sig[i * self.rows:(i + 1) * self.rows]
+
+    def add(self, paper: Paper) -> None:
+        self.papers[paper.paper_id] = paper
+        for key in self._keys(paper):
+            self._exact.setdefault(key, []).append(paper.paper_id)
+        if paper.sig is not None:
+            for i, band in self._bands(paper.sig):
+                self._buckets[i].setdefault(band, []).append(paper.paper_id)
+
+    def query(self, paper: Paper, threshold: float = THRESHOLD, strict: bool = False) -> List[Tuple[str, float, str]]:
+        """[(paper_id, score, reason)] of indexed papers that look like ``paper``, best first.
+
+        An exact-key hit is checked against the MinHash estimate when both
+        papers have a signature (kept at ``EXACT_THRESHOLD``, scored by the
+        estimate); without one it scores 1.0, unless ``strict`` drops it, as
+        callers that link papers automatically should.
+        """
+        found: Dict[str, Tuple[float, str]] = {}
+        for kind, val in self._keys(paper):
+            for pid in self._exact.get((kind, val), ()):
+                if pid == paper.paper_id or pid in found:
+                    continue
+                other = self.papers[pid].sig
+                if paper.sig is not None and other is not None:
+                    score = similarity(paper.sig, other)
+                    if score >= min(threshold, EXACT_THRESHOLD):
+                        found[pid] = (score, kind)
+                elif not strict:
+                    found[pid] = (1.0, kind)
+        if paper.sig is not None:
+            candidates: Set[str] = set()
+            for i, band in self._bands(paper.sig):
+                candidates.update(self._buckets[i].get(band, ()))
+            count('lsh_candidates', len(candidates))
+            for pid in candidates:
+                other = self.papers[pid].sig
+                if pid == paper.paper_id or pid in found or other is None:
+                    continue
+                score = similarity(paper.sig, other)
+                if score >= threshold:
+                    found[pid] = (score, 'minhash')
+        return sorted(((pid, s, r) for pid, (s, r) in found.items()), key=lambda t: (-t[1], t[0]))
+
+    def groups(self, threshold: float = THRESHOLD) -> List[List[Tuple[str, float, str]]]:
+        """Connected groups of likely duplicates over the whole index (each pair checked via ``query``)."""
+        parent = {pid: pid for pid in self.papers}
+
+        def find(x: str) -> str:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        best: Dict[str, Tuple[float, str]] = {}
+        for pid, paper in self.papers.items():
+            for other, score, reason in self.query(paper, threshold):
+                ra, rb = find(pid), find(other)
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+                for p in (pid, other):
+                    if score > best.get(p, (-1.0, ''))[0]:
+                        best[p] = (score, reason)
+        members: Dict[str, List[str]] = {}
+        for pid in best:
+            members.setdefault(find(pid), []).append(pid)
+        return [[(pid, *best[pid]) for pid in sorted(group)] for _, group in sorted(members.items()) if len(group) > 1]
+
+
+def synced_names(root: Optional[str] = None) -> Dict[str, List[str]]:
+    """{paper_id: [file stem, ...]} of every PDF ``paper_sync`` registered under ``root`` (default ``ONEDRIVE_PAPERS_ROOT``)."""
+    from scripts.paper_sync import load_journal
+
+    out: Dict[str, List[str]] = {}
+    root = root if root is not None else os.getenv('ONEDRIVE_PAPERS_ROOT', '')
+    if root and os.path.isdir(root):
+        for rel, info in load_journal(root)['files'].items():
+            out.setdefault(info.get('paper_id', ''), []).append(Path(rel).stem)
+    return out
+
+
+@traced('dedupe.build_index')
+def build_index(notes_dir: Optional[Path] = None, cache_path: Path = SIGNATURE_CACHE_PATH) -> DuplicateIndex:
+    """Index every note: title and DOI from the notes index, first page from the PDF cache.
+
+    File names of every PDF ``paper_sync`` recorded for a paper (including
+    other versions) are used as arXiv id hints.
+    """
+    from paper_notes.filters import get_filter_index
+    from paper_notes.pdf_cache import CACHE_PATH, connect as connect_pdf_cache, lookup_cached
+    from paper_notes.records import list_records
+    from paper_notes.review import NOTES_DIR, resolve_local_pdf
+
+    notes_dir = notes_dir or NOTES_DIR
+    fi = get_filter_index(notes_dir)
+    records = list_records([notes_dir / n for n in fi.names_of(fi.live)])
+    synced = synced_names()
+    docs: List[Tuple[object, str, List[str]]] = []
+    with closing(connect_pdf_cache(CACHE_PATH)) as conn:
+        for rec in records:
+            pdf = resolve_local_pdf(rec.meta)
+            cached = lookup_cached(pdf, conn=conn) if pdf else None
+            first_page = cached['first_page'] if cached else ''
+            hints = [Path(str(rec.get('local_hint') or '')).stem] + synced.get(rec.paper_id, [])
+            docs.append((rec, first_page, hints))
+
+    index = DuplicateIndex()
+    cache = SignatureCache(cache_path)
+    keys = [_text_key(_doc_text(rec.title, fp)) for rec, fp, _ in docs]  # type: ignore[attr-defined]
+    sigs = cache.get_many(keys)
+    fresh: Dict[str, Signature] = {}
+    for (rec, first_page, hints), key in zip(docs, keys):
+        sig = sigs.get(key) or fresh.get(key)
+        paper = index.features(rec.paper_id, rec.title, first_page, str(rec.get('doi') or ''), hints,  # type: ignore[attr-defined]
+                               sig=sig)
+        if sig is None and paper.sig is not None:
+            fresh[key] = paper.sig
+        index.add(paper)
+    cache.put_many(fresh)
+    count('papers', len(docs))
+    count('signatures_computed', len(fresh))
+    return index
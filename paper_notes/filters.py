@@ -0,0 +1,329 @@
+"""In-memory inverted index for note filtering.
+
+Every indexed note gets a small integer doc id; each (field, value) pair maps
+to a posting list stored as a Python int bitmap, so AND/OR/NOT are single
+big-int operations regardless of corpus size. The index is built once from
+the on-disk metadata index (``paper_notes.index``) and patched incrementally
+with the notes whose fingerprint changed since the last build.
+
+Tag expressions accept ``AND``/``OR``/``NOT`` (or ``&``/``|``/``!``),
+parentheses and implicit AND between adjacent terms. A bare term matches
+``tags``; ``field:value`` targets another field, e.g.
+``multi-agent AND (safety OR methods:debate) AND NOT venue:arxiv`` or
+``year:2020..2024``.
+"""
+
+import re
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from paper_notes.index import INDEX_PATH, connect, fingerprints, generation, iter_metadata, load_metadata, refresh_index
+from paper_notes.review import NOTES_DIR
+
+FIELDS = ('tags', 'pestle', 'methods', 'datasets', 'venue', 'year', 'paper_id')
+
+YearRange = Tuple[Optional[int], Optional[int]]
+
+
+def _values(meta: Dict[str, object], field: str) -> List[str]:
+    v = meta.get(field)
+    if v is None or v == '':
+        return []
+    if isinstance(v, (list, tuple)):
+        return [str(x).strip() for x in v if str(x).strip()]
+    return [str(v).strip()]
+
+
+def parse_year_range(text: str) -> Optional[YearRange]:
+    """Parse ``2025``, ``2020-2024``, ``2020..2024``, ``2020..`` or ``..2024``."""
+    text = (text or '').strip()
+    if not text:
+        return None
+    m = re.fullmatch(r'(\d{4})?\s*(?:\.\.|-|:)\s*(\d{4})?', text)
+    if m and (m.group(1) or m.group(2)):
+        lo = int(m.group(1)) if m.group(1) else None
+        hi = int(m.group(2)) if m.group(2) else None
+        return lo, hi
+    if re.fullmatch(r'\d{4}', text):
+        return int(text), int(text)
+    raise ValueError(f'Invalid year range: {text!r}')
+
+
+class NoteFilterIndex:
+    def __init__(self) -> None:
+        self.names: List[Optional[str]] = []
+        self.doc_ids: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.postings: Dict[str, Dict[str, int]] = {f: {} for f in FIELDS}
+        self.display: Dict[str, Dict[str, str]] = {f: {} for f in FIELDS}
+        self.years: Dict[int, int] = {}
+        self.doc_terms: Dict[int, List[Tuple[str, str]]] = {}
+        self.doc_year: Dict[int, int] = {}
+        self.live = 0
+        self.generation = -1
+        self.fingerprints: Dict[str, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def copy(self) -> 'NoteFilterIndex':
+        """Independent copy to patch while readers keep using this one (posting ints are immutable)."""
+        new = NoteFilterIndex()
+        new.names = list(self.names)
+        new.doc_ids = dict(self.doc_ids)
+        new.free = list(self.free)
+        new.postings = {f: dict(p) for f, p in self.postings.items()}
+        new.display = {f: dict(d) for f, d in self.display.items()}
+        new.years = dict(self.years)
+        new.doc_terms = dict(self.doc_terms)
+        new.doc_year = dict(self.doc_year)
+        new.live = self.live
+        new.generation = self.generation
+        new.fingerprints = dict(self.fingerprints)
+        return new
+
+    # -- maintenance -------------------------------------------------------
+
+    def add(self, name: str, meta: Dict[str, object]) -> None:
+        if name in self.doc_ids:
+            self.remove(name)
+        if self.free:
+            doc = self.free.pop()
+            self.names[doc] = name
+        else:
+            doc = len(self.names)
+            self.names.append(name)
+        self.doc_ids[name] = doc
+        bit = 1 << doc
+        terms: List[Tuple[str, str]] = []
+        for field in FIELDS:
+            if field == 'year':
+                continue
+            for v in _values(meta, field):
+                key = v.lower()
+                post = self.postings[field]
+                post[key] = post.get(key, 0) | bit
+                self.display[field].setdefault(key, v)
+                terms.append((field, key))
+        self.doc_terms[doc] = terms
+        try:
+            year = int(meta.get('year', 0) or 0)
+        except (TypeError, ValueError):
+            year = 0
+        if year:
+            self.years[year] = self.years.get(year, 0) | bit
+            self.doc_year[doc] = year
+        self.live |= bit
+
+    def remove(self, name: str) -> None:
+        doc = self.doc_ids.pop(name, None)
+        if doc is None:
+            return
+        mask = ~(1 << doc)
+        for field, key in self.doc_terms.pop(doc, []):
+            post = self.postings[field]
+            bits = post.get(key, 0) & mask
+            if bits:
+                post[key] = bits
+            else:
+                post.pop(key, None)
+                self.display[field].pop(key, None)
+        year = self.doc_year.pop(doc, 0)
+        if year:
+            bits = self.years.get(year, 0) & mask
+            if bits:
+                self.years[year] = bits
+            else:
+                self.years.pop(year, None)
+        self.live &= mask
+        self.names[doc] = None
+        self.free.append(doc)
+
+    # -- queries -----------------------------------------------------------
+
+    def term(self, field: str, value: str) -> int:
+        if field == 'year':
+            rng = parse_year_range(value)
+            return self.year_range(rng) if rng else 0
+        if field not in self.postings:
+            raise ValueError(f'Unknown field: {field!r}')
+        return self.postings[field].get(value.lower(), 0)
+
+    def any_of(self, field: str, values: Iterable[str]) -> int:
+        bits = 0
+        for v in values:
+            bits |= self.term(field, v)
+        return bits
+
+    def year_range(self, rng: Optional[YearRange]) -> int:
+        if not rng:
+            return self.live
+        lo, hi = rng
+        bits = 0
+        for y, b in self.years.items():
+            if (lo is None or y >= lo) and (hi is None or y <= hi):
+                bits |= b
+        return bits
+
+    def evaluate(self, expr: str) -> int:
+        expr = (expr or '').strip()
+        if not expr:
+            return self.live
+        return _ExprParser(self, expr).parse()
+
+    def names_of(self, bits: int) -> List[str]:
+        bits &= self.live
+        out: List[str] = []
+        s = bin(bits)[:1:-1]
+        i = s.find('1')
+        while i != -1:
+            out.append(self.names[i])  # type: ignore[arg-type]
+            i = s.find('1', i + 1)
+        return sorted(out)
+
+    def count(self, bits: int) -> int:
+        return (bits & self.live).bit_count()
+
+    def values(self, field: str) -> List[str]:
+        return sorted(self.display[field].values(), key=str.lower)
+
+    def all_years(self) -> List[int]:
+        return sorted(self.years)
+
+    def select(self, filter_tags: List[str], year: Optional[int], papers: List[str],
+               tag_expr: str = '', year_range: Optional[YearRange] = None) -> List[str]:
+        bits = self.live
+        if papers:
+            bits &= self.any_of('paper_id', papers)
+        if year:
+            bits &= self.years.get(int(year), 0)
+        if year_range:
+            bits &= self.year_range(year_range)
+        if filter_tags:
+            bits &= self.any_of('tags', filter_tags)
+        if tag_expr:
+            bits &= self.evaluate(tag_expr)
+        return self.names_of(bits)
+
+
+_TOKEN_RE = re.compile(r'\s*(?:(\()|(\))|(&&?|\|\|?|!)|"([^"]*)"|([^\s()&|!"]+))')
+
+
+class _ExprParser:
+    """Recursive-descent parser: or := and (OR and)*; and := not (AND? not)*."""
+
+    def __init__(self, index: NoteFilterIndex, text: str) -> None:
+        self.index = index
+        self.tokens: List[Tuple[str, str]] = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            m = _TOKEN_RE.match(text, pos)
+            if not m or m.end() == pos:
+                raise ValueError(f'Invalid tag expression near: {text[pos:]!r}')
+            pos = m.end()
+            lpar, rpar, op, quoted, word = m.groups()
+            if lpar:
+                self.tokens.append(('(', lpar))
+            elif rpar:
+                self.tokens.append((')', rpar))
+            elif op:
+                self.tokens.append(('op', {'&': 'AND', '&&': 'AND', '|': 'OR', '||': 'OR', '!': 'NOT'}[op]))
+            elif quoted is not None:
+                self.tokens.append(('term', quoted))
+            elif word.upper() in {'AND', 'OR', 'NOT'}:
+                self.tokens.append(('op', word.upper()))
+            else:
+                self.tokens.append(('term', word))
+        self.i = 0
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.i] if self.i < len(self.tokens) else ('eof', '')
+
+    def take(self) -> Tuple[str, str]:
+        tok = self.peek()
+        self.i += 1
+        return tok
+
+    def parse(self) -> int:
+        bits = self.parse_or()
+        if self.peek()[0] != 'eof':
+            raise ValueError(f'Unexpected token in tag expression: {self.peek()[1]!r}')
+        return bits
+
+    def parse_or(self) -> int:
+        bits = self.parse_and()
+        while self.peek() == ('op', 'OR'):
+            self.take()
+            bits |= self.parse_and()
+        return bits
+
+    def parse_and(self) -> int:
+        bits = self.parse_not()
+        while True:
+            kind, val = self.peek()
+            if (kind, val) == ('op', 'AND'):
+                self.take()
+            elif not (kind in {'term', '('} or (kind, val) == ('op', 'NOT')):
+                return bits
+            bits &= self.parse_not()
+
+    def parse_not(self) -> int:
+        if self.peek() == ('op', 'NOT'):
+            self.take()
+            return self.index.live & ~self.parse_not()
+        return self.parse_atom()
+
+    def parse_atom(self) -> int:
+        kind, val = self.take()
+        if kind == '(':
+            bits = self.parse_or()
+            if self.take()[0] != ')':
+                raise ValueError('Unbalanced parentheses in tag expression')
+            return bits
+        if kind != 'term':
+            raise ValueError(f'Expected a tag in tag expression, got {val!r}')
+        field, sep, value = val.partition(':')
+        if sep and field.lower() in FIELDS:
+            return self.index.term(field.lower(), value)
+        return self.index.term('tags', val)
+
+
+_CACHE: Dict[Tuple[str, str], NoteFilterIndex] = {}
+_LOCK = threading.Lock()
+
+
+def get_filter_index(notes_dir: Path = NOTES_DIR, db_path: Path = INDEX_PATH) -> NoteFilterIndex:
+    """Return the process-wide filter index for ``notes_dir``, patched with changed notes.
+
+    A returned index is never modified afterwards: changes are applied to a
+    copy that replaces the cached one, so callers in other threads can keep
+    reading theirs without the lock.
+    """
+    key = (str(notes_dir), str(db_path))
+    with _LOCK, closing(connect(db_path)) as conn:
+        refresh_index(conn, notes_dir)
+        gen = generation(conn)
+        index = _CACHE.get(key)
+        if index is not None and index.generation == gen:
+            return index
+        current = fingerprints(conn)
+        if index is None:
+            index = NoteFilterIndex()
+            for name, meta in iter_metadata(conn):
+                index.add(name, meta)
+        else:
+            index = index.copy()
+            for name in [n for n in index.fingerprints if n not in current]:
+                index.remove(name)
+            for name, fp in current.items():
+                if index.fingerprints.get(name) != fp:
+                    meta = load_metadata(conn, name)
+                    if meta is not None:
+                        index.add(name, meta)
+        index.fingerprints = current
+        index.generation = gen
+        _CACHE[key] = index
+        return index
@@ -0,0 +1,81 @@
+"""Per-paper fragment cache for incremental review regeneration.
+
+Each paper's overview row, section body and BibTeX are stored in
+``data/cache/review_fragments.sqlite`` under a key hashing the note's bytes,
+the render options and ``RENDER_VERSION``. Sections that embed an abstract
+also record the abstract's hash, so a changed PDF re-renders only that
+paper. The section number is not part of a fragment; it is prefixed when the
+review is reassembled.
+"""
+
+import hashlib
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FRAGMENT_CACHE_PATH = Path('data') / 'cache' / 'review_fragments.sqlite'
+# Bump when the markdown produced by paper_notes.review changes.
+RENDER_VERSION = 1
+
+Fragment = Tuple[str, str, str, str]  # (overview row, section body, bibtex, abstract sha)
+
+
+def text_sha(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def fragment_key(note_path: Path, include_abstract: bool, local_pdf: Optional[Path]) -> str:
+    h = hashlib.sha256()
+    h.update(Path(note_path).read_bytes())
+    h.update(f'\0{note_path}\0{int(include_abstract)}\0{local_pdf or ""}\0{RENDER_VERSION}'.encode('utf-8'))
+    return h.hexdigest()
+
+
+class FragmentCache:
+    def __init__(self, path: Path = FRAGMENT_CACHE_PATH) -> None:
+        self.path = Path(path)
+        self.reused = 0
+        self.rendered = 0
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS fragments (key TEXT PRIMARY KEY, row TEXT NOT NULL, section TEXT NOT NULL, '
+            'bibtex TEXT NOT NULL, abstract_sha TEXT NOT NULL)'
+        )
+        return conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Fragment]:
+        keys = list(keys)
+        out: Dict[str, Fragment] = {}
+        with closing(self.connect()) as conn:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT key, row, section, bibtex, abstract_sha FROM fragments WHERE key IN ({', '.join('?' * len(part))})",
+                    part,
+                )
+                for key, row, section, bibtex, abstract_sha in rows:
+                    out[key] = (row, section, bibtex, abstract_sha)
+        return out
+
+    def put_many(self, fragments: Dict[str, Fragment]) -> None:
+        if not fragments:
+            return
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO fragments (key, row, section, bibtex, abstract_sha) VALUES (?, ?, ?, ?, ?)',
+                [(k,) + tuple(v) for k, v in fragments.items()],
+            )
+
+    def summary(self) -> str:
+        total = self.reused + self.rendered
+        return f'{self.reused}/{total} fragment(s) reused, {self.rendered} re-rendered'
+
+
+def keys_for(items: List[object], include_abstract: bool) -> List[str]:
+    """Fragment keys for ``Note`` records, in order."""
+    from paper_notes.review import resolve_local_pdf
+    return [fragment_key(Path(it.path), include_abstract, resolve_local_pdf(it.meta)) for it in items]  # type: ignore[attr-defined]
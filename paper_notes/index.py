@@ -0,0 +1,128 @@
+"""On-disk metadata index for notes.
+
+Front matter of every note is cached in a small SQLite database keyed by the
+note file name, together with an (mtime, size) fingerprint. ``refresh_index``
+only stats the notes directory and re-parses files whose fingerprint changed,
+so the filter index (``paper_notes.filters``) never has to open unchanged
+note files.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from paper_notes.review import NOTES_DIR, parse_front_matter, read_file
+
+INDEX_PATH = Path('data') / 'cache' / 'notes_index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    name TEXT PRIMARY KEY,
+    paper_id TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    meta TEXT NOT NULL
+);
+DROP INDEX IF EXISTS notes_paper_id;
+DROP INDEX IF EXISTS notes_year;
+DROP TABLE IF EXISTS note_tags;
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def connect(db_path: Path = INDEX_PATH) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _year_of(meta: Dict[str, object]) -> int:
+    try:
+        return int(meta.get('year', 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def scan_fingerprints(notes_dir: Path = NOTES_DIR) -> Dict[str, Tuple[int, int]]:
+    """Return {file name: (mtime_ns, size)} for every note without opening it."""
+    out: Dict[str, Tuple[int, int]] = {}
+    try:
+        it = os.scandir(notes_dir)
+    except FileNotFoundError:
+        return out
+    with it:
+        for entry in it:
+            if not entry.name.endswith('.md') or not entry.is_file():
+                continue
+            st = entry.stat()
+            out[entry.name] = (st.st_mtime_ns, st.st_size)
+    return out
+
+
+def notes_stamp(notes_dir: Path = NOTES_DIR) -> Tuple[int, int]:
+    """Cheap change stamp for ``notes_dir``: (directory mtime_ns, inode) from a single stat.
+
+    Adding, removing or renaming a note (and editors that save via rename)
+    changes it; in-place edits do not, so callers that rewrite notes must
+    invalidate explicitly.
+    """
+    try:
+        st = os.stat(notes_dir)
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_ino)
+
+
+def refresh_index(conn: sqlite3.Connection, notes_dir: Path = NOTES_DIR) -> List[str]:
+    """Bring the index in sync with ``notes_dir``.
+
+    Returns the names of notes that were (re)parsed or removed.
+    """
+    on_disk = scan_fingerprints(notes_dir)
+    indexed = fingerprints(conn)
+    changed = [name for name, fp in on_disk.items() if indexed.get(name) != fp]
+    removed = [name for name in indexed if name not in on_disk]
+    if not changed and not removed:
+        return []
+    with conn:
+        for name in removed:
+            conn.execute('DELETE FROM notes WHERE name = ?', (name,))
+        for name in changed:
+            meta, _ = parse_front_matter(read_file(notes_dir / name))
+            mtime, size = on_disk[name]
+            conn.execute(
+                'INSERT OR REPLACE INTO notes (name, paper_id, mtime_ns, size, year, meta) VALUES (?, ?, ?, ?, ?, ?)',
+                (name, str(meta.get('paper_id', '')), mtime, size, _year_of(meta), json.dumps(meta, ensure_ascii=False, default=str)),
+            )
+        conn.execute("INSERT INTO state (key, value) VALUES ('generation', 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+    return changed + removed
+
+
+def generation(conn: sqlite3.Connection) -> int:
+    """Counter bumped by every ``refresh_index`` that changed the index."""
+    row = conn.execute("SELECT value FROM state WHERE key = 'generation'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def fingerprints(conn: sqlite3.Connection) -> Dict[str, Tuple[int, int]]:
+    return {name: (mtime, size) for name, mtime, size in conn.execute('SELECT name, mtime_ns, size FROM notes')}
+
+
+def load_metadata(conn: sqlite3.Connection, name: str) -> Optional[Dict[str, object]]:
+    row = conn.execute('SELECT meta FROM notes WHERE name = ?', (name,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def iter_metadata(conn: sqlite3.Connection) -> Iterator[Tuple[str, Dict[str, object]]]:
+    """Yield (file name, front matter) for every indexed note in name order."""
+    for name, meta in conn.execute('SELECT name, meta FROM notes ORDER BY name'):
+        yield name, json.loads(meta)
+
@@ -0,0 +1,303 @@
+"""Persistent background queue for bulk PDF uploads.
+
+``submit`` streams the upload under ``data/uploads/.incoming`` while
+hashing it and records a job in ``data/cache/jobs.sqlite`` keyed by the PDF's
+SHA-256, so submitting the same file again is a no-op (or re-queues it if it
+failed). A ``JobRunner`` thread claims queued jobs in batches and, per batch,
+links PDFs whose content is already known (``pdf_index.known_pdfs``) to the
+existing paper, infers paper ids for the rest, extracts metadata with
+``pdf_cache.extract_many`` (cache misses are parsed in a process pool), links
+other versions of known papers (``dedupe``) instead of adding notes, and
+creates/updates the notes and writes the manifest once. Other versions are
+kept under ``data/uploads/versions/<paper_id>.<sha>.pdf``; an upload whose
+inferred ``<paper_id>.pdf`` already exists with other content is skipped,
+never overwritten.
+
+Every step is idempotent: a job that crashed or failed half-way can simply
+run again. Failed jobs are re-queued up to ``MAX_ATTEMPTS`` times; jobs
+left ``running`` by a dead process are re-queued when a runner starts.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from paper_notes.dedupe import build_index
+from paper_notes.pdf_index import UPLOADS_DIR, hash_stream, known_pdfs, version_path
+from paper_notes.trace import count, traced
+
+JOBS_PATH = Path('data') / 'cache' / 'jobs.sqlite'
+INCOMING_DIR = UPLOADS_DIR / '.incoming'
+MAX_ATTEMPTS = 3
+BATCH_SIZE = 32
+
+STATUSES = ('queued', 'running', 'done', 'linked', 'skipped', 'failed')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sha256 TEXT NOT NULL UNIQUE,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    paper_id TEXT NOT NULL DEFAULT '',
+    error TEXT NOT NULL DEFAULT '',
+    result TEXT NOT NULL DEFAULT '{}',
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id);
+"""
+
+
+class JobStore:
+    def __init__(self, path: Path = JOBS_PATH, incoming: Path = INCOMING_DIR) -> None:
+        self.path = Path(path)
+        self.incoming = Path(incoming)
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def staged_path(self, sha: str) -> Path:
+        return self.incoming / f'{sha}.pdf'
+
+    def submit(self, filename: str, src: BinaryIO) -> Tuple[int, bool]:
+        """Queue one uploaded PDF read from ``src``; returns (job id, whether new work was queued)."""
+        receiving = self.incoming / f'{os.getpid()}-{threading.get_ident()}.part'
+        try:
+            sha, _ = hash_stream(src, receiving)
+            now = time.time()
+            with closing(self.connect()) as conn, conn:
+                # The write lock makes concurrent submissions of the same file queue it exactly once.
+                conn.execute('BEGIN IMMEDIATE')
+                queued = conn.execute(
+                    "INSERT INTO jobs (sha256, filename, status, created, updated) VALUES (?, ?, 'queued', ?, ?) "
+                    "ON CONFLICT(sha256) DO UPDATE SET status = 'queued', attempts = 0, error = '', "
+                    "updated = excluded.updated WHERE jobs.status = 'failed'",
+                    (sha, Path(filename).name, now, now),
+                ).rowcount > 0
+                job_id = conn.execute('SELECT id FROM jobs WHERE sha256 = ?', (sha,)).fetchone()[0]
+                if queued:
+                    os.replace(receiving, self.staged_path(sha))
+            return int(job_id), queued
+        finally:
+            receiving.unlink(missing_ok=True)
+
+    def retry_failed(self) -> int:
+        with closing(self.connect()) as conn, conn:
+            return conn.execute("UPDATE jobs SET status = 'queued', attempts = 0, error = '', updated = ? "
+                                "WHERE status = 'failed'", (time.time(),)).rowcount
+
+    def requeue_running(self) -> int:
+        with closing(self.connect()) as conn, conn:
+            return conn.execute("UPDATE jobs SET status = 'queued', updated = ? WHERE status = 'running'",
+                                (time.time(),)).rowcount
+
+    def claim(self, limit: int = BATCH_SIZE) -> List[Dict[str, object]]:
+        """Mark up to ``limit`` queued jobs as running and return them, oldest first."""
+        with closing(self.connect()) as conn, conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute("SELECT id, sha256, filename, attempts FROM jobs WHERE status = 'queued' "
+                                'ORDER BY id LIMIT ?', (limit,)).fetchall()
+            conn.executemany("UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? WHERE id = ?",
+                             [(time.time(), r[0]) for r in rows])
+        return [{'id': r[0], 'sha256': r[1], 'filename': r[2], 'attempts': r[3] + 1} for r in rows]
+
+    def finish(self, job: Dict[str, object], status: str, *, paper_id: str = '', error: str = '',
+               result: Optional[Dict[str, object]] = None) -> None:
+        if status == 'failed' and int(job['attempts']) < MAX_ATTEMPTS:  # type: ignore[arg-type]
+            status = 'queued'
+        with closing(self.connect()) as conn, conn:
+            conn.execute('UPDATE jobs SET status = ?, paper_id = ?, error = ?, result = ?, updated = ? WHERE id = ?',
+                         (status, paper_id, error, json.dumps(result or {}, ensure_ascii=False), time.time(),
+                          job['id']))
+
+    def counts(self) -> Dict[str, int]:
+        out = {s: 0 for s in STATUSES}
+        with closing(self.connect()) as conn:
+            for status, n in conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'):
+                out[status] = n
+        return out
+
+    def recent(self, limit: int = 50) -> List[Dict[str, object]]:
+        with closing(self.connect()) as conn:
+            rows = conn.execute('SELECT id, filename, status, attempts, paper_id, error, updated FROM jobs '
+                                'ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [{'id': r[0], 'file': r[1], 'status': r[2], 'attempts': r[3], 'paper_id': r[4], 'error': r[5],
+                 'updated': r[6]} for r in rows]
+
+    def clear_finished(self) -> int:
+        with closing(self.connect()) as conn, conn:
+            return conn.execute("DELETE FROM jobs WHERE status IN ('done', 'linked', 'skipped')").rowcount
+
+
+def _note_updates(md: Dict[str, object], dest: Path) -> Dict[str, object]:
+    updates: Dict[str, object] = {}
+    for key in ('title', 'authors', 'year', 'doi'):
+        if md.get(key):
+            updates[key] = md[key]
+    updates['local_hint'] = str(dest)
+    return updates
+
+
+def _link_duplicate(note: Path, pdf_path: str) -> None:
+    """Point an existing note at the already known copy if it has no resolvable PDF yet."""
+    from paper_notes.review import parse_front_matter, read_file, resolve_local_pdf, update_note_front_matter
+    if not note.exists():
+        return
+    meta, _ = parse_front_matter(read_file(note))
+    if resolve_local_pdf(meta) is None:
+        update_note_front_matter(note, {'local_hint': pdf_path})
+
+
+@traced('jobs.process_batch')
+def process_batch(store: JobStore, jobs: List[Dict[str, object]], uploads_dir: Path = UPLOADS_DIR) -> None:
+    """Register one batch of claimed upload jobs (see module docstring)."""
+    from paper_notes.pdf_cache import extract_many, file_sha256
+    from paper_notes.review import update_note_front_matter
+    from scripts.paper_sync import create_note, infer_paper_id, load_manifest, note_path, upsert_manifest
+
+    manifest = load_manifest()
+    known = known_pdfs(uploads_dir)
+    todo: List[Tuple[Dict[str, object], str, str, Path]] = []
+    claimed: Dict[str, int] = {}
+    for job in jobs:
+        try:
+            pid, year = infer_paper_id(str(job['filename']))
+            dest = uploads_dir / f'{pid}.pdf'
+            note = note_path(pid)
+            # Our own bytes already at the destination mean a previous attempt of this job, not a conflict.
+            ours = dest.exists() and file_sha256(dest) == job['sha256']
+            dup = known.get(str(job['sha256']))
+            if dup and not ours:
+                _link_duplicate(note_path(dup[0]), dup[1])
+                store.finish(job, 'linked', paper_id=dup[0], result={'duplicate_of': dup[1]})
+                store.staged_path(str(job['sha256'])).unlink(missing_ok=True)
+                continue
+            # Any other file at the destination (e.g. from a paper added outside the queue) is a conflict too.
+            if pid in claimed or ((pid in manifest or note.exists() or dest.exists()) and not ours):
+                store.finish(job, 'skipped', paper_id=pid, error=f'{pid} already exists')
+                store.staged_path(str(job['sha256'])).unlink(missing_ok=True)
+                continue
+            claimed[pid] = int(job['id'])  # type: ignore[arg-type]
+            staged = store.staged_path(str(job['sha256']))
+            if staged.exists():
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staged, dest)
+            elif not dest.exists():
+                raise FileNotFoundError(f'staged upload is missing: {staged}')
+            todo.append((job, pid, year, dest))
+        except Exception as e:
+            store.finish(job, 'failed', error=f'{type(e).__name__}: {e}')
+    count('jobs', len(jobs))
+    if not todo:
+        return
+
+    extracted = extract_many([dest for _, _, _, dest in todo])
+    versions = build_index()
+    rows: List[Dict[str, str]] = []
+    done: List[Tuple[Dict[str, object], str, Dict[str, object]]] = []
+    for job, pid, year, dest in todo:
+        try:
+            md = dict(extracted[dest]['metadata'])  # type: ignore[arg-type]
+            paper = versions.features(pid, str(md.get('title') or ''), str(extracted[dest]['first_page']),
+                                      str(md.get('doi') or ''), [Path(str(job['filename'])).stem])
+            matches = versions.query(paper, strict=True)
+            if matches:
+                # Another version of a paper we already have (arXiv vN, conference vs journal): no new note.
+                other, score, reason = matches[0]
+                # Keep the file under the paper it belongs to, so no later upload inferring ``pid`` can replace it.
+                kept = version_path(other, str(job['sha256']), uploads_dir)
+                kept.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(dest, kept)
+                _link_duplicate(note_path(other), str(kept))
+                store.finish(job, 'linked', paper_id=other,
+                             result={'version_of': other, 'similarity': round(score, 3), 'reason': reason,
+                                     'path': str(kept)})
+                continue
+            versions.add(paper)
+            create_note(pid, year, str(dest))
+            update_note_front_matter(note_path(pid), _note_updates(md, dest))
+            rows.append({'paper_id': pid, 'title': str(md.get('title') or ''), 'year': str(md.get('year') or year),
+                         'one_drive_path': str(dest), 'share_link': ''})
+            done.append((job, pid, {'title': str(md.get('title') or ''),
+                                    'warning': str(extracted[dest]['error'] or '')}))
+        except Exception as e:
+            store.finish(job, 'failed', paper_id=pid, error=f'{type(e).__name__}: {e}')
+    try:
+        upsert_manifest(rows)
+    except Exception as e:
+        for job, pid, _ in done:
+            store.finish(job, 'failed', paper_id=pid, error=f'manifest: {type(e).__name__}: {e}')
+        return
+    for job, pid, result in done:
+        store.finish(job, 'done', paper_id=pid, result=result)
+
+
+class JobRunner:
+    """Daemon thread draining the job table; ``wake()`` after submitting."""
+
+    def __init__(self, store: Optional[JobStore] = None, *, batch_size: int = BATCH_SIZE,
+                 idle_wait: float = 5.0) -> None:
+        self.store = store or JobStore()
+        self.batch_size = batch_size
+        self.idle_wait = idle_wait
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> 'JobRunner':
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.store.requeue_running()
+                self._thread = threading.Thread(target=self._loop, name='paper-notes-jobs', daemon=True)
+                self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_pending(self) -> int:
+        """Process queued jobs in the calling thread until none are left; returns jobs claimed."""
+        total = 0
+        while True:
+            jobs = self.store.claim(self.batch_size)
+            if not jobs:
+                return total
+            total += len(jobs)
+            try:
+                process_batch(self.store, jobs)
+            except Exception as e:
+                for job in jobs:
+                    self.store.finish(job, 'failed', error=f'{type(e).__name__}: {e}')
+
+    def _loop(self) -> None:
+        while True:
+            self.run_pending()
+            self._wake.wait(self.idle_wait)
+            self._wake.clear()
+
+
+_RUNNER: Optional[JobRunner] = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def get_runner() -> JobRunner:
+    """Process-wide runner, started on first use."""
+    global _RUNNER
+    with _RUNNER_LOCK:
+        if _RUNNER is None:
+            _RUNNER = JobRunner()
+        return _RUNNER.start()
@@ -0,0 +1,237 @@
+"""Manifest store: bulk upserts, atomic writes and cross-process locking.
+
+``data/manifest.csv`` stays the default backend. Writers take an exclusive
+lock on ``<manifest>.lock``, re-read the current file, merge their rows and
+replace the file via a temp file + ``os.replace`` so concurrent CLI and
+Streamlit sessions never interleave or lose rows. Setting
+``PAPER_NOTES_MANIFEST`` to a ``*.sqlite`` path switches to a SQLite backend
+for very large catalogs.
+
+``load()`` returns a read-only ``ManifestView``: rows are kept as compact
+tuples (CSV, shared across calls until the file changes) or looked up on
+demand (SQLite), and only materialized as dicts when accessed.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+MANIFEST_PATH = Path('data/manifest.csv')
+MANIFEST_HEADERS = ['paper_id', 'title', 'year', 'one_drive_path', 'share_link']
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Exclusive advisory lock on ``<path>.lock`` (flock on POSIX, msvcrt on Windows)."""
+    lock_path = path.with_name(path.name + '.lock')
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ManifestView(Mapping):
+    """Read-only ``{paper_id: row dict}`` mapping over a manifest snapshot."""
+
+    def __init__(self, headers: List[str], rows: Mapping[str, Tuple[str, ...]]) -> None:
+        self.headers = headers
+        self._rows = rows
+
+    def __getitem__(self, paper_id: str) -> Dict[str, str]:
+        return dict(zip(self.headers, self._rows[paper_id]))
+
+    def __contains__(self, paper_id: object) -> bool:
+        return paper_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class _SqliteRows(Mapping):
+    """Row tuples fetched from SQLite on demand over one connection held for the view's lifetime.
+
+    Keys stored in the ``extra`` JSON column follow the standard columns, in
+    the order they first appear, so the rows line up with ``headers``.
+    """
+
+    def __init__(self, store: 'SqliteManifestStore') -> None:
+        self.store = store
+        self._conn = store.connect(check_same_thread=False)
+        weakref.finalize(self, self._conn.close)
+        self.extras = [k for (k,) in self._conn.execute(
+            'SELECT j.key FROM manifest, json_each(manifest.extra) AS j GROUP BY j.key ORDER BY MIN(manifest.rowid), j.key')]
+        self.headers = list(MANIFEST_HEADERS) + self.extras
+
+    def __getitem__(self, paper_id: str) -> Tuple[str, ...]:
+        row = self._conn.execute(f'SELECT {self.store.columns}, extra FROM manifest WHERE paper_id = ?', (paper_id,)).fetchone()
+        if row is None:
+            raise KeyError(paper_id)
+        values = tuple('' if v is None else str(v) for v in row[:-1])
+        if self.extras:
+            extra = json.loads(row[-1]) if row[-1] else {}
+            values += tuple(str(extra.get(k, '')) for k in self.extras)
+        return values
+
+    def __contains__(self, paper_id: object) -> bool:
+        return self._conn.execute('SELECT 1 FROM manifest WHERE paper_id = ?', (paper_id,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        ids = [pid for (pid,) in self._conn.execute('SELECT paper_id FROM manifest ORDER BY rowid')]
+        return iter(ids)
+
+    def __len__(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM manifest').fetchone()[0]
+
+
+class CsvManifestStore:
+    _cache: Dict[str, Tuple[Tuple[int, int], List[str], Dict[str, Tuple[str, ...]]]] = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, path: Path = MANIFEST_PATH) -> None:
+        self.path = Path(path)
+
+    def _read(self) -> Tuple[List[str], Dict[str, Tuple[str, ...]]]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return list(MANIFEST_HEADERS), {}
+        key = str(self.path.resolve())
+        fp = (st.st_mtime_ns, st.st_size)
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit and hit[0] == fp:
+                return hit[1], hit[2]
+        with self.path.open(newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            headers = next(reader, None) or list(MANIFEST_HEADERS)
+            width = len(headers)
+            pid_idx = headers.index('paper_id') if 'paper_id' in headers else 0
+            rows: Dict[str, Tuple[str, ...]] = {}
+            for rec in reader:
+                if not rec:
+                    continue
+                rec = (rec + [''] * width)[:width]
+                rows[rec[pid_idx]] = tuple(rec)
+        with self._cache_lock:
+            self._cache[key] = (fp, headers, rows)
+        return headers, rows
+
+    def load(self) -> ManifestView:
+        headers, rows = self._read()
+        return ManifestView(headers, rows)
+
+    def upsert_many(self, rows: Iterable[Dict[str, str]]) -> int:
+        """Merge ``rows`` (keyed by paper_id) into the manifest in one atomic write.
+
+        Keys missing from a row keep their current value. Returns the number
+        of rows written.
+        """
+        rows = [r for r in rows if r.get('paper_id')]
+        if not rows:
+            return 0
+        with file_lock(self.path):
+            headers, current = self._read()
+            headers = list(headers)
+            for r in rows:
+                for k in r:
+                    if k not in headers:
+                        headers.append(k)
+            merged: Dict[str, Dict[str, str]] = {}
+            for pid, rec in current.items():
+                merged[pid] = dict(zip(headers, rec))
+            for r in rows:
+                base = merged.get(r['paper_id'], {})
+                base.update({k: '' if v is None else str(v) for k, v in r.items()})
+                merged[r['paper_id']] = base
+            self._write(headers, merged.values())
+        return len(rows)
+
+    def _write(self, headers: List[str], rows: Iterable[Dict[str, str]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+        with tmp.open('w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=headers, restval='')
+            writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class SqliteManifestStore:
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.columns = ', '.join(MANIFEST_HEADERS)
+
+    def connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=check_same_thread)
+        cols = ', '.join(f'{h} TEXT' for h in MANIFEST_HEADERS[1:])
+        conn.execute(f'CREATE TABLE IF NOT EXISTS manifest (paper_id TEXT PRIMARY KEY, {cols}, extra TEXT)')
+        return conn
+
+    def load(self) -> ManifestView:
+        rows = _SqliteRows(self)
+        return ManifestView(rows.headers, rows)
+
+    def upsert_many(self, rows: Iterable[Dict[str, str]]) -> int:
+        rows = [r for r in rows if r.get('paper_id')]
+        if not rows:
+            return 0
+        with closing(self.connect()) as conn, conn:
+            conn.execute('BEGIN IMMEDIATE')  # extras are read-merged-written, so hold the write lock throughout
+            for r in rows:
+                known = {k: '' if r[k] is None else str(r[k]) for k in MANIFEST_HEADERS if k in r}
+                extra = {k: '' if v is None else str(v) for k, v in r.items() if k not in MANIFEST_HEADERS}
+                if extra:
+                    # Keys missing from the row keep their stored value, as for the standard columns.
+                    old = conn.execute('SELECT extra FROM manifest WHERE paper_id = ?', (r['paper_id'],)).fetchone()
+                    extra = {**json.loads(old[0] if old and old[0] else '{}'), **extra}
+                cols = list(known)
+                updates = [f'{c} = excluded.{c}' for c in cols[1:]] + (['extra = excluded.extra'] if extra else [])
+                sql = f"INSERT INTO manifest ({', '.join(cols)}, extra) VALUES ({', '.join('?' * (len(cols) + 1))})"
+                sql += f" ON CONFLICT(paper_id) DO UPDATE SET {', '.join(updates)}" if updates else ' ON CONFLICT(paper_id) DO NOTHING'
+                conn.execute(sql, [known[c] for c in cols] + [json.dumps(extra, ensure_ascii=False) if extra else None])
+        return len(rows)
+
+
+def get_store(path: Optional[Path] = None):
+    """Return the configured store (``PAPER_NOTES_MANIFEST`` overrides the CSV default)."""
+    path = Path(path or os.getenv('PAPER_NOTES_MANIFEST') or MANIFEST_PATH)
+    if path.suffix in {'.sqlite', '.sqlite3', '.db'}:
+        return SqliteManifestStore(path)
+    return CsvManifestStore(path)
+
+
+def copy_manifest(src, dst) -> int:
+    """Copy every row from one store to another, e.g. CSV -> SQLite."""
+    return dst.upsert_many(src.load().values())
@@ -0,0 +1,124 @@
+"""Single-pass note parser.
+
+A note is scanned once into its front matter and a heading table of
+``(heading line, content start, content end)`` offsets into the original
+text. Sections, TL;DR bullets and BibTeX are sliced out lazily on first
+access, so reading several sections no longer rescans the document with a
+fresh regex each time. Headings inside fenced code blocks are ignored.
+
+``parse_note(path)`` caches parsed notes per (path, mtime, size).
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from paper_notes.review import parse_front_matter, parse_tldr_bullets, read_file
+from paper_notes.trace import count
+
+TLDR_HEADING = '## TL;DR（3行）'
+BIBTEX_HEADING = '## BibTeX'
+CACHE_SIZE = 4096
+
+_FENCE_RE = re.compile(r'```[a-zA-Z]*\n(.*?)\n```', re.DOTALL)
+
+
+def _scan_headings(text: str, start: int) -> Dict[str, Tuple[int, int]]:
+    """Map each heading line (stripped) to the (start, end) offsets of its content.
+
+    A section runs until the next level-1 or level-2 heading, matching the
+    historical ``extract_section`` behaviour; the first occurrence of a
+    repeated heading wins.
+    """
+    open_heads: List[str] = []  # headings whose section is still open
+    spans: Dict[str, Tuple[int, int]] = {}
+    in_fence = False
+    pos = start
+    n = len(text)
+    while pos < n:
+        nl = text.find('\n', pos)
+        end = n if nl == -1 else nl
+        line = text[pos:end].strip()
+        if line.startswith('```'):
+            in_fence = not in_fence
+        elif not in_fence and line.startswith('#'):
+            hashes = len(line) - len(line.lstrip('#'))
+            if hashes <= 2 and line[hashes:hashes + 1].isspace():
+                for h in open_heads:
+                    spans[h] = (spans[h][0], pos)
+                open_heads = []
+            if line not in spans:
+                spans[line] = (end + 1 if nl != -1 else n, n)
+                open_heads.append(line)
+        pos = end + 1
+    return spans
+
+
+class ParsedNote:
+    """Front matter plus lazily sliced sections of one note."""
+
+    __slots__ = ('text', 'meta', 'body_offset', 'spans', '_sections')
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.meta, self.body_offset = parse_front_matter(text)
+        self.spans = _scan_headings(text, self.body_offset)
+        self._sections: Dict[str, str] = {}
+
+    @property
+    def body(self) -> str:
+        return self.text[self.body_offset:]
+
+    def headings(self) -> List[str]:
+        return list(self.spans)
+
+    def section(self, heading: str) -> str:
+        """Text under ``heading`` (e.g. ``'## Method'``), '' if the note has no such heading."""
+        key = heading.strip()
+        sec = self._sections.get(key)
+        if sec is None:
+            span = self.spans.get(key)
+            sec = self.text[span[0]:span[1]].strip('\n') if span else ''
+            self._sections[key] = sec
+        return sec
+
+    @property
+    def tldr(self) -> List[str]:
+        return parse_tldr_bullets(self.section(TLDR_HEADING))
+
+    @property
+    def bibtex(self) -> str:
+        m = _FENCE_RE.search(self.section(BIBTEX_HEADING))
+        return m.group(1).strip() if m else ''
+
+
+_CACHE: 'OrderedDict[str, Tuple[Tuple[int, int], ParsedNote]]' = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def parse_note(path: Path) -> ParsedNote:
+    """Parse ``path``, reusing the cached result while its (mtime, size) is unchanged."""
+    st = Path(path).stat()
+    fp = (st.st_mtime_ns, st.st_size)
+    key = str(path)
+    with _LOCK:
+        hit = _CACHE.get(key)
+        if hit and hit[0] == fp:
+            _CACHE.move_to_end(key)
+            return hit[1]
+    count('notes_parsed')
+    note = ParsedNote(read_file(Path(path)))
+    with _LOCK:
+        _CACHE[key] = (fp, note)
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return note
+
+
+def clear_cache() -> None:
+    with _LOCK:
+        _CACHE.clear()
+
@@ -0,0 +1,255 @@
+"""Batch PDF text extraction with a persistent content-hash cache.
+
+Results (abstract, first-page text and ``extract_pdf_metadata`` fields) are
+stored in SQLite keyed by the SHA-256 of the PDF bytes plus
+``EXTRACTOR_VERSION``, so renamed or re-uploaded copies of the same file are
+cache hits and bumping the version invalidates old entries. A second table
+maps (path, size, mtime) to the hash so unchanged files are not re-hashed.
+Cache misses are parsed in a process pool.
+
+Every result is a dict with keys ``path``, ``sha256``, ``abstract``,
+``first_page``, ``metadata``, ``seconds``, ``error`` and ``cached``; failures
+carry a non-empty ``error`` instead of silently yielding empty text.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from paper_notes.pdf_text import scan_pdf
+from paper_notes.trace import count, traced
+
+CACHE_PATH = Path('data') / 'cache' / 'pdf_extract.sqlite'
+EXTRACTOR_VERSION = 1
+MAX_PAGES = 2
+NO_TEXT = 'no extractable text in first pages'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    sha256 TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    abstract TEXT NOT NULL,
+    first_page TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    PRIMARY KEY (sha256, version)
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def connect(db_path: Path = CACHE_PATH) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _result(path: Path, sha: str = '', error: str = '') -> Dict[str, object]:
+    return {
+        'path': path,
+        'sha256': sha,
+        'abstract': '',
+        'first_page': '',
+        'metadata': {},
+        'seconds': 0.0,
+        'error': error,
+        'cached': False,
+    }
+
+
+def extract_pdf(pdf_path: Path, max_pages: int = MAX_PAGES) -> Dict[str, object]:
+    """Parse one PDF: abstract, first-page text and metadata from a single lazy pass."""
+    out = _result(pdf_path)
+    t0 = time.perf_counter()
+    try:
+        import pypdf  # type: ignore  # noqa: F401
+    except Exception:
+        out['error'] = 'pypdf is not installed'
+        return out
+    try:
+        scanned = scan_pdf(pdf_path, max_pages)
+        out['first_page'] = scanned['first_page']
+        out['abstract'] = scanned['abstract']
+        out['metadata'] = scanned['metadata']
+        if not str(scanned['text']).strip():
+            out['error'] = NO_TEXT
+    except Exception as e:
+        out['error'] = f'{type(e).__name__}: {e}'
+    out['seconds'] = time.perf_counter() - t0
+    return out
+
+
+def _extract_worker(path_str: str, max_pages: int) -> Dict[str, object]:
+    return extract_pdf(Path(path_str), max_pages)
+
+
+def hash_paths(conn: sqlite3.Connection, paths: List[Path], workers: int) -> Dict[Path, object]:
+    """Return {path: sha256 or Exception}, reusing hashes of unchanged files recorded in ``conn``."""
+    hashes: Dict[Path, object] = {}
+    stats: Dict[Path, os.stat_result] = {}
+    todo: List[Path] = []
+    for p in paths:
+        try:
+            st = p.stat()
+        except OSError as e:
+            hashes[p] = e
+            continue
+        stats[p] = st
+        row = conn.execute('SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?', (str(p.resolve()),)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            hashes[p] = row[2]
+        else:
+            todo.append(p)
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {p: pool.submit(file_sha256, p) for p in todo}
+        with conn:
+            for p, fut in futures.items():
+                try:
+                    sha = fut.result()
+                except OSError as e:
+                    hashes[p] = e
+                    continue
+                hashes[p] = sha
+                st = stats[p]
+                conn.execute('INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)',
+                             (str(p.resolve()), st.st_size, st.st_mtime_ns, sha))
+    return hashes
+
+
+@traced('pdf.extract_many')
+def extract_many(pdfs: Iterable[Path], *, workers: Optional[int] = None, max_pages: int = MAX_PAGES,
+                 db_path: Path = CACHE_PATH) -> Dict[Path, Dict[str, object]]:
+    """Extract every PDF in ``pdfs``, serving repeats from the cache.
+
+    Cache misses are parsed in a process pool of ``workers`` processes
+    (default: all cores); a single miss is parsed in-process.
+    """
+    paths = list(dict.fromkeys(Path(p) for p in pdfs))
+    workers = workers or os.cpu_count() or 1
+    results: Dict[Path, Dict[str, object]] = {}
+    with closing(connect(db_path)) as conn:
+        hashes = hash_paths(conn, paths, min(workers, 8))
+        misses: Dict[str, List[Path]] = {}
+        for p in paths:
+            sha = hashes.get(p)
+            if isinstance(sha, Exception):
+                results[p] = _result(p, error=f'{type(sha).__name__}: {sha}')
+                continue
+            t0 = time.perf_counter()
+            row = conn.execute(
+                'SELECT abstract, first_page, metadata FROM extractions WHERE sha256 = ? AND version = ?',
+                (sha, EXTRACTOR_VERSION),
+            ).fetchone()
+            if row:
+                res = _result(p, str(sha))
+                res['abstract'], res['first_page'] = row[0], row[1]
+                res['metadata'] = json.loads(row[2])
+                res['seconds'] = time.perf_counter() - t0
+                res['cached'] = True
+                if not row[1].strip():
+                    res['error'] = NO_TEXT
+                results[p] = res
+            else:
+                misses.setdefault(str(sha), []).append(p)
+        count('pdfs', len(paths))
+        count('cache_misses', len(misses))
+
+        parsed: Dict[str, Dict[str, object]] = {}
+        if len(misses) == 1 or workers == 1:
+            for sha, group in misses.items():
+                parsed[sha] = extract_pdf(group[0], max_pages)
+        elif misses:
+            with ProcessPoolExecutor(max_workers=min(workers, len(misses))) as pool:
+                futures = {sha: pool.submit(_extract_worker, str(group[0]), max_pages) for sha, group in misses.items()}
+                for sha, fut in futures.items():
+                    try:
+                        parsed[sha] = fut.result()
+                    except Exception as e:
+                        parsed[sha] = _result(misses[sha][0], error=f'{type(e).__name__}: {e}')
+
+        with conn:
+            for sha, res in parsed.items():
+                # Only clean parses are cached so transient failures are retried next time.
+                if not res['error'] or res['error'] == NO_TEXT:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO extractions (sha256, version, abstract, first_page, metadata, seconds) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (sha, EXTRACTOR_VERSION, res['abstract'], res['first_page'],
+                         json.dumps(res['metadata'], ensure_ascii=False), res['seconds']),
+                    )
+                for p in misses[sha]:
+                    results[p] = dict(res, path=p, sha256=sha)
+    return {p: results[p] for p in paths}
+
+
+def lookup_cached(pdf: Path, *, db_path: Path = CACHE_PATH,
+                  conn: Optional[sqlite3.Connection] = None) -> Optional[Dict[str, str]]:
+    """Return cached {'sha256', 'abstract', 'first_page'} for an unchanged file, without parsing or hashing.
+
+    Pass an open ``conn`` when looking up many files in a row.
+    """
+    try:
+        st = Path(pdf).stat()
+    except OSError:
+        return None
+    if conn is None:
+        if not db_path.exists():
+            return None
+        with closing(connect(db_path)) as own:
+            return lookup_cached(pdf, conn=own)
+    row = conn.execute(
+        'SELECT e.sha256, e.abstract, e.first_page FROM file_hashes f '
+        'JOIN extractions e ON e.sha256 = f.sha256 AND e.version = ? '
+        'WHERE f.path = ? AND f.size = ? AND f.mtime_ns = ?',
+        (EXTRACTOR_VERSION, str(Path(pdf).resolve()), st.st_size, st.st_mtime_ns),
+    ).fetchone()
+    if row is None:
+        return None
+    return {'sha256': row[0], 'abstract': row[1], 'first_page': row[2]}
+
+
+def extraction_count(db_path: Path = CACHE_PATH) -> int:
+    if not db_path.exists():
+        return 0
+    with closing(connect(db_path)) as conn:
+        return conn.execute('SELECT COUNT(*) FROM extractions').fetchone()[0]
+
+
+def extract_one(pdf: Path, *, db_path: Path = CACHE_PATH) -> Dict[str, object]:
+    return extract_many([pdf], workers=1, db_path=db_path)[Path(pdf)]
+
+
+def format_report(results: Iterable[Dict[str, object]], verbose: bool = False) -> List[str]:
+    """Human-readable summary lines: totals, failures and (optionally) per-file timings."""
+    results = list(results)
+    hits = sum(1 for r in results if r['cached'])
+    total = sum(float(r['seconds']) for r in results)  # type: ignore[arg-type]
+    lines = [f'Extracted {len(results)} PDF(s): {hits} cache hit(s), {len(results) - hits} parsed, {total:.2f}s total']
+    for r in results:
+        if r['error']:
+            lines.append(f"  FAILED {r['path']}: {r['error']}")
+        elif verbose:
+            tag = 'cached' if r['cached'] else 'parsed'
+            lines.append(f"  {float(r['seconds']):7.3f}s {tag} {r['path']}")  # type: ignore[arg-type]
+    return lines
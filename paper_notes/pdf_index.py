@@ -0,0 +1,79 @@
+"""Content-hash index of the PDFs the corpus already has.
+
+Covers uploads (``data/uploads/<paper_id>.pdf``, and other versions of a
+paper under ``data/uploads/versions/<paper_id>.<sha>.pdf``) and files registered by
+``scripts.paper_sync`` under ``ONEDRIVE_PAPERS_ROOT``; the latter come from
+the sync journal, which already stores each file's hash and paper_id. Upload
+hashes are memoized in the PDF cache's (path, size, mtime) table, so only new
+or changed files are read.
+
+``hash_stream`` copies an upload to disk in fixed-size chunks while hashing
+it, so ingesting a PDF never holds more than one chunk in memory.
+"""
+
+import hashlib
+import os
+from contextlib import closing
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from paper_notes.pdf_cache import CACHE_PATH, connect, hash_paths
+
+UPLOADS_DIR = Path('data') / 'uploads'
+VERSIONS_DIRNAME = 'versions'
+CHUNK_SIZE = 1 << 20
+
+
+def version_path(paper_id: str, sha: str, uploads_dir: Path = UPLOADS_DIR) -> Path:
+    """Where an uploaded other version (arXiv vN, journal copy) of ``paper_id`` is kept."""
+    return uploads_dir / VERSIONS_DIRNAME / f'{paper_id}.{sha[:16]}.pdf'
+
+
+def hash_stream(src: BinaryIO, dest: Path, chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+    """Write ``src`` to ``dest`` atomically in chunks; returns (sha256, size)."""
+    h = hashlib.sha256()
+    size = 0
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f'.{dest.name}.{os.getpid()}.tmp')
+    if hasattr(src, 'seek'):
+        src.seek(0)
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return h.hexdigest(), size
+
+
+def known_pdfs(uploads_dir: Path = UPLOADS_DIR, root: Optional[str] = None,
+               db_path: Path = CACHE_PATH) -> Dict[str, Tuple[str, str]]:
+    """Return {sha256: (paper_id, path)} for uploaded and synced PDFs.
+
+    Uploads count when a note named after them (or, for other versions, after
+    the paper they were linked to) exists. ``root`` defaults to
+    ``ONEDRIVE_PAPERS_ROOT``; synced files are reported relative to it, as in
+    the manifest.
+    """
+    from scripts.paper_sync import load_journal, note_path
+
+    out: Dict[str, Tuple[str, str]] = {}
+    root = root if root is not None else os.getenv('ONEDRIVE_PAPERS_ROOT', '')
+    if root and os.path.isdir(root):
+        for rel, info in load_journal(root)['files'].items():
+            if info.get('sha256') and info.get('paper_id'):
+                out.setdefault(info['sha256'], (info['paper_id'], rel))
+    owners = {p: p.stem for p in uploads_dir.glob('*.pdf')}
+    owners.update((p, p.name.split('.', 1)[0]) for p in (uploads_dir / VERSIONS_DIRNAME).glob('*.pdf'))
+    uploads = sorted(p for p, pid in owners.items() if p.is_file() and note_path(pid).exists())
+    if uploads:
+        with closing(connect(db_path)) as conn:
+            hashes = hash_paths(conn, uploads, 8)
+        for p in uploads:
+            sha = hashes.get(p)
+            if isinstance(sha, str):
+                out.setdefault(sha, (owners[p], str(p)))
+    return out
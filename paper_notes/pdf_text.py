@@ -0,0 +1,127 @@
+"""Single-open, page-lazy PDF text access.
+
+``PdfDocument`` opens a file once (memory-mapped when possible, so pypdf does
+not copy the whole file into memory) and extracts page text only when a page
+is first asked for. ``scan`` walks the first pages in order and stops as soon
+as the abstract, title and DOI heuristics are settled, returning metadata,
+abstract and first-page text from that one reader.
+
+Results are identical to reading all ``max_pages`` pages: the abstract is
+only taken early once the match window of ``review.abstract_from_text`` is
+already complete, so further pages could not change it.
+"""
+
+import mmap
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+ABSTRACT_RE = re.compile(r'(abstract[:\.]?\s*)(.{100,800})', re.IGNORECASE)
+ABSTRACT_WINDOW = 800
+REFERENCES_RE = re.compile(r'^\s*(?:\d+\.?\s*)?(references|bibliography|参考文献)\s*$', re.IGNORECASE | re.MULTILINE)
+
+
+class PdfDocument:
+    """One PDF opened once; use as a context manager."""
+
+    def __init__(self, path: Path) -> None:
+        from pypdf import PdfReader  # type: ignore
+
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._map: Optional[mmap.mmap] = None
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):  # empty file or no mmap support
+            self._map = None
+        try:
+            self.reader = PdfReader(self._map if self._map is not None else self._file)
+        except Exception:
+            self.close()
+            raise
+        self._texts: Dict[int, str] = {}
+
+    def __enter__(self) -> 'PdfDocument':
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:  # pypdf still holds a view; released with the reader
+                pass
+            self._map = None
+        self._file.close()
+
+    def __len__(self) -> int:
+        return len(self.reader.pages)
+
+    def page_text(self, i: int) -> str:
+        """Text of page ``i`` (empty if it cannot be extracted), extracted once."""
+        if i not in self._texts:
+            try:
+                self._texts[i] = self.reader.pages[i].extract_text() or ''
+            except Exception:
+                self._texts[i] = ''
+        return self._texts[i]
+
+    def pages(self, max_pages: Optional[int] = None) -> Iterator[str]:
+        """Lazily yield the text of the first ``max_pages`` pages."""
+        n = len(self) if max_pages is None else min(max_pages, len(self))
+        for i in range(n):
+            yield self.page_text(i)
+
+    def scan(self, max_pages: int = 2) -> Dict[str, object]:
+        """Metadata, abstract and first-page text in one pass, reading as few pages as possible.
+
+        Returns keys ``metadata``, ``abstract``, ``first_page``, ``text`` (the
+        pages read, concatenated) and ``pages_read``.
+        """
+        from paper_notes.review import abstract_from_text, metadata_from_reader
+
+        pages: List[str] = []
+        for text in self.pages(max_pages):
+            pages.append(text)
+            if abstract_settled(''.join(pages)):
+                break
+        first_page = pages[0] if pages else ''
+        joined = ''.join(pages)
+        return {
+            'metadata': metadata_from_reader(self.reader, first_page),
+            'abstract': abstract_from_text(joined),
+            'first_page': first_page,
+            'text': joined,
+            'pages_read': len(pages),
+        }
+
+    def references(self, max_pages: int = 8) -> str:
+        """Text of the reference list: pages are read backwards from the end until its heading shows up.
+
+        Returns everything after the last "References"/"Bibliography" heading
+        within the last ``max_pages`` pages, or '' if there is none.
+        """
+        pages: List[str] = []
+        for i in range(len(self) - 1, max(-1, len(self) - 1 - max_pages), -1):
+            text = self.page_text(i)
+            pages.append(text)
+            heads = list(REFERENCES_RE.finditer(text))
+            if heads:
+                pages[-1] = text[heads[-1].end():]
+                return '\n'.join(reversed(pages)).strip()
+        return ''
+
+
+def abstract_settled(text: str) -> bool:
+    """True when more text appended to ``text`` cannot change ``abstract_from_text``'s result."""
+    flat = re.sub(r'\s+', ' ', text)
+    m = ABSTRACT_RE.search(flat)
+    # Strictly more than the window: a trailing space could still merge with the next page's whitespace.
+    return bool(m) and len(flat) - m.start(2) > ABSTRACT_WINDOW
+
+
+def scan_pdf(path: Path, max_pages: int = 2) -> Dict[str, object]:
+    with PdfDocument(path) as doc:
+        return doc.scan(max_pages)
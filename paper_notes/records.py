@@ -0,0 +1,152 @@
+"""Compact, typed note records.
+
+``PaperRecord`` holds only the metadata columns needed to list and filter
+papers (``__slots__``, interned tag/venue strings, other front matter keys in
+one tuple), so listing a large catalog does not keep note bodies alive.
+``Note`` adds lazy access to the body, TL;DR and BibTeX through
+``paper_notes.note_parser`` plus the per-review abstract/extraction fields.
+"""
+
+import json
+import sys
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from paper_notes.index import INDEX_PATH, connect
+from paper_notes.note_parser import ParsedNote, parse_note
+from paper_notes.trace import traced
+
+_CORE = ('paper_id', 'title', 'authors', 'venue', 'year', 'tags')
+
+
+def _strs(value: object) -> Tuple[str, ...]:
+    if not value:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(sys.intern(str(v)) for v in value)
+    return (sys.intern(str(value)),)
+
+
+class PaperRecord:
+    """Metadata of one note; ``meta`` rebuilds the front matter dict on demand."""
+
+    __slots__ = ('path', 'paper_id', 'title', 'authors', 'venue', 'year', 'tags', 'extra')
+
+    def __init__(self, path: str, paper_id: str = '', title: str = '', authors: Tuple[str, ...] = (),
+                 venue: str = '', year: object = None, tags: Tuple[str, ...] = (),
+                 extra: Tuple[Tuple[str, object], ...] = ()) -> None:
+        self.path = path
+        self.paper_id = paper_id
+        self.title = title
+        self.authors = authors
+        self.venue = venue
+        self.year = year
+        self.tags = tags
+        self.extra = extra
+
+    @classmethod
+    def from_meta(cls, path: object, meta: Dict[str, object]):
+        return cls(
+            str(path),
+            paper_id=str(meta.get('paper_id', '') or ''),
+            title=str(meta.get('title', '') or ''),
+            authors=_strs(meta.get('authors')),
+            venue=sys.intern(str(meta.get('venue', '') or '')),
+            year=meta.get('year'),
+            tags=_strs(meta.get('tags')),
+            extra=tuple((k, v) for k, v in meta.items() if k not in _CORE),
+        )
+
+    @property
+    def meta(self) -> Dict[str, object]:
+        out: Dict[str, object] = {}
+        for key in _CORE:
+            val = getattr(self, key)
+            if key in ('authors', 'tags'):
+                val = list(val)
+            if val not in ('', None, []):
+                out[key] = val
+        out.update(self.extra)
+        return out
+
+    def get(self, key: str, default: object = None) -> object:
+        """Front matter value by key, like ``meta.get``."""
+        if key in _CORE:
+            val = getattr(self, key)
+            if val in ('', None, ()):
+                return default
+            return list(val) if isinstance(val, tuple) else val
+        for k, v in self.extra:
+            if k == key:
+                return v
+        return default
+
+    @property
+    def label(self) -> str:
+        year = '' if self.year is None else str(self.year)
+        return f"{self.title or self.paper_id} ({self.venue} {year}) [{self.paper_id}]"
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.paper_id!r}, path={self.path!r})'
+
+
+class Note(PaperRecord):
+    """A ``PaperRecord`` whose body and sections are parsed lazily from disk."""
+
+    __slots__ = ('abstract', 'extraction')
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.abstract = ''
+        self.extraction: Optional[Dict[str, object]] = None
+
+    @property
+    def parsed(self) -> ParsedNote:
+        return parse_note(Path(self.path))
+
+    @property
+    def body(self) -> str:
+        """Full note text (front matter included), read on demand."""
+        return self.parsed.text
+
+    @property
+    def tldr(self) -> List[str]:
+        return self.parsed.tldr
+
+    @property
+    def bibtex(self) -> str:
+        return self.parsed.bibtex
+
+    def section(self, heading: str) -> str:
+        return self.parsed.section(heading)
+
+    def as_dict(self) -> Dict[str, object]:
+        """The legacy ``load_note_info`` dict."""
+        return {'path': self.path, 'meta': self.meta, 'tldr': self.tldr, 'bibtex': self.bibtex, 'body': self.body}
+
+
+def load_note(path: Path) -> Note:
+    return Note.from_meta(path, parse_note(path).meta)
+
+
+@traced('records.list')
+def list_records(paths: Iterable[Path], db_path: Path = INDEX_PATH) -> List[Note]:
+    """Records for ``paths`` from the notes index without reading note files.
+
+    Paths missing from the index (not refreshed yet) are parsed directly.
+    """
+    paths = list(paths)
+    metas: Dict[str, Dict[str, object]] = {}
+    names = [Path(p).name for p in paths]
+    with closing(connect(db_path)) as conn:
+        for i in range(0, len(names), 500):
+            part = names[i:i + 500]
+            rows = conn.execute(f"SELECT name, meta FROM notes WHERE name IN ({', '.join('?' * len(part))})", part)
+            for name, meta in rows:
+                metas[name] = json.loads(meta)
+    out: List[Note] = []
+    for p, name in zip(paths, names):
+        meta = metas.get(name)
+        out.append(Note.from_meta(p, meta) if meta is not None else load_note(Path(p)))
+    return out
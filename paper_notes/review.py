@@ -2,7 +2,13 @@ import os
 import re
 import ast
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
+
+from paper_notes.trace import traced
+
+if TYPE_CHECKING:
+    from paper_notes.fragments import FragmentCache
+    from paper_notes.records import Note
 
 NOTES_DIR = Path('notes')
 REVIEWS_DIR = Path('reviews')
@@ -51,14 +57,8 @@ def parse_front_matter(text: str) -> Tuple[Dict[str, object], int]:
 
 
 def extract_section(text: str, heading: str) -> str:
-    pattern = re.compile(rf"^\s*{re.escape(heading)}\s*$", re.MULTILINE)
-    m = pattern.search(text)
-    if not m:
-        return ''
-    start = m.end()
-    next_heading = re.search(r"^\s*##\s+|^\s*#\s+", text[start:], re.MULTILINE)
-    end = start + next_heading.start() if next_heading else len(text)
-    return text[start:end].strip('\n')
+    from paper_notes.note_parser import ParsedNote
+    return ParsedNote(text).section(heading)
 
 
 def parse_tldr_bullets(section_text: str) -> List[str]:
@@ -71,26 +71,29 @@ def parse_tldr_bullets(section_text: str) -> List[str]:
 
 
 def extract_bibtex(text: str) -> str:
-    sec = extract_section(text, '## BibTeX')
-    if not sec:
-        return ''
-    m = re.search(r"```[a-zA-Z]*\n(.*?)\n```", sec, re.DOTALL)
-    return m.group(1).strip() if m else ''
+    from paper_notes.note_parser import ParsedNote
+    return ParsedNote(text).bibtex
+
+
+def abstract_from_text(text: str) -> str:
+    """Pick the abstract out of raw page text (falls back to the first 500 chars)."""
+    text = re.sub(r'\s+', ' ', text)
+    m = re.search(r'(abstract[:\.]?\s*)(.{100,800})', text, re.IGNORECASE)
+    if m:
+        return m.group(2).strip()
+    return text[:500].strip()
 
 
 def try_extract_abstract_from_pdf(pdf_path: Path, max_pages: int = 2) -> str:
+    from paper_notes.pdf_text import scan_pdf
     try:
-        from pypdf import PdfReader  # type: ignore
+        return str(scan_pdf(pdf_path, max_pages)['abstract'])
     except Exception:
         return ''
 
 
-def extract_pdf_metadata(pdf_path: Path) -> Dict[str, object]:
-    """Best-effort PDF metadata extraction.
-
-    Returns keys: title(str), authors(List[str]), year(str), doi(str), keywords(List[str])
-    Missing fields are empty strings or empty lists.
-    """
+def metadata_from_reader(reader: object, first_page_text: str) -> Dict[str, object]:
+    """Build the ``extract_pdf_metadata`` dict from an open PdfReader and its first page text."""
     meta: Dict[str, object] = {
         'title': '',
         'authors': [],
@@ -98,102 +101,76 @@ def extract_pdf_metadata(pdf_path: Path) -> Dict[str, object]:
         'doi': '',
         'keywords': [],
     }
-    try:
-        from pypdf import PdfReader  # type: ignore
-    except Exception:
-        return meta
-    try:
-        reader = PdfReader(str(pdf_path))
-        info = reader.metadata or {}
-        title = getattr(info, 'title', '') or info.get('/Title', '') if isinstance(info, dict) else str(getattr(info, 'title', '') or '')
-        author = getattr(info, 'author', '') or info.get('/Author', '') if isinstance(info, dict) else str(getattr(info, 'author', '') or '')
-        subj = getattr(info, 'subject', '') or info.get('/Subject', '') if isinstance(info, dict) else ''
-        keywords = getattr(info, 'keywords', '') or info.get('/Keywords', '') if isinstance(info, dict) else ''
-        create_date = getattr(info, 'creation_date', '') or info.get('/CreationDate', '') if isinstance(info, dict) else ''
-        if title:
-            meta['title'] = str(title).strip()
-        if author:
-            # split by common separators
-            auths = [a.strip() for a in str(author).replace(';', ',').split(',') if a.strip()]
-            if auths:
-                meta['authors'] = auths
-        if keywords:
-            kws = [k.strip() for k in str(keywords).replace(';', ',').split(',') if k.strip()]
-            if kws:
-                meta['keywords'] = kws
-        # crude year from creation date
-        import re as _re
-        m = _re.search(r'(19|20)\d{2}', str(create_date))
-        if m:
-            meta['year'] = m.group(0)
-
-        # scan first page for DOI and potentially better title line
-        text = ''
-        try:
-            text = reader.pages[0].extract_text() or ''
-        except Exception:
-            text = ''
-        # DOI
-        mdoi = _re.search(r'(10\.\d{4,9}/[-._;()/:A-Z0-9]+)', text, flags=_re.IGNORECASE)
-        if mdoi:
-            meta['doi'] = mdoi.group(1)
-        # If title empty, take the first non-empty line (heuristic)
-        if not meta['title']:
-            for line in text.splitlines():
-                s = line.strip()
-                if len(s) > 8 and len(s.split()) >= 3:
-                    meta['title'] = s
-                    break
-    except Exception:
-        pass
+    info = getattr(reader, 'metadata', None) or {}
+    title = getattr(info, 'title', '') or info.get('/Title', '') if isinstance(info, dict) else str(getattr(info, 'title', '') or '')
+    author = getattr(info, 'author', '') or info.get('/Author', '') if isinstance(info, dict) else str(getattr(info, 'author', '') or '')
+    keywords = getattr(info, 'keywords', '') or info.get('/Keywords', '') if isinstance(info, dict) else ''
+    create_date = getattr(info, 'creation_date', '') or info.get('/CreationDate', '') if isinstance(info, dict) else ''
+    if title:
+        meta['title'] = str(title).strip()
+    if author:
+        # split by common separators
+        auths = [a.strip() for a in str(author).replace(';', ',').split(',') if a.strip()]
+        if auths:
+            meta['authors'] = auths
+    if keywords:
+        kws = [k.strip() for k in str(keywords).replace(';', ',').split(',') if k.strip()]
+        if kws:
+            meta['keywords'] = kws
+    # crude year from creation date
+    m = re.search(r'(19|20)\d{2}', str(create_date))
+    if m:
+        meta['year'] = m.group(0)
+    # DOI from the first page
+    mdoi = re.search(r'(10\.\d{4,9}/[-._;()/:A-Z0-9]+)', first_page_text, flags=re.IGNORECASE)
+    if mdoi:
+        meta['doi'] = mdoi.group(1)
+    # If title empty, take the first non-empty line (heuristic)
+    if not meta['title']:
+        for line in first_page_text.splitlines():
+            s = line.strip()
+            if len(s) > 8 and len(s.split()) >= 3:
+                meta['title'] = s
+                break
     return meta
+
+
+def extract_pdf_metadata(pdf_path: Path) -> Dict[str, object]:
+    """Best-effort PDF metadata extraction.
+
+    Returns keys: title(str), authors(List[str]), year(str), doi(str), keywords(List[str])
+    Missing fields are empty strings or empty lists.
+    """
+    from paper_notes.pdf_text import PdfDocument
+    empty: Dict[str, object] = {'title': '', 'authors': [], 'year': '', 'doi': '', 'keywords': []}
     try:
-        reader = PdfReader(str(pdf_path))
-        text = ''
-        for i in range(min(max_pages, len(reader.pages))):
-            try:
-                text += reader.pages[i].extract_text() or ''
-            except Exception:
-                continue
-        text = re.sub(r'\s+', ' ', text)
-        m = re.search(r'(abstract[:\.]?\s*)(.{100,800})', text, re.IGNORECASE)
-        if m:
-            return m.group(2).strip()
-        return text[:500].strip()
+        with PdfDocument(pdf_path) as doc:
+            # scan first page for DOI and potentially better title line
+            return metadata_from_reader(doc.reader, doc.page_text(0) if len(doc) else '')
     except Exception:
-        return ''
+        return empty
 
 
-def find_notes(filter_tags: List[str], year: Optional[int], papers: List[str]) -> List[Path]:
-    candidates = []
-    for p in sorted(NOTES_DIR.glob('*.md')):
-        text = read_file(p)
-        meta, _ = parse_front_matter(text)
-        pid = str(meta.get('paper_id', ''))
-        if papers and pid not in papers:
-            continue
-        if year and int(meta.get('year', 0) or 0) != year:
-            continue
-        if filter_tags:
-            tags = [str(t).lower() for t in (meta.get('tags') or [])]
-            if not set([t.lower() for t in filter_tags]) & set(tags):
-                continue
-        candidates.append(p)
-    return candidates
+@traced('review.find_notes')
+def find_notes(filter_tags: List[str], year: Optional[int], papers: List[str], *,
+               tag_expr: str = '', year_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+               notes_dir: Path = NOTES_DIR) -> List[Path]:
+    """Select notes by any of ``filter_tags``, exact ``year`` and ``papers``.
 
+    ``tag_expr`` is an AND/OR/NOT expression (see ``paper_notes.filters``) and
+    ``year_range`` an inclusive (lo, hi) pair; both are ANDed with the rest.
+    """
+    from paper_notes.filters import get_filter_index
+    index = get_filter_index(notes_dir)
+    names = index.select(filter_tags, year, papers, tag_expr=tag_expr, year_range=year_range)
+    return [notes_dir / name for name in names]
 
+
+@traced('review.load_note_info')
 def load_note_info(p: Path) -> Dict[str, object]:
-    text = read_file(p)
-    meta, _ = parse_front_matter(text)
-    tldr = parse_tldr_bullets(extract_section(text, '## TL;DR（3行）'))
-    bib = extract_bibtex(text)
-    return {
-        'path': str(p),
-        'meta': meta,
-        'tldr': tldr,
-        'bibtex': bib,
-        'body': text,
-    }
+    """Legacy dict form of ``paper_notes.records.load_note``."""
+    from paper_notes.records import load_note
+    return load_note(p).as_dict()
 
 
 def resolve_local_pdf(meta: Dict[str, object]) -> Optional[Path]:
@@ -258,112 +235,212 @@ def update_note_front_matter(path: Path, updates: Dict[str, object]) -> None:
     path.write_text(new_text, encoding='utf-8')
 
 
-def build_review_markdown(title: str, items: List[Dict[str, object]], include_abstract: bool) -> str:
+def _item_lines(idx: int, it: 'Note', include_abstract: bool) -> List[str]:
     lines: List[str] = []
-    lines.append(f"# {title}")
-    lines.append("")
-    lines.append("> Generated by paper_notes.review")
+    pid = it.paper_id
+    title = it.title or pid
+    authors = ', '.join(it.authors)
+    venue = it.venue
+    year = str(it.get('year', ''))
+    doi = str(it.get('doi', ''))
+    lines.append(f"## {idx}. {title}")
+    meta_line = f"{authors} · {venue} {year}"
+    if doi:
+        meta_line += f" · DOI: {doi}"
+    lines.append(meta_line.strip(' ·'))
     lines.append("")
-    lines.append("## Overview")
-    lines.append("| Paper | Year | Venue | Tags | Notes |")
-    lines.append("|---|---:|---|---|---|")
-    for it in items:
-        m = it['meta']  # type: ignore
-        pid = str(m.get('paper_id', ''))
-        title = str(m.get('title', '')) or pid
-        year = str(m.get('year', ''))
-        venue = str(m.get('venue', ''))
-        tags = ', '.join([str(t) for t in (m.get('tags') or [])])
-        note_link = f"[{pid}]({it['path']})"  # type: ignore
-        lines.append(f"| {title} | {year} | {venue} | {tags} | {note_link} |")
-    lines.append("")
-
-    for idx, it in enumerate(items, 1):
-        m = it['meta']  # type: ignore
-        pid = str(m.get('paper_id', ''))
-        title = str(m.get('title', '')) or pid
-        authors = ', '.join([str(a) for a in (m.get('authors') or [])])
-        venue = str(m.get('venue', ''))
-        year = str(m.get('year', ''))
-        doi = str(m.get('doi', ''))
-        lines.append(f"## {idx}. {title}")
-        meta_line = f"{authors} · {venue} {year}"
-        if doi:
-            meta_line += f" · DOI: {doi}"
-        lines.append(meta_line.strip(' ·'))
+    tldr = it.tldr
+    if tldr:
+        lines.append("**TL;DR:**")
+        for b in tldr:
+            lines.append(f"- {b}")
         lines.append("")
-        tldr: List[str] = it.get('tldr') or []  # type: ignore
-        if tldr:
-            lines.append("**TL;DR:**")
-            for b in tldr:
-                lines.append(f"- {b}")
+    if include_abstract:
+        abs_text = it.abstract
+        if abs_text:
+            lines.append("**Abstract (auto-extracted):**")
+            lines.append(abs_text)
             lines.append("")
-        if include_abstract:
-            abs_text = it.get('abstract') or ''  # type: ignore
-            if abs_text:
-                lines.append("**Abstract (auto-extracted):**")
-                lines.append(abs_text)
-                lines.append("")
-        pdf_link = str(m.get('pdf_link', ''))
-        local_pdf = resolve_local_pdf(m)
-        link_parts = [f"Note: [{pid}]({it['path']})"]  # type: ignore
-        if pdf_link:
-            link_parts.append(f"PDF: {pdf_link}")
-        if local_pdf:
-            link_parts.append(f"Local: {local_pdf}")
-        lines.append(' · '.join(link_parts))
-        lines.append("")
+    pdf_link = str(it.get('pdf_link', ''))
+    local_pdf = resolve_local_pdf(it.meta)
+    link_parts = [f"Note: [{pid}]({it.path})"]
+    if pdf_link:
+        link_parts.append(f"PDF: {pdf_link}")
+    if local_pdf:
+        link_parts.append(f"Local: {local_pdf}")
+    lines.append(' · '.join(link_parts))
+    lines.append("")
+    return lines
+
+
+def _overview_row(it: 'Note') -> str:
+    pid = it.paper_id
+    return f"| {it.title or pid} | {it.get('year', '')} | {it.venue} | {', '.join(it.tags)} | [{pid}]({it.path}) |"
+
+
+@traced('review.render')
+def iter_review_markdown(title: str, items: Sequence['Note'], include_abstract: bool, *,
+                         prepare: Optional[Callable[[List['Note']], None]] = None,
+                         batch_size: int = 64, fragments: Optional['FragmentCache'] = None,
+                         sections: Optional[Sequence[Tuple[str, int]]] = None) -> Iterator[str]:
+    """Yield the review markdown in chunks; ``''.join`` equals ``build_review_markdown``.
+
+    The overview table only needs record metadata, so it is emitted first;
+    note bodies are then parsed one at a time and only BibTeX entries are kept
+    until the references section. ``prepare`` is called on each batch of
+    ``batch_size`` items before it is rendered (e.g. to extract abstracts).
+    With ``fragments`` (see ``paper_notes.fragments``), rows and sections of
+    unchanged notes are reused instead of re-rendered. ``sections`` is a list
+    of (heading, item count) covering ``items`` in order; each group then gets
+    a ``##`` heading and the papers in it move down to ``###``.
+    """
+    keys: List[str] = []
+    starts: Dict[int, str] = {}
+    if sections:
+        pos = 0
+        for heading, n in sections:
+            starts[pos] = heading
+            pos += n
+    level = "###" if sections else "##"
+    if fragments is not None:
+        from paper_notes.fragments import keys_for
+        keys = keys_for(list(items), include_abstract)
+    head = [f"# {title}", "", "> Generated by paper_notes.review", "",
+            "## Overview", "| Paper | Year | Venue | Tags | Notes |", "|---|---:|---|---|---|"]
+    yield "\n".join(head)
+    for start in range(0, len(items), 500):
+        cached = fragments.get_many(keys[start:start + 500]) if fragments is not None else {}
+        rows = []
+        for i, it in enumerate(items[start:start + 500], start):
+            hit = cached.get(keys[i]) if cached else None
+            rows.append("\n" + (hit[0] if hit else _overview_row(it)))
+        yield ''.join(rows)
+    yield "\n"
+
+    bibs: List[str] = []
+    for start in range(0, len(items), batch_size):
+        batch = list(items[start:start + batch_size])
+        if prepare is not None:
+            prepare(batch)
+        cached = fragments.get_many(keys[start:start + batch_size]) if fragments is not None else {}
+        fresh: Dict[str, Tuple[str, str, str, str]] = {}
+        for idx, it in enumerate(batch, start + 1):
+            abstract_sha = ''
+            if include_abstract and it.abstract:
+                from paper_notes.fragments import text_sha
+                abstract_sha = text_sha(it.abstract)
+            hit = cached.get(keys[idx - 1]) if cached else None
+            if hit and hit[3] == abstract_sha:
+                body, bib = hit[1], hit[2]
+                fragments.reused += 1  # type: ignore[union-attr]
+            else:
+                body = "\n".join(_item_lines(idx, it, include_abstract)[1:])
+                bib = it.bibtex
+                if fragments is not None:
+                    fresh[keys[idx - 1]] = (_overview_row(it), body, bib, abstract_sha)
+                    fragments.rendered += 1
+            if idx - 1 in starts:
+                yield f"\n## {starts[idx - 1]}\n"
+            yield f"\n{level} {idx}. {it.title or it.paper_id}\n{body}"
+            if bib:
+                bibs.append(bib)
+        if fresh:
+            fragments.put_many(fresh)  # type: ignore[union-attr]
 
-    bibs = [str(it.get('bibtex')) for it in items if it.get('bibtex')]
     if bibs:
-        lines.append("## References (BibTeX)")
-        lines.append("```bibtex")
+        lines = ["## References (BibTeX)", "```bibtex"]
         for b in bibs:
             lines.append(b)
             if not b.endswith('\n'):
                 lines.append('')
         lines.append("```")
         lines.append("")
+        yield "\n" + "\n".join(lines)
 
-    return "\n".join(lines)
 
+def build_review_markdown(title: str, items: List['Note'], include_abstract: bool, *,
+                          fragments: Optional['FragmentCache'] = None,
+                          sections: Optional[Sequence[Tuple[str, int]]] = None) -> str:
+    return ''.join(iter_review_markdown(title, items, include_abstract, fragments=fragments, sections=sections))
 
+
+def write_review(chunks: Iterable[str], out: TextIO) -> int:
+    """Write streamed review chunks to ``out`` as they are produced; returns characters written."""
+    n = 0
+    for chunk in chunks:
+        out.write(chunk)
+        n += len(chunk)
+    return n
+
+
+@traced('review.list_tags_and_years')
 def list_all_tags_and_years() -> Tuple[List[str], List[int]]:
-    tags_set = set()
-    years_set = set()
-    for p in NOTES_DIR.glob('*.md'):
-        meta, _ = parse_front_matter(read_file(p))
-        for t in meta.get('tags') or []:
-            tags_set.add(str(t))
-        y = meta.get('year')
-        try:
-            y_int = int(y)
-            if y_int:
-                years_set.add(y_int)
-        except Exception:
-            pass
-    return sorted(tags_set), sorted(years_set)
+    from paper_notes.filters import get_filter_index
+    index = get_filter_index(NOTES_DIR)
+    return index.values('tags'), index.all_years()
+
+
+@traced('review.extract_abstracts')
+def _attach_abstracts(items: List['Note'], uploaded_pdfs: Optional[Dict[str, Path]] = None) -> None:
+    from paper_notes.pdf_cache import extract_many
+    pdf_for: Dict[int, Path] = {}
+    for i, it in enumerate(items):
+        pid = it.paper_id
+        # Prefer uploaded file bound to this paper id, fallback to local resolution
+        if uploaded_pdfs and pid in uploaded_pdfs:
+            pdf_for[i] = uploaded_pdfs[pid]
+        else:
+            local_pdf = resolve_local_pdf(it.meta)
+            if local_pdf:
+                pdf_for[i] = local_pdf
+    extracted = extract_many(pdf_for.values())
+    for i, it in enumerate(items):
+        res = extracted.get(Path(pdf_for[i])) if i in pdf_for else None
+        it.abstract = str(res['abstract']) if res else ''
+        it.extraction = res
 
 
+@traced('review.generate')
 def generate_review(title: str, filter_tags: List[str], year: Optional[int],
                     papers: List[str], include_abstract: bool,
-                    uploaded_pdfs: Optional[Dict[str, Path]] = None) -> Tuple[str, List[Dict[str, object]]]:
-    notes = find_notes(filter_tags, year, papers)
+                    uploaded_pdfs: Optional[Dict[str, Path]] = None, *, tag_expr: str = '',
+                    year_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+                    stream: bool = False,
+                    fragments: Optional['FragmentCache'] = None,
+                    group_by: str = '',
+                    notes_dir: Path = NOTES_DIR) -> Tuple[Union[str, Iterator[str]], List['Note']]:
+    """Render a review of the selected notes.
+
+    With ``stream=True`` the first element is an iterator of markdown chunks
+    (see ``iter_review_markdown``); PDFs are then extracted batch by batch as
+    the iterator is consumed, so ``extraction`` on the returned items is only
+    filled in once it has been exhausted. ``fragments`` enables incremental
+    rendering from the per-paper fragment cache. ``group_by='citations'``
+    orders and groups the papers by the citation graph
+    (``paper_notes.citations.review_sections``), ``group_by='topics'`` by
+    TF-IDF similarity (``paper_notes.clusters.topic_sections``, needs NumPy).
+    Notes are read from ``notes_dir``.
+    """
+    from paper_notes.records import list_records
+    if group_by not in ('', 'citations', 'topics'):
+        raise ValueError(f'Unknown group_by: {group_by!r}')
+    notes = find_notes(filter_tags, year, papers, tag_expr=tag_expr, year_range=year_range, notes_dir=notes_dir)
     if not notes:
-        return '', []
-    items = [load_note_info(p) for p in notes]
+        return (iter(()) if stream else ''), []
+    items = list_records(notes)
+    sections: List[Tuple[str, int]] = []
+    if group_by == 'citations':
+        from paper_notes.citations import build_graph, review_sections
+        items, sections = review_sections(items, build_graph(notes_dir))
+    elif group_by == 'topics':
+        from paper_notes.clusters import topic_sections
+        items, sections = topic_sections(items)
+    if stream:
+        prepare = (lambda batch: _attach_abstracts(batch, uploaded_pdfs)) if include_abstract else None
+        return iter_review_markdown(title, items, include_abstract, prepare=prepare, fragments=fragments,
+                                    sections=sections), items
     if include_abstract:
-        for it in items:
-            m = it['meta']  # type: ignore
-            pid = str(m.get('paper_id', ''))
-            abs_text = ''
-            # Prefer uploaded file bound to this paper id, fallback to local resolution
-            if uploaded_pdfs and pid in uploaded_pdfs:
-                abs_text = try_extract_abstract_from_pdf(uploaded_pdfs[pid])
-            else:
-                local_pdf = resolve_local_pdf(m)
-                if local_pdf:
-                    abs_text = try_extract_abstract_from_pdf(local_pdf)
-            it['abstract'] = abs_text
-    content = build_review_markdown(title, items, include_abstract=include_abstract)
+        _attach_abstracts(items, uploaded_pdfs)
+    content = build_review_markdown(title, items, include_abstract=include_abstract, fragments=fragments,
+                                    sections=sections)
     return content, items
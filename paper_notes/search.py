@@ -0,0 +1,310 @@
+"""Local BM25 full-text search over notes and cached PDF text.
+
+Each note is one document made of its body, title and tags, its TL;DR
+bullets (weighted up) and, when the note's PDF has already been extracted by
+``paper_notes.pdf_cache``, the cached abstract and first-page text.
+Tokenization is NFKC-normalized and lowercased; Latin/digit runs become
+words and Japanese (kana/kanji) runs become character bigrams, so mixed
+Japanese headings and English text are both searchable without a morphological
+analyzer.
+
+The index lives in memory as ``term -> {doc_id: tf}`` postings, is pickled to
+``data/cache/search_index.pkl`` and refreshed incrementally from note
+(mtime, size) fingerprints.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from paper_notes.index import scan_fingerprints
+from paper_notes.note_parser import ParsedNote
+from paper_notes.pdf_cache import CACHE_PATH, connect as connect_pdf_cache, extraction_count, lookup_cached
+from paper_notes.review import (
+    NOTES_DIR,
+    parse_front_matter,
+    read_file,
+    resolve_local_pdf,
+)
+
+SEARCH_INDEX_PATH = Path('data') / 'cache' / 'search_index.pkl'
+INDEX_VERSION = 1
+TITLE_WEIGHT = 3
+TLDR_WEIGHT = 2
+PARALLEL_THRESHOLD = 2000
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile('[0-9a-z]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in into is it its of on or that the their this to was were '
+    'we with which our not can'.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    words = _TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower())
+    out = [w for w in words if w[0] < '\u3040' and (len(w) > 1 or w.isdigit()) and w not in STOPWORDS]
+    for w in words:
+        if w[0] >= '\u3040':
+            if len(w) == 1:
+                out.append(w)
+            else:
+                out.extend([w[i:i + 2] for i in range(len(w) - 1)])
+    return out
+
+
+def _pdf_text(meta: Dict[str, object], conn: Optional[sqlite3.Connection]) -> Tuple[str, str]:
+    """Return (sha256, text) of the note's PDF if it is already in the extraction cache."""
+    if conn is None:
+        return '', ''
+    pid = str(meta.get('paper_id', ''))
+    candidates = [resolve_local_pdf(meta), Path('data') / 'uploads' / f'{pid}.pdf' if pid else None]
+    for pdf in candidates:
+        if pdf is None:
+            continue
+        hit = lookup_cached(pdf, conn=conn)
+        if hit:
+            return hit['sha256'], f"{hit['abstract']}\n{hit['first_page']}"
+    return '', ''
+
+
+def _document(path: Path, conn: Optional[sqlite3.Connection]) -> Tuple[str, str, Counter]:
+    """Return (paper_id, pdf_sha, weighted term counts) for a note."""
+    note = ParsedNote(read_file(path))
+    meta = note.meta
+    sha, pdf_text = _pdf_text(meta, conn)
+    terms = Counter(tokenize(note.body))
+    terms.update(tokenize(pdf_text))
+    tags = meta.get('tags') or []
+    terms.update(tokenize(' '.join(str(t) for t in tags) if isinstance(tags, list) else str(tags)))
+    for t in tokenize(str(meta.get('title', ''))):
+        terms[t] += TITLE_WEIGHT
+    # TL;DR bullets are already counted once as part of the body
+    for t in tokenize(' '.join(note.tldr)):
+        terms[t] += TLDR_WEIGHT - 1
+    return str(meta.get('paper_id', '') or path.stem), sha, terms
+
+
+def _documents(notes_dir: str, names: List[str],
+               conn: Optional[sqlite3.Connection]) -> List[Tuple[str, str, str, Counter]]:
+    out = []
+    for name in names:
+        paper_id, sha, terms = _document(Path(notes_dir) / name, conn)
+        out.append((name, paper_id, sha, terms))
+    return out
+
+
+def _documents_worker(notes_dir: str, names: List[str], use_pdf_cache: bool) -> List[Tuple[str, str, str, Counter]]:
+    conn = connect_pdf_cache(CACHE_PATH) if use_pdf_cache else None
+    try:
+        return _documents(notes_dir, names, conn)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+class SearchIndex:
+    def __init__(self) -> None:
+        self.version = INDEX_VERSION
+        self.names: List[Optional[str]] = []
+        self.paper_ids: List[str] = []
+        self.lengths: List[int] = []
+        self.ids: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.fingerprints: Dict[str, Tuple[int, int, str]] = {}
+        self.total_len = 0
+        self.pdf_generation = -1
+        self._norms: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getstate__(self) -> Dict[str, object]:
+        state = dict(self.__dict__)
+        state['_norms'] = None
+        return state
+
+    def add(self, name: str, paper_id: str, terms: Counter) -> None:
+        if name in self.ids:
+            self.remove(name)
+        if self.free:
+            doc = self.free.pop()
+            self.names[doc], self.paper_ids[doc] = name, paper_id
+        else:
+            doc = len(self.names)
+            self.names.append(name)
+            self.paper_ids.append(paper_id)
+            self.lengths.append(0)
+        self.ids[name] = doc
+        length = sum(terms.values())
+        self.lengths[doc] = length
+        self.total_len += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc] = tf
+        self.doc_terms[doc] = tuple(terms)
+        self._norms = None
+
+    def remove(self, name: str) -> None:
+        doc = self.ids.pop(name, None)
+        if doc is None:
+            return
+        for term in self.doc_terms.pop(doc, ()):
+            post = self.postings.get(term)
+            if post is not None:
+                post.pop(doc, None)
+                if not post:
+                    del self.postings[term]
+        self.total_len -= self.lengths[doc]
+        self.lengths[doc] = 0
+        self.names[doc] = None
+        self.free.append(doc)
+        self.fingerprints.pop(name, None)
+        self._norms = None
+
+    def norms(self) -> List[float]:
+        if self._norms is None:
+            avgdl = (self.total_len / len(self.ids)) if self.ids else 1.0
+            self._norms = [K1 * (1 - B + B * dl / avgdl) for dl in self.lengths]
+        return self._norms
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, str, float]]:
+        """Return up to ``k`` (note name, paper_id, score) by BM25, best first."""
+        n = len(self.ids)
+        if not n:
+            return []
+        norms = self.norms()
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term, qtf in Counter(tokenize(query)).items():
+            post = self.postings.get(term)
+            if not post:
+                continue
+            idf = math.log(1 + (n - len(post) + 0.5) / (len(post) + 0.5)) * qtf
+            for doc, tf in post.items():
+                scores[doc] = get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norms[doc])
+        top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        return [(self.names[doc], self.paper_ids[doc], score) for doc, score in top]  # type: ignore[misc]
+
+    def refresh(self, notes_dir: Path = NOTES_DIR) -> int:
+        """Re-index changed notes; returns the number of documents touched."""
+        on_disk = scan_fingerprints(notes_dir)
+        touched = 0
+        for name in [n for n in self.ids if n not in on_disk]:
+            self.remove(name)
+            touched += 1
+        pdf_gen = extraction_count()
+        recheck_pdfs = pdf_gen != self.pdf_generation
+        conn = connect_pdf_cache(CACHE_PATH) if pdf_gen else None
+        todo: List[str] = []
+        try:
+            for name, fp in on_disk.items():
+                prev = self.fingerprints.get(name)
+                if prev and prev[:2] == fp:
+                    # Unchanged note: only pick up PDF text that was extracted since the last refresh.
+                    if prev[2] or not recheck_pdfs:
+                        continue
+                    meta, _ = parse_front_matter(read_file(notes_dir / name))
+                    if not _pdf_text(meta, conn)[0]:
+                        continue
+                todo.append(name)
+            if len(todo) < PARALLEL_THRESHOLD or (os.cpu_count() or 1) < 2:
+                docs = _documents(str(notes_dir), todo, conn)
+            else:
+                docs = []
+                chunks = [todo[i:i + 1000] for i in range(0, len(todo), 1000)]
+                with ProcessPoolExecutor() as pool:
+                    for part in pool.map(_documents_worker, [str(notes_dir)] * len(chunks), chunks,
+                                         [bool(pdf_gen)] * len(chunks)):
+                        docs.extend(part)
+        finally:
+            if conn is not None:
+                conn.close()
+        for name, paper_id, sha, terms in docs:
+            self.add(name, paper_id, terms)
+            self.fingerprints[name] = on_disk[name] + (sha,)
+            touched += 1
+        self.pdf_generation = pdf_gen
+        return touched
+
+
+def load_index(path: Path = SEARCH_INDEX_PATH) -> SearchIndex:
+    try:
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+        if isinstance(index, SearchIndex) and getattr(index, 'version', None) == INDEX_VERSION:
+            return index
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+    return SearchIndex()
+
+
+def save_index(index: SearchIndex, path: Path = SEARCH_INDEX_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+_CACHE: Dict[str, SearchIndex] = {}
+_LOCK = threading.Lock()
+
+
+def get_search_index(notes_dir: Path = NOTES_DIR, path: Path = SEARCH_INDEX_PATH,
+                     rebuild: bool = False) -> SearchIndex:
+    """Return the process-wide search index, refreshed against ``notes_dir``."""
+    key = f'{notes_dir}|{path}'
+    with _LOCK:
+        index = None if rebuild else (_CACHE.get(key) or load_index(path))
+        if index is None:
+            index = SearchIndex()
+        if index.refresh(notes_dir) or rebuild:
+            save_index(index, path)
+        _CACHE[key] = index
+        return index
+
+
+def _snippet(path: Path, terms: List[str], width: int = 160) -> str:
+    try:
+        text = read_file(path)
+    except OSError:
+        return ''
+    _, offset = parse_front_matter(text)
+    body = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text[offset:]))
+    low = body.lower()
+    hits = [i for i in (low.find(t) for t in terms) if i >= 0]
+    start = max(0, min(hits) - width // 3) if hits else 0
+    return body[start:start + width].strip()
+
+
+def search(query: str, k: int = 10, notes_dir: Path = NOTES_DIR,
+           index: Optional[SearchIndex] = None) -> List[Dict[str, object]]:
+    """BM25 search; returns dicts with name, path, paper_id, score and snippet.
+
+    Pass an already refreshed ``index`` to skip the notes-directory scan.
+    """
+    if index is None:
+        index = get_search_index(notes_dir)
+    terms = tokenize(query)
+    out: List[Dict[str, object]] = []
+    for name, pid, score in index.search(query, k):
+        path = notes_dir / name
+        out.append({'name': name, 'path': path, 'paper_id': pid, 'score': score,
+                    'snippet': _snippet(path, terms)})
+    return out
@@ -0,0 +1,255 @@
+"""Bulk OneDrive/SharePoint share-link resolution through Microsoft Graph.
+
+For every manifest row whose ``one_drive_path`` (relative to
+``ONEDRIVE_PAPERS_ROOT``) has no usable ``share_link``, the drive item is
+looked up (it must exist and be a PDF) and an organization-scoped view link
+is created. With ``verify``, rows that already have a link are checked
+through ``/shares/{id}/driveItem`` and re-linked if the item is gone. New
+links are written to the manifest in one upsert (so later runs skip those
+rows) and copied into notes whose ``pdf_link`` is still empty.
+
+All requests go through one ``GraphClient``: an ``httpx.AsyncClient`` with
+a bounded connection pool when httpx is installed (urllib in worker threads
+otherwise), at most ``concurrency`` requests in flight, and exponential
+backoff with jitter on throttling (honouring ``Retry-After``), 5xx and
+network errors. ``GRAPH_BASE_URL`` points the client at another server, e.g.
+``python -m scripts.mock_graph`` for local testing.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from paper_notes.trace import count, traced
+
+GRAPH_BASE_URL = 'https://graph.microsoft.com/v1.0'
+DRIVE = 'me/drive'
+CONCURRENCY = 16
+MAX_ATTEMPTS = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+TIMEOUT = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+LINK_TYPE = 'view'
+LINK_SCOPE = 'organization'
+
+
+class GraphError(Exception):
+    def __init__(self, status: Optional[int], message: str) -> None:
+        super().__init__(f'{status or "network"}: {message}')
+        self.status = status
+
+
+def usable_link(link: str) -> bool:
+    """False for empty links and template placeholders such as ``https://{org}.sharepoint.com/:b:/s/...``."""
+    link = (link or '').strip()
+    return link.startswith(('http://', 'https://')) and '{' not in link and '...' not in link
+
+
+def share_id(url: str) -> str:
+    """Graph sharing token for ``url`` (``u!`` + unpadded base64url)."""
+    return 'u!' + base64.urlsafe_b64encode(url.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _is_pdf(item: Dict[str, object]) -> bool:
+    mime = str((item.get('file') or {}).get('mimeType', ''))  # type: ignore[union-attr]
+    return mime == 'application/pdf' or str(item.get('name', '')).lower().endswith('.pdf')
+
+
+class GraphClient:
+    """Minimal async Graph client; use as ``async with GraphClient(token) as client``."""
+
+    def __init__(self, token: str, *, base_url: Optional[str] = None, drive: Optional[str] = None,
+                 concurrency: int = CONCURRENCY, max_attempts: int = MAX_ATTEMPTS, backoff: float = BACKOFF,
+                 timeout: float = TIMEOUT) -> None:
+        self.base_url = (base_url or os.getenv('GRAPH_BASE_URL') or GRAPH_BASE_URL).rstrip('/')
+        self.drive = (drive or os.getenv('GRAPH_DRIVE') or DRIVE).strip('/')
+        self.headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/json'}
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self._sem = asyncio.Semaphore(concurrency)
+        self._http = None
+
+    async def __aenter__(self) -> 'GraphClient':
+        try:
+            import httpx  # type: ignore
+        except ImportError:
+            return self
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self._http = httpx.AsyncClient(headers=self.headers, limits=limits, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _send(self, method: str, url: str, body: Optional[Dict[str, object]]) -> Tuple[Optional[int], Dict[str, str], bytes]:
+        """(status, headers, body); status is None on connection errors."""
+        if self._http is not None:
+            import httpx  # type: ignore
+            try:
+                resp = await self._http.request(method, url, json=body)
+            except httpx.HTTPError as e:
+                return None, {}, str(e).encode()
+            return resp.status_code, dict(resp.headers), resp.content
+        return await asyncio.to_thread(self._send_urllib, method, url, body)
+
+    def _send_urllib(self, method: str, url: str, body: Optional[Dict[str, object]]) -> Tuple[Optional[int], Dict[str, str], bytes]:
+        import urllib.error
+        import urllib.request
+        data = json.dumps(body).encode() if body is not None else None
+        headers = dict(self.headers, **({'Content-Type': 'application/json'} if data else {}))
+        req = urllib.request.Request(url, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, dict(resp.headers), resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers), e.read()
+        except OSError as e:
+            return None, {}, str(e).encode()
+
+    def _delay(self, attempt: int, headers: Dict[str, str]) -> float:
+        retry_after = headers.get('Retry-After') or headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(MAX_BACKOFF, float(retry_after))
+            except ValueError:
+                pass
+        return min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    async def request(self, method: str, path: str, body: Optional[Dict[str, object]] = None) -> Dict[str, object]:
+        """JSON response of ``method path``; retries throttling, 5xx and network errors with backoff."""
+        url = f'{self.base_url}/{path.lstrip("/")}'
+        for attempt in range(1, self.max_attempts + 1):
+            async with self._sem:
+                status, headers, raw = await self._send(method, url, body)
+            count('graph_requests')
+            if status is not None and status < 400:
+                return json.loads(raw) if raw else {}
+            if (status is not None and status not in RETRY_STATUSES) or attempt == self.max_attempts:
+                try:
+                    message = json.loads(raw)['error']['message']
+                except (ValueError, KeyError, TypeError):
+                    message = raw[:200].decode('utf-8', 'replace')
+                raise GraphError(status, message)
+            count('graph_retries')
+            # Sleep outside the semaphore so a backing-off request does not hold a slot.
+            await asyncio.sleep(self._delay(attempt, headers))
+        raise AssertionError('unreachable')
+
+    def _item_path(self, drive_path: str) -> str:
+        return f"{self.drive}/root:/{quote(drive_path.strip('/'), safe='/')}"
+
+    async def item(self, drive_path: str) -> Dict[str, object]:
+        return await self.request('GET', self._item_path(drive_path))
+
+    async def create_link(self, drive_path: str, link_type: str = LINK_TYPE, scope: str = LINK_SCOPE) -> str:
+        res = await self.request('POST', f'{self._item_path(drive_path)}:/createLink', {'type': link_type, 'scope': scope})
+        return str(res['link']['webUrl'])  # type: ignore[index]
+
+    async def shared_item(self, url: str) -> Dict[str, object]:
+        return await self.request('GET', f'shares/{share_id(url)}/driveItem')
+
+
+async def resolve_row(client: GraphClient, row: Dict[str, str], folder: str = '', verify: bool = False) -> Dict[str, str]:
+    """Resolve one manifest row; returns {paper_id, status, share_link, detail}.
+
+    Statuses: ``ok`` (existing link kept or verified), ``linked`` (new link),
+    ``local`` (file is not on the drive, e.g. an upload), ``missing``,
+    ``not_pdf`` and ``error``.
+    """
+    pid = row['paper_id']
+    link = row.get('share_link', '')
+    rel = (row.get('one_drive_path') or '').replace('\\', '/')
+
+    def result(status: str, share_link: str = link, detail: str = '') -> Dict[str, str]:
+        return {'paper_id': pid, 'status': status, 'share_link': share_link, 'detail': detail}
+
+    try:
+        if usable_link(link):
+            if not verify:
+                return result('ok')
+            try:
+                if _is_pdf(await client.shared_item(link)):
+                    return result('ok')
+            except GraphError as e:
+                if e.status not in (403, 404):
+                    raise
+        if not rel or rel.startswith('data/'):
+            return result('local')
+        drive_path = f"{folder.strip('/')}/{rel}" if folder.strip('/') else rel
+        try:
+            item = await client.item(drive_path)
+        except GraphError as e:
+            if e.status == 404:
+                return result('missing', detail=drive_path)
+            raise
+        if not _is_pdf(item):
+            return result('not_pdf', detail=drive_path)
+        return result('linked', await client.create_link(drive_path))
+    except GraphError as e:
+        return result('error', detail=str(e))
+
+
+async def resolve_rows(client: GraphClient, rows: Iterable[Dict[str, str]], folder: str = '',
+                       verify: bool = False) -> List[Dict[str, str]]:
+    """Resolve ``rows`` concurrently (the client bounds requests in flight); results keep input order."""
+    return list(await asyncio.gather(*(resolve_row(client, r, folder, verify) for r in rows)))
+
+
+def _fill_pdf_links(links: Dict[str, str]) -> int:
+    """Copy new share links into notes whose ``pdf_link`` is still empty; returns notes updated."""
+    from paper_notes.review import parse_front_matter, read_file, update_note_front_matter
+    from scripts.paper_sync import note_path
+
+    updated = 0
+    for pid, link in links.items():
+        path = note_path(pid)
+        if not path.exists():
+            continue
+        meta, _ = parse_front_matter(read_file(path))
+        if usable_link(str(meta.get('pdf_link') or '')):
+            continue
+        update_note_front_matter(path, {'pdf_link': link})
+        updated += 1
+    return updated
+
+
+@traced('share_links.resolve')
+def resolve_share_links(token: str, *, verify: bool = False, paper_ids: Optional[Iterable[str]] = None,
+                        folder: Optional[str] = None, dry_run: bool = False,
+                        **client_kwargs) -> List[Dict[str, str]]:
+    """Resolve share links for the manifest (or just ``paper_ids``) and store new ones.
+
+    ``folder`` is the drive folder that ``ONEDRIVE_PAPERS_ROOT`` maps to
+    (default ``GRAPH_PAPERS_FOLDER``, else the drive root). Rows that already
+    have a usable link are skipped unless ``verify`` is set. With
+    ``dry_run`` nothing is written. Returns one result per processed row.
+    """
+    from scripts.paper_sync import load_manifest, upsert_manifest
+
+    manifest = load_manifest()
+    wanted = set(paper_ids) if paper_ids is not None else None
+    rows = [manifest[pid] for pid in manifest if wanted is None or pid in wanted]
+    if not verify:
+        rows = [r for r in rows if not usable_link(r.get('share_link', ''))]
+    folder = folder if folder is not None else os.getenv('GRAPH_PAPERS_FOLDER', '')
+
+    async def run() -> List[Dict[str, str]]:
+        async with GraphClient(token, **client_kwargs) as client:
+            return await resolve_rows(client, rows, folder, verify)
+
+    results = asyncio.run(run()) if rows else []
+    count('rows', len(rows))
+    links = {r['paper_id']: r['share_link'] for r in results if r['status'] == 'linked'}
+    if links and not dry_run:
+        upsert_manifest([{'paper_id': pid, 'share_link': link} for pid, link in links.items()])
+        count('notes_updated', _fill_pdf_links(links))
+    return results
@@ -0,0 +1,189 @@
+"""Lightweight tracing: timed spans with counters, exportable as Chrome traces.
+
+Spans are only recorded while a ``Tracer`` is active in the current context
+(``with collect() as tracer:`` or ``start()``/``stop()``); otherwise
+``span``/``traced`` cost one context-variable lookup. Generator functions
+are timed by the time spent inside the generator, not by how long the
+consumer keeps it open. Work done in thread/process pools is attributed to
+the span that submitted it.
+
+``Tracer.to_chrome_trace()`` produces the Trace Event format understood by
+``chrome://tracing`` and Perfetto.
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+_TRACER: ContextVar[Optional['Tracer']] = ContextVar('paper_notes_tracer', default=None)
+_PARENT: ContextVar[Optional['Span']] = ContextVar('paper_notes_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'parent', 'depth', 'thread', 'attrs', 'counters')
+
+    def __init__(self, name: str, start: float, parent: Optional['Span'], attrs: Dict[str, object]) -> None:
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.thread = threading.get_ident()
+        self.attrs = attrs
+        self.counters: Dict[str, float] = {}
+
+    def count(self, key: str, n: float = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + n
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> List[Dict[str, object]]:
+        """Per span name: calls, total and self seconds (total minus child spans), largest first."""
+        by_name: Dict[str, Dict[str, object]] = {}
+        child_time: Dict[int, float] = {}
+        for s in self.spans:
+            if s.parent is not None:
+                child_time[id(s.parent)] = child_time.get(id(s.parent), 0.0) + s.duration
+        for s in self.spans:
+            row = by_name.setdefault(s.name, {'name': s.name, 'calls': 0, 'total_s': 0.0, 'self_s': 0.0,
+                                              'counters': {}})
+            row['calls'] += 1  # type: ignore[operator]
+            row['total_s'] += s.duration  # type: ignore[operator]
+            row['self_s'] += max(0.0, s.duration - child_time.get(id(s), 0.0))  # type: ignore[operator]
+            for k, v in s.counters.items():
+                row['counters'][k] = row['counters'].get(k, 0) + v  # type: ignore[index,union-attr]
+        return sorted(by_name.values(), key=lambda r: r['total_s'], reverse=True)  # type: ignore[arg-type,return-value]
+
+    def format_summary(self, limit: int = 20) -> List[str]:
+        """Text table of ``summary()`` for CLI output."""
+        lines = [f"{'span':32} {'calls':>7} {'total ms':>10} {'self ms':>10}  counters"]
+        for row in self.summary()[:limit]:
+            counters = ', '.join(f'{k}={v:g}' for k, v in row['counters'].items())  # type: ignore[union-attr]
+            lines.append(f"{row['name']:32} {row['calls']:>7} {row['total_s'] * 1000:>10.1f} "
+                         f"{row['self_s'] * 1000:>10.1f}  {counters}")
+        return lines
+
+    def to_json(self) -> List[Dict[str, object]]:
+        return [{'name': s.name, 'start_s': s.start - self.origin, 'duration_s': s.duration, 'depth': s.depth,
+                 'thread': s.thread, 'attrs': s.attrs, 'counters': s.counters} for s in self.spans]
+
+    def to_chrome_trace(self) -> Dict[str, object]:
+        pid = os.getpid()
+        events = [{'name': s.name, 'ph': 'X', 'ts': (s.start - self.origin) * 1e6, 'dur': s.duration * 1e6,
+                   'pid': pid, 'tid': s.thread, 'args': {**{k: str(v) for k, v in s.attrs.items()}, **s.counters}}
+                  for s in sorted(self.spans, key=lambda s: s.start)]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: Path) -> None:
+        """Write a Chrome trace (``*.json``) to ``path``."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(self.to_chrome_trace()), encoding='utf-8')
+
+
+def current() -> Optional[Tracer]:
+    return _TRACER.get()
+
+
+def start() -> Token:
+    """Activate a new tracer in the current context; pass the token to ``stop``."""
+    return _TRACER.set(Tracer())
+
+
+def stop(token: Token) -> Optional[Tracer]:
+    tracer = _TRACER.get()
+    _TRACER.reset(token)
+    return tracer
+
+
+@contextmanager
+def collect() -> Iterator[Tracer]:
+    token = start()
+    try:
+        yield _TRACER.get()  # type: ignore[misc]
+    finally:
+        _TRACER.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: object) -> Iterator[Optional[Span]]:
+    tracer = _TRACER.get()
+    if tracer is None:
+        yield None
+        return
+    s = Span(name, time.perf_counter(), _PARENT.get(), attrs)
+    token = _PARENT.set(s)
+    try:
+        yield s
+    finally:
+        s.duration = time.perf_counter() - s.start
+        _PARENT.reset(token)
+        tracer.add(s)
+
+
+def count(key: str, n: float = 1) -> None:
+    """Add ``n`` to counter ``key`` on the innermost active span."""
+    s = _PARENT.get()
+    if s is not None and _TRACER.get() is not None:
+        s.count(key, n)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator recording a span per call (for generators: time spent inside them)."""
+    def decorate(fn: Callable) -> Callable:
+        label = name or f'{fn.__module__}.{fn.__qualname__}'
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                tracer = _TRACER.get()
+                if tracer is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                s = Span(label, time.perf_counter(), _PARENT.get(), {})
+                gen = fn(*args, **kwargs)
+                items = 0
+                try:
+                    while True:
+                        t0 = time.perf_counter()
+                        token = _PARENT.set(s)
+                        try:
+                            item = next(gen)
+                        except StopIteration:
+                            return
+                        finally:
+                            _PARENT.reset(token)
+                            s.duration += time.perf_counter() - t0
+                        items += 1
+                        if items == 1:
+                            s.count('first_item_s', time.perf_counter() - s.start)
+                        yield item
+                finally:
+                    gen.close()
+                    s.count('items', items)
+                    tracer.add(s)
+            return gen_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _TRACER.get() is None:
+                return fn(*args, **kwargs)
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
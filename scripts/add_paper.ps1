@@ -6,4 +6,6 @@ if (-not $PdfPath) {
 }
 
 $env:ONEDRIVE_PAPERS_ROOT = Split-Path $PdfPath -Parent
-python "$PSScriptRoot/paper_sync.py"
+Push-Location (Split-Path $PSScriptRoot -Parent)
+python -m scripts.paper_sync
+Pop-Location
@@ -0,0 +1,491 @@
+import argparse
+import gc
+import json
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import closing
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from paper_notes.index import connect, refresh_index
+from paper_notes.note_parser import clear_cache, parse_note
+from paper_notes.records import list_records
+from paper_notes.review import parse_front_matter, parse_tldr_bullets, read_file
+
+SECTIONS = ['## Contribution', '## Method', '## Results / Limits', '## For my work', '## Quotes']
+WORDS = ('agent debate model safety retrieval benchmark dataset evaluation transformer policy reward '
+         'alignment graph training inference latency 実験 評価 手法 提案 課題').split()
+
+
+def write_pdf(path: Path, title: str, abstract: str, pages: int = 1) -> None:
+    """Write a minimal PDF (Helvetica text, /Info title) that pypdf can read.
+
+    Page 1 holds the title and abstract; extra ``pages`` are filled with body text.
+    """
+    def esc(t: str) -> str:
+        return t.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    def stream(lines: List[str]) -> str:
+        content = 'BT /F1 11 Tf 14 TL 72 720 Td ' + ' '.join(f"({esc(line)}) '" for line in lines) + ' ET'
+        return f'<< /Length {len(content)} >>\nstream\n{content}\nendstream'
+
+    words = f'Abstract: {abstract}'.split()
+    page_lines = [[title, ''] + [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]]
+    for n in range(1, pages):
+        rng = random.Random(f'{title}-{n}')
+        page_lines.append([' '.join(rng.choices(WORDS[:16], k=12)) for _ in range(45)])
+    # 1 catalog, 2 pages, 3 font, 4 info, then (page, contents) pairs
+    kids = ' '.join(f'{5 + 2 * i} 0 R' for i in range(pages))
+    objs = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {pages} >>',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        f'<< /Title ({esc(title)}) >>',
+    ]
+    for i, lines in enumerate(page_lines):
+        objs.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> '
+                    f'/Contents {6 + 2 * i} 0 R >>')
+        objs.append(stream(lines))
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f'{i} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref = len(out)
+    out += f'xref\n0 {len(objs) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    out += ''.join(f'{o:010d} 00000 n \n' for o in offsets).encode('latin-1')
+    out += f'trailer\n<< /Size {len(objs) + 1} /Root 1 0 R /Info 4 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(out))
+
+
+def write_corpus(root: Path, n: int, seed: int = 0, pdf_root: Optional[Path] = None,
+                 pdf_every: int = 0) -> List[Path]:
+    """Write ``n`` synthetic notes shaped like ``notes/*.md`` under ``root``.
+
+    With ``pdf_root``, every ``pdf_every``-th note gets a synthetic PDF under
+    ``pdf_root/<year>/`` referenced by its ``local_hint``.
+    """
+    rnd = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n):
+        pid = f'{2015 + i % 11}-bench-{i:06d}'
+        tags = rnd.sample(WORDS[:12], 3)
+        lines = [
+            '---',
+            f'paper_id: {pid}',
+            f'title: "Synthetic paper {i}"',
+            f'year: {2015 + i % 11}',
+            f'tags: [{", ".join(tags)}]',
+        ]
+        if pdf_root is not None and pdf_every and i % pdf_every == 0:
+            pdf = pdf_root / str(2015 + i % 11) / f'{pid}.pdf'
+            write_pdf(pdf, f'Synthetic paper {i}', ' '.join(rnd.choices(WORDS[:16], k=120)))
+            lines.append(f'local_hint: {pdf.as_posix()}')
+        lines += ['---', '## TL;DR（3行）']
+        lines += ['- ' + ' '.join(rnd.choices(WORDS, k=12)) for _ in range(3)]
+        for sec in SECTIONS:
+            lines += ['', sec] + [' '.join(rnd.choices(WORDS, k=20)) for _ in range(rnd.randint(2, 8))]
+        lines += ['', '## BibTeX', '```bibtex', f'@article{{{pid}, title={{Synthetic paper {i}}}}}', '```', '']
+        p = root / f'{pid}.md'
+        p.write_text('\n'.join(lines), encoding='utf-8')
+        paths.append(p)
+    return paths
+
+
+def _legacy_section(text: str, heading: str) -> str:
+    pattern = re.compile(rf"^\s*{re.escape(heading)}\s*$", re.MULTILINE)
+    m = pattern.search(text)
+    if not m:
+        return ''
+    start = m.end()
+    next_heading = re.search(r"^\s*##\s+|^\s*#\s+", text[start:], re.MULTILINE)
+    end = start + next_heading.start() if next_heading else len(text)
+    return text[start:end].strip('\n')
+
+
+def legacy_parse(p: Path) -> object:
+    """The pre-parser ``load_note_info`` path plus one regex scan per section."""
+    text = read_file(p)
+    meta, _ = parse_front_matter(text)
+    tldr = parse_tldr_bullets(_legacy_section(text, '## TL;DR（3行）'))
+    sec = _legacy_section(text, '## BibTeX')
+    m = re.search(r"```[a-zA-Z]*\n(.*?)\n```", sec, re.DOTALL)
+    sections = [_legacy_section(text, s) for s in SECTIONS]
+    return meta, tldr, m.group(1) if m else '', sections
+
+
+def single_pass_parse(p: Path) -> object:
+    note = parse_note(p)
+    return note.meta, note.tldr, note.bibtex, [note.section(s) for s in SECTIONS]
+
+
+def _rate(fn: Callable[[Path], object], paths: List[Path]) -> float:
+    t0 = time.perf_counter()
+    for p in paths:
+        fn(p)
+    return len(paths) / max(time.perf_counter() - t0, 1e-9)
+
+
+def bench_parse(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sorted(Path(args.notes_dir).glob('*.md')) if args.notes_dir else write_corpus(Path(tmp), args.n)
+        for p in paths[:200]:
+            assert legacy_parse(p) == single_pass_parse(p), p
+        clear_cache()
+        legacy = _rate(legacy_parse, paths)
+        cold = _rate(single_pass_parse, paths)
+        warm = _rate(single_pass_parse, paths)
+    print(f'{len(paths)} note(s), notes/second:')
+    print(f'  regex per section : {legacy:10.0f}')
+    print(f'  single pass (cold): {cold:10.0f}  ({cold / legacy:.1f}x)')
+    print(f'  single pass (warm): {warm:10.0f}  ({warm / legacy:.1f}x)')
+
+
+def legacy_note_info(p: Path) -> dict:
+    """The pre-record ``load_note_info`` dict (metadata, TL;DR, BibTeX and full body)."""
+    text = read_file(p)
+    meta, _ = parse_front_matter(text)
+    sec = _legacy_section(text, '## BibTeX')
+    m = re.search(r"```[a-zA-Z]*\n(.*?)\n```", sec, re.DOTALL)
+    return {'path': str(p), 'meta': meta, 'tldr': parse_tldr_bullets(_legacy_section(text, '## TL;DR（3行）')),
+            'bibtex': m.group(1).strip() if m else '', 'body': text}
+
+
+def _retained(build: Callable[[], object]) -> Tuple[object, int, int, float]:
+    """Build an object; return it with the bytes it retains, the peak while building and the seconds taken."""
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    obj = build()
+    seconds = time.perf_counter() - t0
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, peak, seconds
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        paths = write_corpus(root / 'notes', args.n)
+        db = root / 'index.sqlite'
+        with closing(connect(db)) as conn:
+            refresh_index(conn, root / 'notes')
+        clear_cache()
+        rows = []
+        for name, build in [('dict per note (body loaded)', lambda: [legacy_note_info(p) for p in paths]),
+                            ('PaperRecord (lazy body)', lambda: list_records(paths, db_path=db))]:
+            obj, current, peak, seconds = _retained(build)
+            rows.append((name, current, peak, seconds))
+            del obj
+    print(f'{args.n} note(s):')
+    for name, current, peak, seconds in rows:
+        print(f'  {name:28s} retained {current / 2**20:8.1f} MiB ({current / args.n:6.0f} B/note), '
+              f'peak {peak / 2**20:8.1f} MiB, {seconds:6.2f} s')
+
+
+# -- pipeline suite ----------------------------------------------------------
+#
+# Each (corpus size, case) runs in a fresh interpreter inside a synthetic
+# workspace (notes/, papers/, data/cache/), so peak RSS and the open() count
+# from an audit hook belong to that case alone. Disk caches left by corpus
+# preparation are warm unless the case's setup clears them.
+
+CASE_ORDER = [
+    'find_notes', 'list_all_tags_and_years', 'load_note_info', 'generate_review',
+    'generate_review_abstracts', 'generate_review_abstracts_cached', 'build_context_from_docs',
+    'paper_sync_full', 'paper_sync_incremental',
+]
+# Cases delete caches and the manifest relative to the current directory, so
+# they only run where prepare_workspace has left this marker.
+WORKSPACE_MARKER = '.benchmark-workspace'
+
+
+def _rm(*paths: str) -> None:
+    import shutil
+    for p in map(Path, paths):
+        if p.is_dir():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            p.unlink(missing_ok=True)
+
+
+def _case(name: str) -> Tuple[Optional[Callable[[], object]], Callable[[], int]]:
+    """(untimed setup, timed run returning an operation count) for a suite case."""
+    from paper_notes import review
+
+    if name == 'find_notes':
+        return None, lambda: len(review.find_notes(['agent'], None, [], year_range=(2018, 2022)))
+    if name == 'list_all_tags_and_years':
+        return None, lambda: len(review.list_all_tags_and_years()[0])
+    if name == 'load_note_info':
+        return None, lambda: len([review.load_note_info(p) for p in review.find_notes([], None, [])])
+    if name.startswith('generate_review'):
+        abstracts = name != 'generate_review'
+        setup: Optional[Callable[[], object]] = None
+        if name == 'generate_review_abstracts':
+            setup = partial(_rm, 'data/cache/pdf_extract.sqlite')
+        elif name == 'generate_review_abstracts_cached':
+            setup = partial(review.generate_review, 'Bench', ['agent'], None, [], True)
+        return setup, lambda: len(review.generate_review('Bench', ['agent'], None, [], abstracts)[1])
+    if name == 'build_context_from_docs':
+        def run() -> int:
+            from ai.rag import build_context_from_docs
+            docs = [(it.paper_id, it.body, 1.0) for it in list_records(review.find_notes([], None, [])[:500])]
+            build_context_from_docs(docs, top_k=8, prompt='multi-agent debate safety evaluation')
+            return len(docs)
+        return (lambda: _rm('data/cache/embeddings.sqlite', 'data/cache/chroma')), run
+    if name.startswith('paper_sync'):
+        from scripts import paper_sync
+
+        def run() -> int:
+            return paper_sync.sync('papers', full=name == 'paper_sync_full')['pdfs']
+        if name == 'paper_sync_full':
+            return (lambda: _rm('data/cache/sync_journal.json', 'data/manifest.csv')), run
+        return (lambda: paper_sync.sync('papers')), run
+    raise SystemExit(f'Unknown case: {name}')
+
+
+def _peak_rss_kb() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 if sys.platform == 'darwin' else 1  # macOS reports bytes
+    return max(self_kb, child_kb) // scale
+
+
+def run_case(args: argparse.Namespace) -> None:
+    """Hidden subcommand: run one case in the current workspace and print a JSON result."""
+    import contextlib
+    import io
+
+    if not Path(WORKSPACE_MARKER).exists():
+        raise SystemExit(f'_case only runs inside a benchmark workspace ({WORKSPACE_MARKER} not found in '
+                         f'{Path.cwd()}); use the suite subcommand')
+    setup, run = _case(args.name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if setup is not None:
+            setup()
+            # Setup may warm in-process caches; only disk state should carry over.
+            from paper_notes import filters
+            filters._CACHE.clear()
+            clear_cache()
+    opened = [0]
+    counting = [False]
+
+    def hook(event: str, _args: tuple) -> None:
+        if counting[0] and event in ('open', 'sqlite3.connect'):
+            opened[0] += 1
+
+    sys.addaudithook(hook)
+    with contextlib.redirect_stdout(io.StringIO()):
+        counting[0] = True
+        t0 = time.perf_counter()
+        ops = run()
+        seconds = time.perf_counter() - t0
+        counting[0] = False
+    print(json.dumps({'seconds': seconds, 'peak_rss_kb': _peak_rss_kb(), 'files_opened': opened[0], 'ops': ops}))
+
+
+def prepare_workspace(root: Path, n: int, pdf_every: int) -> Path:
+    ws = root / f'corpus-{n}'
+    ws.mkdir(parents=True, exist_ok=True)
+    (ws / WORKSPACE_MARKER).touch()
+    if not (ws / 'notes').exists():
+        print(f'Preparing {n} notes in {ws} ...', file=sys.stderr)
+        write_corpus(ws / 'notes', n, pdf_root=ws / 'papers', pdf_every=pdf_every)
+        _run_in(ws, ['_case', 'find_notes'])  # build the notes index once
+    return ws
+
+
+def _run_in(ws: Path, argv: List[str]) -> Dict[str, object]:
+    import os
+    import subprocess
+
+    repo = Path(__file__).resolve().parent.parent
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(repo), os.environ.get('PYTHONPATH', '')])))
+    proc = subprocess.run([sys.executable, '-m', 'scripts.benchmark'] + argv, cwd=ws, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'{" ".join(argv)} failed:\n{proc.stderr}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit() -> str:
+    import subprocess
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parent.parent)
+        return out.stdout.strip()
+    except OSError:
+        return ''
+
+
+def bench_suite(args: argparse.Namespace) -> None:
+    import os
+    import platform
+
+    cases = args.cases or CASE_ORDER
+    root_ctx = tempfile.TemporaryDirectory() if not args.workdir else None
+    root = Path(args.workdir or root_ctx.name)  # type: ignore[union-attr]
+    results = []
+    try:
+        for n in args.sizes:
+            ws = prepare_workspace(root, n, args.pdf_every)
+            for case in cases:
+                runs = [_run_in(ws, ['_case', case]) for _ in range(args.repeat)]
+                best = min(runs, key=lambda r: r['seconds'])
+                row = {'size': n, 'case': case, **best}
+                results.append(row)
+                rss = f"{row['peak_rss_kb'] / 1024:7.1f} MiB" if row['peak_rss_kb'] else '      n/a'
+                print(f"{n:>7} {case:34s} {row['seconds']:9.3f} s  {rss}  {row['files_opened']:>7} opened  "
+                      f"{row['ops']:>7} ops", file=sys.stderr)
+    finally:
+        if root_ctx is not None:
+            root_ctx.cleanup()
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.json:
+        Path(args.json).write_text(text + '\n', encoding='utf-8')
+        print(f'Wrote {args.json}', file=sys.stderr)
+    else:
+        print(text)
+
+
+def compare_reports(base: Dict[str, object], head: Dict[str, object], threshold: float,
+                    min_seconds: float = 0.005) -> Tuple[List[str], int]:
+    """Render a comparison table; returns (lines, regression count)."""
+    old = {(r['size'], r['case']): r for r in base['results']}  # type: ignore[index]
+    lines = [f"{'size':>7} {'case':34s} {'base s':>9} {'head s':>9} {'ratio':>6}  flags"]
+    regressions = 0
+    for r in head['results']:  # type: ignore[index]
+        b = old.get((r['size'], r['case']))
+        if b is None:
+            lines.append(f"{r['size']:>7} {r['case']:34s} {'-':>9} {r['seconds']:9.3f}      -  new")
+            continue
+        ratio = r['seconds'] / max(b['seconds'], 1e-9)
+        flags = []
+        if ratio > 1 + threshold and r['seconds'] - b['seconds'] > min_seconds:
+            flags.append('SLOWER')
+        if b['peak_rss_kb'] and r['peak_rss_kb'] and r['peak_rss_kb'] > b['peak_rss_kb'] * (1 + threshold):
+            flags.append('MORE MEMORY')
+        if r['files_opened'] > b['files_opened'] * (1 + threshold) and r['files_opened'] - b['files_opened'] > 1:
+            flags.append('MORE FILES')
+        if ratio < 1 - threshold and b['seconds'] - r['seconds'] > min_seconds:
+            flags.append('faster')
+        regressions += sum(f.isupper() for f in flags)
+        lines.append(f"{r['size']:>7} {r['case']:34s} {b['seconds']:9.3f} {r['seconds']:9.3f} {ratio:6.2f}  "
+                     + ', '.join(flags))
+    return lines, regressions
+
+
+def bench_compare(args: argparse.Namespace) -> None:
+    base = json.loads(Path(args.base).read_text(encoding='utf-8'))
+    head = json.loads(Path(args.head).read_text(encoding='utf-8'))
+    print(f"base {base.get('commit') or args.base} vs head {head.get('commit') or args.head} "
+          f'(threshold {args.threshold:.0%})')
+    lines, regressions = compare_reports(base, head, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        raise SystemExit(f'{regressions} regression(s)')
+
+
+def legacy_pdf_extract(p: Path, max_pages: int) -> object:
+    """The pre-``pdf_text`` upload path: one reader for the abstract, another for metadata."""
+    from pypdf import PdfReader  # type: ignore
+
+    from paper_notes.review import abstract_from_text, metadata_from_reader
+
+    reader = PdfReader(str(p))
+    text = ''
+    for i in range(min(max_pages, len(reader.pages))):
+        text += reader.pages[i].extract_text() or ''
+    abstract = abstract_from_text(text)
+    reader = PdfReader(str(p))
+    first = reader.pages[0].extract_text() or ''
+    return metadata_from_reader(reader, first), abstract, first
+
+
+def bench_pdf(args: argparse.Namespace) -> None:
+    from paper_notes.pdf_text import scan_pdf
+
+    def single_pass(p: Path) -> object:
+        r = scan_pdf(p, args.max_pages)
+        pages_read[0] += int(r['pages_read'])  # type: ignore[call-overload]
+        return r['metadata'], r['abstract'], r['first_page']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = random.Random(0)
+        paths = []
+        for i in range(args.n):
+            p = Path(tmp) / f'{i:05d}.pdf'
+            # PDF text here is latin-1 only; short abstracts force reading a second page
+            abstract = ' '.join(rng.choices(WORDS[:16], k=rng.choice([12, 160])))
+            write_pdf(p, f'Paper {i} on {rng.choice(WORDS[:16])} {rng.choice(WORDS[:16])}', abstract, pages=args.pages)
+            paths.append(p)
+        pages_read = [0]
+        for p in paths[:50]:
+            assert legacy_pdf_extract(p, args.max_pages) == single_pass(p), p
+        pages_read = [0]
+        legacy = _rate(lambda p: legacy_pdf_extract(p, args.max_pages), paths)
+        single = _rate(single_pass, paths)
+    legacy_pages = len(paths) * (min(args.max_pages, args.pages) + 1)
+    print(f'{len(paths)} PDF(s) of {args.pages} page(s), max_pages={args.max_pages}, PDFs/second:')
+    print(f'  two readers, all pages : {legacy:8.1f}  ({legacy_pages} page extractions)')
+    print(f'  one reader, early stop : {single:8.1f}  ({pages_read[0]} page extractions, {single / legacy:.1f}x)')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Micro-benchmarks for paper_notes.')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('parse', help='Note parse throughput: regex section scans vs the single-pass parser')
+    p.add_argument('-n', type=int, default=2000, help='Synthetic notes to generate')
+    p.add_argument('--notes-dir', default='', help='Benchmark an existing notes directory instead')
+    p.set_defaults(func=bench_parse)
+    m = sub.add_parser('memory', help='Memory held by listing notes: dicts with bodies vs PaperRecord')
+    m.add_argument('-n', type=int, default=10000, help='Synthetic notes to generate')
+    m.set_defaults(func=bench_memory)
+    pd = sub.add_parser('pdf', help='PDF extraction throughput: two readers over all pages vs one lazy pass')
+    pd.add_argument('-n', type=int, default=200, help='Synthetic PDFs to generate')
+    pd.add_argument('--pages', type=int, default=8, help='Pages per PDF')
+    pd.add_argument('--max-pages', type=int, default=2, help='Pages searched for the abstract')
+    pd.set_defaults(func=bench_pdf)
+    su = sub.add_parser('suite', help='Pipeline benchmarks on synthetic corpora (wall time, peak RSS, files opened)')
+    su.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='Corpus sizes, e.g. 1000 10000 100000')
+    su.add_argument('--cases', nargs='+', choices=CASE_ORDER, help='Subset of cases (default: all)')
+    su.add_argument('--pdf-every', type=int, default=10, help='Attach a synthetic PDF to every N-th note')
+    su.add_argument('--repeat', type=int, default=1, help='Runs per case; the fastest is reported')
+    su.add_argument('--workdir', default='', help='Keep corpora here (reused across runs) instead of a temp dir')
+    su.add_argument('--json', default='', help='Write the JSON report here instead of stdout')
+    su.set_defaults(func=bench_suite)
+    c = sub.add_parser('compare', help='Compare two suite JSON reports and fail on regressions')
+    c.add_argument('base')
+    c.add_argument('head')
+    c.add_argument('--threshold', type=float, default=0.2, help='Relative change that counts (default 0.2 = 20%%)')
+    c.set_defaults(func=bench_compare)
+    rc = sub.add_parser('_case')
+    rc.add_argument('name')
+    rc.set_defaults(func=run_case)
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import argparse
+import time
+
+from paper_notes.build import build_site
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Regenerate tag index pages, the mkdocs nav and configured reviews '
+                                             '(reviews/reviews.toml), skipping outputs whose inputs are unchanged.')
+    ap.add_argument('--force', action='store_true', help='Rebuild every output')
+    ap.add_argument('--workers', type=int, default=None, help='Worker processes for reviews (default: CPU count)')
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    stats = build_site(force=args.force, workers=args.workers)
+    print(f"{stats['notes']} note(s): {stats['written']} output(s) written, {stats['skipped']} unchanged "
+          f'in {time.perf_counter() - t0:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import json
+import time
+
+from paper_notes.citations import CitationGraph, build_graph
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Build and query the citation graph of the notes corpus '
+                                             '(references from PDFs and BibTeX resolved to paper_ids).')
+    ap.add_argument('--rebuild', action='store_true', help='Re-resolve all references even if nothing changed')
+    ap.add_argument('--json', action='store_true', help='Print query results as JSON')
+    sub = ap.add_subparsers(dest='cmd')
+    sub.add_parser('build', help='Build or refresh the graph and print its size (default)')
+    for name, text in (('cites', 'Papers cited by PAPER_ID'),
+                       ('cited-by', 'Papers citing PAPER_ID'),
+                       ('co-cited', 'Papers most often cited together with PAPER_ID'),
+                       ('coupled', 'Papers sharing the most references with PAPER_ID'),
+                       ('neighborhood', 'Papers within --hops citation links of PAPER_ID')):
+        q = sub.add_parser(name, help=text)
+        q.add_argument('paper_id')
+        q.add_argument('-k', type=int, default=10, help='Number of results for co-cited/coupled (default 10)')
+        q.add_argument('--hops', type=int, default=2, help='Radius for neighborhood (default 2)')
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    graph = build_graph(force=args.rebuild)
+    if args.cmd in (None, 'build'):
+        print(f'{len(graph)} paper(s), {graph.edge_count} citation(s) in {time.perf_counter() - t0:.2f}s')
+        return
+    if args.paper_id not in graph.ids:
+        raise SystemExit(f'Unknown paper_id: {args.paper_id}')
+    result = query(graph, args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    for row in result:
+        print(row if isinstance(row, str) else f'{row[0]}\t{row[1]}')
+
+
+def query(graph: CitationGraph, args: argparse.Namespace) -> list:
+    if args.cmd == 'cites':
+        return graph.cites(args.paper_id)
+    if args.cmd == 'cited-by':
+        return graph.cited_by(args.paper_id)
+    if args.cmd == 'co-cited':
+        return graph.co_cited(args.paper_id, args.k)
+    if args.cmd == 'coupled':
+        return graph.coupled(args.paper_id, args.k)
+    hood = graph.neighborhood(args.paper_id, args.hops)
+    return sorted(hood.items(), key=lambda t: (t[1], t[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import argparse
+import json
+import time
+
+from paper_notes.dedupe import THRESHOLD, build_index
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Report groups of notes that look like the same paper '
+                                             '(arXiv versions, conference vs journal copies).')
+    ap.add_argument('--threshold', type=float, default=THRESHOLD,
+                    help=f'Minimum estimated Jaccard similarity of title + first page (default {THRESHOLD})')
+    ap.add_argument('--json', action='store_true', help='Print groups as JSON')
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    index = build_index()
+    groups = index.groups(args.threshold)
+    if args.json:
+        print(json.dumps([[{'paper_id': pid, 'score': round(score, 3), 'reason': reason}
+                           for pid, score, reason in g] for g in groups], ensure_ascii=False, indent=2))
+        return
+    for g in groups:
+        print(' ~ '.join(f'{pid} ({reason} {score:.2f})' for pid, score, reason in g))
+    print(f'{len(groups)} duplicate group(s) among {len(index)} note(s) in {time.perf_counter() - t0:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
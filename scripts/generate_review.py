@@ -1,24 +1,49 @@
 import argparse
+import os
+import sys
 from pathlib import Path
 from typing import List
 
-from paper_notes.review import generate_review
+from paper_notes.filters import parse_year_range
+from paper_notes.fragments import FragmentCache
+from paper_notes.pdf_cache import format_report
+from paper_notes.review import generate_review, write_review
+from paper_notes.trace import collect
 
 
 def main():
     ap = argparse.ArgumentParser(description='Generate a review paper markdown from selected notes/PDFs.')
     ap.add_argument('--title', default='Literature Review', help='Title of the review markdown')
     ap.add_argument('--tag', dest='tags', action='append', default=[], help='Filter by tag (repeatable)')
-    ap.add_argument('--year', type=int, help='Filter by exact year')
+    ap.add_argument('--year', help='Filter by year or inclusive range (2025, 2020-2024, 2020.., ..2024)')
+    ap.add_argument('--where', default='', help='Tag expression, e.g. "multi-agent AND (safety OR methods:debate) AND NOT rlhf"')
     ap.add_argument('--paper', dest='papers', action='append', default=[], help='Select specific paper_id (repeatable)')
-    ap.add_argument('--output', '-o', help='Output path (default: reviews/<slug>.md)')
+    ap.add_argument('--output', '-o', help='Output path (default: reviews/<slug>.md; "-" streams to stdout)')
     ap.add_argument('--abstract', action='store_true', help='Try to auto-extract abstract from PDFs (needs pypdf)')
+    ap.add_argument('--verbose', '-v', action='store_true', help='Print per-PDF extraction timings')
+    ap.add_argument('--incremental', action='store_true',
+                    help='Reuse cached per-paper fragments and only re-render papers whose note changed')
+    ap.add_argument('--group-by', choices=['citations', 'topics'], default='',
+                    help='Group review sections: "citations" by the citation graph among the papers, '
+                         '"topics" by TF-IDF similarity clustering (needs numpy)')
+    ap.add_argument('--trace', metavar='FILE', help='Write a Chrome trace (chrome://tracing, Perfetto) and print a span summary')
     args = ap.parse_args()
+    if args.trace:
+        with collect() as tracer:
+            run(args)
+        tracer.write(Path(args.trace))
+        for line in tracer.format_summary():
+            print(line, file=sys.stderr)
+        print(f'Wrote trace {args.trace}', file=sys.stderr)
+    else:
+        run(args)
 
-    content, items = generate_review(args.title, args.tags, args.year, args.papers, args.abstract)
-    if not items:
-        raise SystemExit('No matching notes found')
 
+def run(args: argparse.Namespace) -> None:
+    try:
+        year_range = parse_year_range(args.year)
+    except ValueError as e:
+        raise SystemExit(str(e))
     slug_parts: List[str] = []
     if args.tags:
         slug_parts.append('-'.join(sorted(set([t.lower() for t in args.tags]))))
@@ -28,9 +53,40 @@ def main():
         slug_parts.append('custom')
     slug = '-'.join(slug_parts)
     out_path = Path(args.output) if args.output else Path('reviews') / f"review-{slug}.md"
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(content, encoding='utf-8')
-    print(f'Wrote {out_path}')
+
+    fragments = FragmentCache() if args.incremental else None
+    try:
+        chunks, items = generate_review(args.title, args.tags, None, args.papers, args.abstract,
+                                        tag_expr=args.where, year_range=year_range, stream=True, fragments=fragments,
+                                        group_by=args.group_by)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    if not items:
+        raise SystemExit('No matching notes found')
+    if args.output == '-':
+        write_review(chunks, sys.stdout)
+        sys.stdout.flush()
+    else:
+        # Stream into a temp file next to the target so readers never see a partial review.
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out_path.with_name(f'.{out_path.name}.{os.getpid()}.tmp')
+        try:
+            with tmp.open('w', encoding='utf-8') as f:
+                write_review(chunks, f)
+            os.replace(tmp, out_path)
+        finally:
+            tmp.unlink(missing_ok=True)
+    if args.abstract:
+        results = [it.extraction for it in items if it.extraction]
+        missing = [it.paper_id for it in items if not it.extraction]
+        for line in format_report(results, verbose=args.verbose):
+            print(line, file=sys.stderr)
+        if missing:
+            print(f"No PDF found for: {', '.join(missing)}", file=sys.stderr)
+    if fragments is not None:
+        print(fragments.summary(), file=sys.stderr)
+    if args.output != '-':
+        print(f'Wrote {out_path}')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+"""Local stand-in for the Microsoft Graph endpoints used by ``paper_notes.share_links``.
+
+Serves the files under ``--root`` as the drive (``/{drive}/root:/{path}``),
+creates stable share links (``.../root:/{path}:/createLink``) and resolves
+them again (``/shares/{id}/driveItem``). ``--fail-rate`` answers that share of
+requests with 429 (with ``Retry-After``) or 503, and ``--latency`` delays every
+response, to exercise retries and concurrency. Point the resolver at it with
+``GRAPH_BASE_URL=http://127.0.0.1:8765/v1.0``.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+
+class MockGraph:
+    def __init__(self, root: Path, fail_rate: float = 0.0, latency: float = 0.0, seed: int = 0) -> None:
+        self.root = Path(root)
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.links: Dict[str, str] = {}  # webUrl -> drive path
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+    def item(self, drive_path: str) -> Optional[Dict[str, object]]:
+        p = self.root / drive_path
+        if not p.is_file():
+            return None
+        return {
+            'id': hashlib.sha1(drive_path.encode()).hexdigest()[:16],
+            'name': p.name,
+            'size': p.stat().st_size,
+            'file': {'mimeType': 'application/pdf' if p.suffix.lower() == '.pdf' else 'application/octet-stream'},
+        }
+
+    def handle(self, method: str, path: str, host: str) -> Tuple[int, Dict[str, object], Dict[str, str]]:
+        with self.lock:
+            self.requests += 1
+            fail = self.rng.random() < self.fail_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            if self.rng.random() < 0.5:
+                return 429, _error('activityLimitReached', 'Throttled'), {'Retry-After': '0'}
+            return 503, _error('serviceNotAvailable', 'Try again'), {}
+        path = unquote(path)
+        if path.startswith('/v1.0'):
+            path = path[len('/v1.0'):]
+        if '/root:/' in path:
+            drive_path = path.split('/root:/', 1)[1]
+            create = method == 'POST' and drive_path.endswith(':/createLink')
+            if create:
+                drive_path = drive_path[:-len(':/createLink')]
+            item = self.item(drive_path.rstrip(':'))
+            if item is None:
+                return 404, _error('itemNotFound', f'Item not found: {drive_path}'), {}
+            if not create:
+                return 200, item, {}
+            url = f"http://{host}/s/{item['id']}"
+            with self.lock:
+                self.links[url] = drive_path
+            return 200, {'link': {'type': 'view', 'scope': 'organization', 'webUrl': url}}, {}
+        if path.startswith('/shares/') and path.endswith('/driveItem'):
+            token = path[len('/shares/'):-len('/driveItem')]
+            try:
+                raw = token[2:] + '=' * (-len(token[2:]) % 4)
+                url = base64.urlsafe_b64decode(raw).decode('utf-8')
+            except (ValueError, UnicodeDecodeError):
+                return 400, _error('invalidRequest', 'Bad sharing token'), {}
+            drive_path = self.links.get(url)
+            item = self.item(drive_path) if drive_path else None
+            if item is None:
+                return 404, _error('itemNotFound', 'Shared item not found'), {}
+            return 200, item, {}
+        return 400, _error('invalidRequest', f'Unsupported: {method} {path}'), {}
+
+
+def _error(code: str, message: str) -> Dict[str, object]:
+    return {'error': {'code': code, 'message': message}}
+
+
+def make_server(graph: MockGraph, host: str = '127.0.0.1', port: int = 8765) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so pooled clients reuse connections
+
+        def _reply(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                status, body, headers = 401, _error('InvalidAuthenticationToken', 'Missing token'), {}
+            else:
+                status, body, headers = graph.handle(self.command, urlsplit(self.path).path,
+                                                     self.headers.get('Host', f'{host}:{port}'))
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = _reply
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Serve a directory as a mock Microsoft Graph drive for share-link tests.')
+    ap.add_argument('--root', required=True, help='Directory served as the drive root')
+    ap.add_argument('--port', type=int, default=8765)
+    ap.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 429/503')
+    ap.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    args = ap.parse_args()
+    graph = MockGraph(Path(args.root), args.fail_rate, args.latency)
+    server = make_server(graph, port=args.port)
+    print(f'Mock Graph API on http://127.0.0.1:{args.port}/v1.0 serving {args.root}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'{graph.requests} request(s) served')
+
+
+if __name__ == '__main__':
+    main()
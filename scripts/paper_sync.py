@@ -1,11 +1,19 @@
-import csv
+import argparse
+import json
 import os
 import re
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from paper_notes.manifest import get_store
+from paper_notes.pdf_cache import file_sha256
+from paper_notes.review import parse_front_matter, read_file, update_note_front_matter
+from paper_notes.trace import collect, count, traced
 
-MANIFEST_PATH = Path('data/manifest.csv')
 NOTES_DIR = Path('notes')
-MANIFEST_HEADERS = ['paper_id', 'title', 'year', 'one_drive_path', 'share_link']
+JOURNAL_PATH = Path('data') / 'cache' / 'sync_journal.json'
 
 
 def infer_paper_id(filename: str):
@@ -20,22 +28,18 @@ def infer_paper_id(filename: str):
 
 
 def load_manifest():
-    entries = {}
-    if MANIFEST_PATH.exists():
-        with MANIFEST_PATH.open(newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                entries[row['paper_id']] = row
-    return entries
+    """Read-only {paper_id: row} view of the manifest (parsed lazily, cached until it changes)."""
+    return get_store().load()
+
+
+@traced('sync.upsert_manifest')
+def upsert_manifest(rows) -> int:
+    """Write a batch of new/updated manifest rows in one locked, atomic write."""
+    return get_store().upsert_many(rows)
 
 
 def append_manifest(row):
-    file_exists = MANIFEST_PATH.exists()
-    with MANIFEST_PATH.open('a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=MANIFEST_HEADERS)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+    upsert_manifest([row])
 
 
 def note_path(paper_id: str) -> Path:
@@ -83,25 +87,242 @@ def create_note(paper_id: str, year: str, path: str):
     p.write_text("\n".join(yaml), encoding='utf-8')
 
 
+def load_journal(root: str) -> Dict[str, Dict]:
+    """Return the scan journal for ``root``: {'dirs': {...}, 'files': {...}}.
+
+    ``dirs`` maps a root-relative directory to its mtime, PDF entries and
+    subdirectory names; ``files`` maps a root-relative PDF path to its size,
+    mtime, sha256 and the paper_id it was registered under.
+    """
+    if JOURNAL_PATH.exists():
+        try:
+            data = json.loads(JOURNAL_PATH.read_text(encoding='utf-8'))
+            journal = data.get('roots', {}).get(os.path.abspath(root))
+            if journal:
+                return journal
+        except (OSError, ValueError):
+            pass
+    return {'dirs': {}, 'files': {}}
+
+
+def save_journal(root: str, journal: Dict[str, Dict]) -> None:
+    data: Dict[str, Dict] = {'roots': {}}
+    if JOURNAL_PATH.exists():
+        try:
+            data = json.loads(JOURNAL_PATH.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            pass
+    data.setdefault('roots', {})[os.path.abspath(root)] = journal
+    JOURNAL_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = JOURNAL_PATH.with_suffix('.json.tmp')
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, JOURNAL_PATH)
+
+
+def _scan_dir(root: str, rel: str, previous: Optional[Dict]) -> Tuple[str, Optional[Dict], bool]:
+    """List one directory, or reuse the journal entry when its mtime is unchanged.
+
+    A directory's mtime only changes when entries are added, removed or
+    renamed directly inside it, so an unchanged directory keeps its PDF list
+    and subdirectories; subdirectories are still visited on their own.
+    """
+    path = os.path.join(root, rel) if rel else root
+    try:
+        st = os.stat(path)
+    except OSError:
+        return rel, None, False
+    if previous and previous.get('mtime_ns') == st.st_mtime_ns:
+        return rel, previous, True
+    files: Dict[str, List[int]] = {}
+    subdirs: List[str] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                        est = entry.stat()
+                        files[entry.name] = [est.st_size, est.st_mtime_ns]
+                except OSError:
+                    continue
+    except OSError:
+        return rel, None, False
+    return rel, {'mtime_ns': st.st_mtime_ns, 'files': files, 'subdirs': sorted(subdirs)}, False
+
+
+@traced('sync.scan')
+def scan_tree(root: str, previous_dirs: Dict[str, Dict], workers: int = 16) -> Tuple[Dict[str, Dict], int]:
+    """Walk ``root`` concurrently with os.scandir; returns (dirs, reused_dir_count)."""
+    dirs: Dict[str, Dict] = {}
+    reused = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, root, '', previous_dirs.get(''))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel, entry, was_reused = fut.result()
+                if entry is None:
+                    continue
+                dirs[rel] = entry
+                reused += int(was_reused)
+                for name in entry['subdirs']:
+                    child = f'{rel}/{name}' if rel else name
+                    pending.add(pool.submit(_scan_dir, root, child, previous_dirs.get(child)))
+    count('dirs', len(dirs))
+    count('dirs_reused', reused)
+    return dirs, reused
+
+
+@traced('sync.hash')
+def _hash_all(root: str, rels: List[str], workers: int) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    count('files', len(rels))
+    if not rels:
+        return out
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {rel: pool.submit(file_sha256, Path(root) / rel) for rel in rels}
+        for rel, fut in futures.items():
+            try:
+                out[rel] = fut.result()
+            except OSError as e:
+                print(f'Skip {rel}: {e}')
+    return out
+
+
+def _relink_note(paper_id: str, old_rel: str, new_rel: str) -> None:
+    p = note_path(paper_id)
+    if not p.exists():
+        return
+    meta, _ = parse_front_matter(read_file(p))
+    if str(meta.get('local_hint') or '') in {'', old_rel}:
+        update_note_front_matter(p, {'local_hint': new_rel})
+
+
+@traced('sync')
+def sync(root: str, full: bool = False, workers: int = 16, merge_versions: bool = False) -> Dict[str, int]:
+    """Register new PDFs under ``root``, following moved/renamed files by content hash.
+
+    Without ``full`` only directories whose mtime changed since the last
+    journaled scan are listed again. With ``merge_versions`` new PDFs are
+    parsed and ones that look like another version of a known paper
+    (``paper_notes.dedupe``) are recorded under that paper instead of getting
+    a new note.
+    """
+    journal = load_journal(root)
+    dirs, reused = scan_tree(root, {} if full else journal['dirs'], workers)
+    current: Dict[str, Tuple[int, int]] = {}
+    for rel_dir, entry in dirs.items():
+        for name, (size, mtime) in entry['files'].items():
+            current[f'{rel_dir}/{name}' if rel_dir else name] = (size, mtime)
+
+    prev_files: Dict[str, Dict] = journal['files']
+    new = sorted(rel for rel in current if rel not in prev_files)
+    changed = [rel for rel in current if rel in prev_files
+               and (prev_files[rel]['size'], prev_files[rel]['mtime_ns']) != current[rel]]
+    gone_by_hash = {info['sha256']: (rel, info) for rel, info in prev_files.items()
+                    if rel not in current and info.get('sha256')}
+    known_by_hash = {info['sha256']: info for rel, info in prev_files.items()
+                     if rel in current and rel not in changed and info.get('sha256')}
+    hashes = _hash_all(root, new + changed, workers)
+
+    entries = load_manifest()
+    by_path = {row.get('one_drive_path', ''): pid for pid, row in entries.items()}
+    files: Dict[str, Dict] = {rel: info for rel, info in prev_files.items() if rel in current and rel not in changed}
+    stats = {'dirs': len(dirs), 'dirs_reused': reused, 'pdfs': len(current),
+             'added': 0, 'moved': 0, 'duplicates': 0, 'versions': 0, 'known': 0}
+    versions = None
+    extracted: Dict[Path, Dict[str, object]] = {}
+    if merge_versions:
+        from paper_notes.dedupe import build_index
+        from paper_notes.pdf_cache import extract_many
+        versions = build_index()
+        candidates = [rel for rel in new if rel in hashes and hashes[rel] not in gone_by_hash
+                      and hashes[rel] not in known_by_hash and rel not in by_path]
+        extracted = extract_many([Path(root) / rel for rel in candidates])
+    pending: Dict[str, Dict[str, str]] = {}
+    for rel in changed:
+        if rel in hashes:
+            files[rel] = dict(prev_files[rel], size=current[rel][0], mtime_ns=current[rel][1], sha256=hashes[rel])
+    for rel in new:
+        sha = hashes.get(rel)
+        if sha is None:
+            continue
+        size, mtime = current[rel]
+        if sha in gone_by_hash:
+            old_rel, info = gone_by_hash.pop(sha)
+            paper_id = info.get('paper_id', '')
+            if paper_id in entries or paper_id in pending:
+                pending.setdefault(paper_id, {'paper_id': paper_id})['one_drive_path'] = rel
+                _relink_note(paper_id, old_rel, rel)
+            print(f'Moved {paper_id}: {old_rel} -> {rel}')
+            stats['moved'] += 1
+        elif sha in known_by_hash:
+            paper_id = known_by_hash[sha].get('paper_id', '')
+            print(f'Duplicate of {paper_id}: {rel}')
+            stats['duplicates'] += 1
+        elif rel in by_path:
+            paper_id = by_path[rel]
+            stats['known'] += 1
+        else:
+            paper_id, year = infer_paper_id(Path(rel).name)
+            res = extracted.get(Path(root) / rel)
+            paper = matches = None
+            if versions is not None and res is not None:
+                md = res['metadata']
+                paper = versions.features(paper_id, str(md.get('title') or ''), str(res['first_page']),  # type: ignore[union-attr]
+                                          str(md.get('doi') or ''), [Path(rel).stem])  # type: ignore[union-attr]
+                matches = versions.query(paper, strict=True)
+            if paper_id in entries or paper_id in pending:
+                stats['known'] += 1
+            elif matches:
+                paper_id = matches[0][0]
+                print(f'Version of {paper_id} ({matches[0][2]} {matches[0][1]:.2f}): {rel}')
+                stats['versions'] += 1
+            else:
+                if paper is not None:
+                    versions.add(paper)  # type: ignore[union-attr]
+                pending[paper_id] = {
+                    'paper_id': paper_id,
+                    'title': '',
+                    'year': year,
+                    'one_drive_path': rel,
+                    'share_link': ''
+                }
+                create_note(paper_id, year, rel)
+                print(f'Added {paper_id}')
+                stats['added'] += 1
+        info = {'size': size, 'mtime_ns': mtime, 'sha256': sha, 'paper_id': paper_id}
+        files[rel] = info
+        known_by_hash.setdefault(sha, info)
+    upsert_manifest(pending.values())
+    save_journal(root, {'dirs': dirs, 'files': files})
+    return stats
+
+
 def main():
+    ap = argparse.ArgumentParser(description='Register new PDFs under ONEDRIVE_PAPERS_ROOT in the manifest and notes.')
+    ap.add_argument('--full', action='store_true', help='Ignore the scan journal and list every directory again')
+    ap.add_argument('--workers', type=int, default=16, help='Concurrent directory scans / hashes')
+    ap.add_argument('--merge-versions', action='store_true',
+                    help='Parse new PDFs and record other versions of known papers (arXiv vN, conference vs '
+                         'journal) under the existing note instead of adding one')
+    ap.add_argument('--trace', metavar='FILE', help='Write a Chrome trace and print a span summary')
+    args = ap.parse_args()
     root = os.getenv('ONEDRIVE_PAPERS_ROOT')
     if not root or not os.path.isdir(root):
         raise SystemExit('ONEDRIVE_PAPERS_ROOT is not set or invalid')
-    entries = load_manifest()
-    for pdf in Path(root).rglob('*.pdf'):
-        rel_path = os.path.relpath(pdf, root).replace('\\', '/')
-        paper_id, year = infer_paper_id(pdf.name)
-        if paper_id in entries:
-            continue
-        append_manifest({
-            'paper_id': paper_id,
-            'title': '',
-            'year': year,
-            'one_drive_path': rel_path,
-            'share_link': ''
-        })
-        create_note(paper_id, year, rel_path)
-        print(f'Added {paper_id}')
+    if args.trace:
+        with collect() as tracer:
+            stats = sync(root, full=args.full, workers=args.workers, merge_versions=args.merge_versions)
+        tracer.write(Path(args.trace))
+        for line in tracer.format_summary():
+            print(line, file=sys.stderr)
+    else:
+        stats = sync(root, full=args.full, workers=args.workers, merge_versions=args.merge_versions)
+    print(f"Scanned {stats['dirs']} dir(s) ({stats['dirs_reused']} unchanged), {stats['pdfs']} PDF(s): "
+          f"{stats['added']} added, {stats['moved']} moved, {stats['duplicates']} duplicate(s), "
+          f"{stats['versions']} other version(s)")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,27 @@
+import argparse
+import time
+
+from paper_notes.search import get_search_index, search
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Full-text (BM25) search over notes and cached PDF text.')
+    ap.add_argument('query', nargs='+', help='Search terms (English and/or Japanese)')
+    ap.add_argument('-k', type=int, default=10, help='Number of results')
+    ap.add_argument('--rebuild', action='store_true', help='Rebuild the index from scratch before searching')
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    index = get_search_index(rebuild=args.rebuild)
+    t1 = time.perf_counter()
+    hits = search(' '.join(args.query), k=args.k, index=index)
+    t2 = time.perf_counter()
+    for h in hits:
+        print(f"{h['score']:7.3f}  {h['paper_id']}  {h['path']}")
+        if h['snippet']:
+            print(f"         {h['snippet']}")
+    print(f'{len(hits)} hit(s) from {len(index)} note(s); index {1000 * (t1 - t0):.0f} ms, query {1000 * (t2 - t1):.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
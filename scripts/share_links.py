@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from paper_notes.share_links import CONCURRENCY, MAX_ATTEMPTS, resolve_share_links
+from paper_notes.trace import collect
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Create missing OneDrive/SharePoint share links for manifest rows '
+                                             'via Microsoft Graph and store them in the manifest and notes.')
+    ap.add_argument('--paper', dest='papers', action='append', help='Only this paper_id (repeatable)')
+    ap.add_argument('--verify', action='store_true',
+                    help='Also check existing links and re-create those whose file is gone')
+    ap.add_argument('--folder', help='Drive folder that ONEDRIVE_PAPERS_ROOT maps to (default GRAPH_PAPERS_FOLDER)')
+    ap.add_argument('--concurrency', type=int, default=CONCURRENCY, help=f'Requests in flight (default {CONCURRENCY})')
+    ap.add_argument('--attempts', type=int, default=MAX_ATTEMPTS, help=f'Tries per request (default {MAX_ATTEMPTS})')
+    ap.add_argument('--dry-run', action='store_true', help='Resolve but do not write the manifest or notes')
+    ap.add_argument('--json', action='store_true', help='Print every result as JSON')
+    ap.add_argument('--trace', metavar='FILE', help='Write a Chrome trace and print a span summary')
+    args = ap.parse_args()
+    token = os.getenv('GRAPH_TOKEN')
+    if not token:
+        raise SystemExit('GRAPH_TOKEN is not set (a Microsoft Graph access token with Files.ReadWrite)')
+
+    t0 = time.perf_counter()
+    if args.trace:
+        with collect() as tracer:
+            results = run(args, token)
+        tracer.write(Path(args.trace))
+        for line in tracer.format_summary():
+            print(line, file=sys.stderr)
+    else:
+        results = run(args, token)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for r in results:
+            if r['status'] not in ('ok', 'linked', 'local'):
+                print(f"{r['status']:8} {r['paper_id']}: {r['detail']}")
+    counts = Counter(r['status'] for r in results)
+    summary = ', '.join(f'{n} {status}' for status, n in sorted(counts.items())) or 'nothing to do'
+    print(f'{len(results)} row(s) in {time.perf_counter() - t0:.2f}s: {summary}', file=sys.stderr)
+
+
+def run(args: argparse.Namespace, token: str) -> list:
+    return resolve_share_links(token, verify=args.verify, paper_ids=args.papers, folder=args.folder,
+                               dry_run=args.dry_run, concurrency=args.concurrency, max_attempts=args.attempts)
+
+
+if __name__ == '__main__':
+    main()
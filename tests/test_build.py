@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import pytest
+
+from paper_notes import filters
+from paper_notes.build import build_site
+from paper_notes.note_parser import clear_cache
+
+
+def write_note(notes: Path, paper_id: str, local_hint: str = '') -> None:
+    notes.joinpath(f'{paper_id}.md').write_text('\n'.join([
+        '---', f'paper_id: {paper_id}', f'title: "Paper {paper_id}"', f'year: {paper_id[:4]}',
+        f'local_hint: {local_hint}', 'tags: [agent]', '---', '## TL;DR（3行）', '- result', '',
+    ]), encoding='utf-8')
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ONEDRIVE_PAPERS_ROOT', raising=False)
+    filters._CACHE.clear()
+    clear_cache()
+    Path('reviews').mkdir()
+    Path('reviews/reviews.toml').write_text(
+        '[[review]]\ntitle = "Agents"\noutput = "reviews/agents.md"\ntags = ["agent"]\n', encoding='utf-8')
+    return tmp_path
+
+
+def test_review_reads_the_given_notes_dir(workspace):
+    notes = Path('elsewhere')
+    notes.mkdir()
+    write_note(notes, '2021-graph-attention')
+    build_site(notes_dir=notes, log=lambda _: None)
+    assert '2021-graph-attention' in Path('reviews/agents.md').read_text(encoding='utf-8')
+
+
+def test_review_is_rebuilt_when_local_pdf_appears(workspace):
+    notes = Path('notes')
+    notes.mkdir()
+    write_note(notes, '2021-graph-attention', 'pdfs/graph-attention.pdf')
+    build_site(log=lambda _: None)
+    assert 'Local:' not in Path('reviews/agents.md').read_text(encoding='utf-8')
+
+    Path('pdfs').mkdir()
+    Path('pdfs/graph-attention.pdf').write_bytes(b'%PDF-1.4\n')
+    build_site(log=lambda _: None)
+    assert 'Local: pdfs/graph-attention.pdf' in Path('reviews/agents.md').read_text(encoding='utf-8')
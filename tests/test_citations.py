@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import pytest
+
+from paper_notes import filters
+from paper_notes.citations import build_graph, cited_bibtex
+from paper_notes.note_parser import clear_cache
+
+
+def write_note(notes: Path, paper_id: str, title: str, bibtex: str) -> None:
+    notes.joinpath(f'{paper_id}.md').write_text('\n'.join([
+        '---', f'paper_id: {paper_id}', f'title: "{title}"', f'year: {paper_id[:4]}', '---',
+        '## BibTeX', '```bibtex', bibtex, '```', '',
+    ]), encoding='utf-8')
+
+
+@pytest.fixture
+def notes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ONEDRIVE_PAPERS_ROOT', raising=False)
+    monkeypatch.delenv('PAPER_NOTES_MANIFEST', raising=False)
+    filters._CACHE.clear()
+    clear_cache()
+    Path('notes').mkdir()
+    return Path('notes')
+
+
+def test_cited_bibtex_skips_own_entry():
+    own = '@article{vaswani2017, title={Attention Is All You Need}}'
+    ref = '@inproceedings{kipf2017, title={Semi-Supervised Classification with Graph Convolutional Networks}}'
+    assert cited_bibtex(own) == ''
+    assert cited_bibtex(f'{own}\n\n{ref}') == ref
+
+
+def test_own_bibtex_entry_is_not_a_reference(notes, tmp_path):
+    write_note(notes, '2017-attention', 'Attention Is All You Need',
+               '@article{vaswani2017, title={Attention Is All You Need}}')
+    write_note(notes, '2021-sepformer', 'Attention Is All You Need In Speech Separation',
+               '@inproceedings{subakan2021, title={Attention Is All You Need In Speech Separation}}')
+    write_note(notes, '2022-survey', 'A Survey Of Speech Separation Models',
+               '@article{survey2022, title={A Survey Of Speech Separation Models}}\n'
+               '@inproceedings{subakan2021, title={Attention Is All You Need In Speech Separation}}')
+    graph = build_graph(notes, cache_dir=tmp_path / 'citations')
+    assert graph.cites('2021-sepformer') == []
+    assert graph.cites('2017-attention') == []
+    assert graph.cites('2022-survey') == ['2021-sepformer']
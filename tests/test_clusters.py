@@ -0,0 +1,40 @@
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from paper_notes.clusters import topic_sections  # noqa: E402
+from paper_notes.search import SearchIndex  # noqa: E402
+
+
+def corpus(docs):
+    index = SearchIndex()
+    items = []
+    for i, (words, tags) in enumerate(docs):
+        name = f'2020-paper-{i}.md'
+        index.add(name, name[:-3], Counter(words.split()))
+        items.append(SimpleNamespace(path=f'notes/{name}', paper_id=name[:-3], tags=tags))
+    return items, index
+
+
+def test_topics_form_sections():
+    docs = [(f'debate judge argument debate paper{i}', ['debate']) for i in range(6)]
+    docs += [(f'retrieval index embedding retrieval paper{i}', ['rag']) for i in range(6)]
+    items, index = corpus(docs)
+    ordered, sections = topic_sections(items, index)
+    assert sorted(n for _, n in sections) == [6, 6]
+    assert sorted(it.paper_id for it in ordered) == sorted(it.paper_id for it in items)
+    assert {h.split(':')[0] for h, _ in sections} == {'debate', 'rag'}
+
+
+def test_no_shared_terms_means_no_sections():
+    items, index = corpus([(f'unique{i} words{i}', []) for i in range(12)])
+    assert topic_sections(items, index) == (items, [])
+
+
+def test_single_group_means_no_sections():
+    # Half the papers share terms, the other half have no term in common: one group plus "Other papers".
+    items, index = corpus([('alpha beta gamma', [])] * 6 + [(f'own{i}', []) for i in range(6)])
+    assert topic_sections(items, index) == (items, [])
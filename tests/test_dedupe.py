@@ -0,0 +1,52 @@
+import pytest
+
+from paper_notes.dedupe import DuplicateIndex, arxiv_id
+
+
+@pytest.mark.parametrize('names, expected', [
+    (['2306.08302v3'], '2306.08302'),
+    (['unknown-2306-08302v3'], '2306.08302'),
+    (['arxiv-2306-08302'], '2306.08302'),
+    (['unknown-1406-1234'], '1406.1234'),
+    (['unknown-survey-2020-2023'], ''),
+    (['2024-llm-trends-2023-2024'], ''),
+    (['2020-2023'], ''),
+    (['notes-2013.12345'], ''),  # month 13
+    (['2306.0830'], ''),  # 4-digit numbers ended in 2014
+])
+def test_arxiv_id_requires_a_real_id(names, expected):
+    assert arxiv_id(names) == expected
+
+
+def test_arxiv_id_from_text_stamp():
+    assert arxiv_id([], 'arXiv:2306.08302v2 [cs.CL] 12 Jun 2023') == '2306.08302'
+
+
+ATTENTION = ('Attention Is All You Need', 'The dominant sequence transduction models are based on complex '
+             'recurrent or convolutional neural networks that include an encoder and a decoder.')
+REWARD = ('Reward Modeling for Debate Agents', 'We train reward models on pairwise judgements of debate '
+          'transcripts and study how well they transfer to unseen topics and longer arguments.')
+
+
+def test_exact_key_needs_minhash_agreement():
+    index = DuplicateIndex()
+    # Unrelated papers sharing a key, e.g. a DOI copied into the wrong note.
+    index.add(index.features('2017-attention', *ATTENTION, doi='10.1234/shared'))
+    paper = index.features('2023-reward-debate', *REWARD, doi='10.1234/shared')
+    assert index.query(paper) == []
+
+
+def test_versions_match_by_arxiv_id():
+    index = DuplicateIndex()
+    index.add(index.features('unknown-2306-08302v1', *ATTENTION))
+    v3 = index.features('unknown-2306-08302v3', ATTENTION[0], ATTENTION[1] + ' Revised with new experiments.')
+    assert [(pid, reason) for pid, _, reason in index.query(v3, strict=True)] == [('unknown-2306-08302v1', 'arxiv')]
+
+
+def test_unverifiable_exact_hit_is_not_linked_in_strict_mode():
+    index = DuplicateIndex()
+    index.add(index.features('unknown-2306-08302v1', *ATTENTION))
+    no_text = index.features('unknown-2306-08302v3', '')
+    assert no_text.sig is None
+    assert index.query(no_text) == [('unknown-2306-08302v1', 1.0, 'arxiv')]
+    assert index.query(no_text, strict=True) == []
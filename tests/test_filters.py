@@ -0,0 +1,35 @@
+import os
+
+from paper_notes import filters
+from paper_notes.filters import get_filter_index
+
+
+def write_note(path, tags, year):
+    path.write_text(f'---\npaper_id: {path.stem}\ntitle: "{path.stem}"\nyear: {year}\ntags: [{", ".join(tags)}]\n---\n\n# Body\n',
+                    encoding='utf-8')
+
+
+def test_refresh_leaves_returned_index_untouched(tmp_path, monkeypatch):
+    monkeypatch.setattr(filters, '_CACHE', {})
+    notes, db = tmp_path / 'notes', tmp_path / 'index.sqlite'
+    notes.mkdir()
+    write_note(notes / '2020-a.md', ['rlhf'], 2020)
+    write_note(notes / '2021-b.md', ['rag'], 2021)
+    old = get_filter_index(notes, db)
+    assert old.names_of(old.term('tags', 'rlhf')) == ['2020-a.md']
+
+    (notes / '2020-a.md').unlink()
+    write_note(notes / '2022-c.md', ['rlhf'], 2022)
+    st = (notes / '2021-b.md').stat()
+    write_note(notes / '2021-b.md', ['rlhf'], 2021)
+    os.utime(notes / '2021-b.md', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    new = get_filter_index(notes, db)
+
+    assert new is not old
+    assert new.names_of(new.term('tags', 'rlhf')) == ['2021-b.md', '2022-c.md']
+    assert new.all_years() == [2021, 2022]
+    # A reader still holding the previous index sees a consistent snapshot.
+    assert old.names_of(old.term('tags', 'rlhf')) == ['2020-a.md']
+    assert old.names_of(old.live) == ['2020-a.md', '2021-b.md']
+    assert old.all_years() == [2020, 2021]
+    assert get_filter_index(notes, db) is new
@@ -0,0 +1,176 @@
+import io
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+
+from paper_notes import filters
+from paper_notes.jobs import MAX_ATTEMPTS, JobRunner, JobStore, process_batch
+from paper_notes.note_parser import clear_cache
+from scripts.benchmark import write_pdf
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """JobStore in an empty workspace (notes/, data/ relative to ``tmp_path``)."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ONEDRIVE_PAPERS_ROOT', raising=False)
+    monkeypatch.delenv('PAPER_NOTES_MANIFEST', raising=False)
+    filters._CACHE.clear()
+    clear_cache()
+    Path('notes').mkdir()
+    return JobStore()
+
+
+def pdf_bytes(tmp_path: Path, title: str) -> bytes:
+    path = tmp_path / 'src' / f'{title}.pdf'
+    write_pdf(path, title, f'We study {title.lower()} in detail and report results on several benchmarks.')
+    return path.read_bytes()
+
+
+def submit(store: JobStore, filename: str, data: bytes):
+    return store.submit(filename, io.BytesIO(data))
+
+
+def status(store: JobStore, job_id: int) -> dict:
+    return next(j for j in store.recent() if j['id'] == job_id)
+
+
+def test_resubmit_is_noop(store, tmp_path):
+    data = pdf_bytes(tmp_path, 'Graph Attention Agents')
+    job_id, queued = submit(store, '2021-graph-attention.pdf', data)
+    assert queued
+    assert submit(store, 'renamed-copy.pdf', data) == (job_id, False)
+    assert store.counts()['queued'] == 1
+    assert len(list(store.incoming.iterdir())) == 1  # one staged copy, no leftover .part files
+
+
+def test_process_batch_creates_note_and_manifest_row(store, tmp_path):
+    job_id, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, 'Graph Attention Agents'))
+    assert JobRunner(store).run_pending() == 1
+    job = status(store, job_id)
+    assert (job['status'], job['paper_id']) == ('done', '2021-graph-attention')
+    assert Path('notes/2021-graph-attention.md').exists()
+    assert Path('data/uploads/2021-graph-attention.pdf').exists()
+    from scripts.paper_sync import load_manifest
+    assert '2021-graph-attention' in load_manifest()
+    assert not list(store.incoming.glob('*.pdf'))
+
+
+def test_failed_job_is_requeued_until_max_attempts(store, tmp_path):
+    job_id, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, 'Graph Attention Agents'))
+    sha = store.claim()[0]['sha256']
+    store.staged_path(str(sha)).unlink()  # every attempt now fails: the staged upload is gone
+    with closing(store.connect()) as conn, conn:  # undo the claim above without counting it as an attempt
+        conn.execute("UPDATE jobs SET status = 'queued', attempts = 0")
+
+    for attempt in range(1, MAX_ATTEMPTS):
+        batch = store.claim()
+        assert [j['attempts'] for j in batch] == [attempt]
+        process_batch(store, batch)
+        assert status(store, job_id)['status'] == 'queued'
+    JobRunner(store).run_pending()
+    job = status(store, job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == MAX_ATTEMPTS
+    assert 'FileNotFoundError' in job['error']
+    assert store.claim() == []
+
+
+def test_resubmitting_a_failed_upload_requeues_it(store, tmp_path):
+    data = pdf_bytes(tmp_path, 'Graph Attention Agents')
+    job_id, _ = submit(store, '2021-graph-attention.pdf', data)
+    store.staged_path(str(store.claim()[0]['sha256'])).unlink()
+    store.requeue_running()
+    JobRunner(store).run_pending()
+    assert status(store, job_id)['status'] == 'failed'
+
+    assert submit(store, '2021-graph-attention.pdf', data) == (job_id, True)
+    JobRunner(store).run_pending()
+    assert status(store, job_id)['status'] == 'done'
+
+
+def test_start_requeues_running_jobs(store, tmp_path, monkeypatch):
+    job_id, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, 'Graph Attention Agents'))
+    store.claim()  # left 'running' by a process that died
+    assert status(store, job_id)['status'] == 'running'
+    monkeypatch.setattr(JobRunner, '_loop', lambda self: None)
+    JobRunner(store).start()
+    assert status(store, job_id)['status'] == 'queued'
+
+
+def test_retry_after_crash_uses_own_moved_upload(store, tmp_path, monkeypatch):
+    """A crash after the upload was moved into place is 'ours' on retry, not a conflict."""
+    job_id, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, 'Graph Attention Agents'))
+    from paper_notes import pdf_cache
+
+    real = pdf_cache.extract_many
+    calls = []
+
+    def crash_once(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('worker died')
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_cache, 'extract_many', crash_once)
+    JobRunner(store).run_pending()
+    job = status(store, job_id)
+    assert (job['status'], job['attempts']) == ('done', 2)
+    assert job['paper_id'] == '2021-graph-attention'
+
+
+def test_conflicting_upload_is_skipped(store, tmp_path):
+    first, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, 'Graph Attention Agents'))
+    JobRunner(store).run_pending()
+    second, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, 'Reward Models For Debate'))
+    JobRunner(store).run_pending()
+    assert status(store, first)['status'] == 'done'
+    job = status(store, second)
+    assert (job['status'], job['error']) == ('skipped', '2021-graph-attention already exists')
+
+
+def test_same_bytes_under_another_name_link_to_known_paper(store, tmp_path):
+    data = pdf_bytes(tmp_path, 'Graph Attention Agents')
+    first, _ = submit(store, '2021-graph-attention.pdf', data)
+    JobRunner(store).run_pending()
+    # The finished job is cleared, so the same bytes are queued again and matched by content.
+    store.clear_finished()
+    second, queued = submit(store, 'graph-attention-copy.pdf', data)
+    assert queued
+    JobRunner(store).run_pending()
+    job = status(store, second)
+    assert (job['status'], job['paper_id']) == ('linked', '2021-graph-attention')
+    assert not Path('notes/unknown-graph-attention-copy.md').exists()
+
+
+def test_linked_version_is_not_overwritten_by_a_later_upload(store, tmp_path):
+    title, abstract = 'Graph Attention Agents', 'We study graph attention agents in detail and report results.'
+    first, _ = submit(store, '2021-graph-attention.pdf', pdf_bytes(tmp_path, title))
+    JobRunner(store).run_pending()
+
+    version = tmp_path / 'src' / 'v2.pdf'
+    write_pdf(version, title, abstract + ' This revision adds ablations.')
+    second, _ = submit(store, 'main.pdf', version.read_bytes())
+    JobRunner(store).run_pending()
+    job = status(store, second)
+    assert (job['status'], job['paper_id']) == ('linked', '2021-graph-attention')
+    kept = list(Path('data/uploads/versions').glob('2021-graph-attention.*.pdf'))
+    assert [p.read_bytes() for p in kept] == [version.read_bytes()]
+    assert not Path('data/uploads/unknown-main.pdf').exists()
+
+    # An unrelated paper inferring the same paper_id is registered, not linked via the old file.
+    third, _ = submit(store, 'main.pdf', pdf_bytes(tmp_path, 'Reward Models For Debate'))
+    JobRunner(store).run_pending()
+    assert (status(store, third)['status'], status(store, third)['paper_id']) == ('done', 'unknown-main')
+    assert [p.read_bytes() for p in kept] == [version.read_bytes()]
+
+
+def test_existing_file_at_destination_is_a_conflict(store, tmp_path):
+    existing = Path('data/uploads/unknown-main.pdf')
+    existing.parent.mkdir(parents=True)
+    existing.write_bytes(pdf_bytes(tmp_path, 'Graph Attention Agents'))
+    job_id, _ = submit(store, 'main.pdf', pdf_bytes(tmp_path, 'Reward Models For Debate'))
+    JobRunner(store).run_pending()
+    assert status(store, job_id)['status'] == 'skipped'
+    assert existing.read_bytes() == pdf_bytes(tmp_path, 'Graph Attention Agents')
@@ -0,0 +1,22 @@
+from paper_notes.manifest import CsvManifestStore, SqliteManifestStore, copy_manifest
+
+
+def test_sqlite_extras_survive_load_and_copy(tmp_path):
+    store = SqliteManifestStore(tmp_path / 'manifest.sqlite')
+    store.upsert_many([
+        {'paper_id': '2021-graph-attention', 'title': 'Graph Attention Agents', 'sha256': 'abc'},
+        {'paper_id': '2022-debate', 'title': 'Reward Models For Debate'},
+    ])
+    store.upsert_many([{'paper_id': '2022-debate', 'status': 'read'}])
+
+    view = store.load()
+    assert view.headers[-2:] == ['sha256', 'status']
+    assert view['2021-graph-attention']['sha256'] == 'abc'
+    assert view['2022-debate']['status'] == 'read'
+    assert view['2022-debate']['sha256'] == ''
+
+    csv_store = CsvManifestStore(tmp_path / 'manifest.csv')
+    assert copy_manifest(store, csv_store) == 2
+    copied = csv_store.load()
+    assert copied['2021-graph-attention']['sha256'] == 'abc'
+    assert copied['2022-debate']['status'] == 'read'
@@ -1,279 +1,423 @@
+import json
 import os
+import threading
+import time
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 
 import streamlit as st
 
 from paper_notes.review import (
-    list_all_tags_and_years,
-    find_notes,
-    load_note_info,
+    NOTES_DIR,
     generate_review,
-    try_extract_abstract_from_pdf,
-    extract_pdf_metadata,
-    update_note_front_matter,
+    write_review,
 )
-from ai.rag import build_context_from_docs, generate_with_langchain  # type: ignore
-from scripts.paper_sync import infer_paper_id, create_note, load_manifest, append_manifest  # type: ignore
+from paper_notes.filters import NoteFilterIndex, get_filter_index
+from paper_notes.index import notes_stamp
+from paper_notes.jobs import get_runner
+from paper_notes.pdf_cache import extract_one, file_sha256, format_report
+from paper_notes.pdf_index import hash_stream
+from paper_notes.records import list_records, load_note
+from paper_notes.search import SearchIndex, get_search_index, search as search_notes
+from paper_notes import trace
+from ai.packing import default_budget  # type: ignore
+from ai.rag import build_packed_context, get_response_cache, stream_with_langchain  # type: ignore
 
 
+PREVIEW_CHARS = 200_000
+
+# Spans from this rerun are shown in the Performance panel at the bottom of the page.
+_rerun_started = time.perf_counter()
+
 st.set_page_config(page_title="Paper Review Builder", layout="wide")
 st.title("📚 Review Builder")
 st.caption("Select notes by tags/year/papers and generate a review markdown.")
 
 
-@st.cache_data
-def get_tags_years():
-    return list_all_tags_and_years()
-
-
-@st.cache_data
-def list_note_options(tags: List[str], year: int | None):
-    paths = find_notes(tags, year, [])
-    items = [load_note_info(p) for p in paths]
-    options = []
-    for it in items:
-        m = it['meta']  # type: ignore
-        pid = str(m.get('paper_id', ''))
-        title = str(m.get('title', '')) or pid
-        year_str = str(m.get('year', ''))
-        venue = str(m.get('venue', ''))
-        label = f"{title} ({venue} {year_str}) [{pid}]"
-        options.append((label, pid))
-    return options
-
-
-tags_all, years_all = get_tags_years()
-
-with st.sidebar:
-    st.header("Filters")
-    sel_tags = st.multiselect("Tags", options=tags_all)
-    sel_year = st.selectbox("Year", options=[None] + years_all, format_func=lambda x: "Any" if x is None else str(x))
-    refresh = st.button("Refresh list")
-
-note_options = list_note_options(sel_tags, sel_year)
-if refresh:
-    st.cache_data.clear()
-    note_options = list_note_options(sel_tags, sel_year)
-
-st.subheader("Select Papers")
-selected = st.multiselect("Papers", options=[opt[0] for opt in note_options], default=[opt[0] for opt in note_options])
-selected_pids = [pid for label, pid in note_options if label in selected]
-
-st.subheader("Output Settings")
-col1, col2 = st.columns(2)
-with col1:
-    title = st.text_input("Review Title", value="Literature Review")
-    include_abstract = st.checkbox("Include Abstract (auto-extract from local PDFs)")
-with col2:
-    slug_parts: List[str] = []
-    if sel_tags:
-        slug_parts.append('-'.join(sorted(set([t.lower() for t in sel_tags]))))
-    if sel_year:
-        slug_parts.append(str(sel_year))
-    if not slug_parts:
-        slug_parts.append('custom')
-    default_out = Path('reviews') / f"review-{'-'.join(slug_parts)}.md"
-    out_path = Path(st.text_input("Output Path", value=str(default_out)))
-
-st.markdown("---")
-
-# --- PDF Uploads (Optional) ---
-st.subheader("Upload PDFs (optional)")
-st.caption("Attach PDFs to selected papers to auto-extract abstracts even without local files.")
-
-if 'uploaded_pdfs' not in st.session_state:
-    st.session_state.uploaded_pdfs = {}
-
-uploads_root = Path('data') / 'uploads'
-uploads_root.mkdir(parents=True, exist_ok=True)
-
-if selected_pids:
-    with st.expander("Manage uploads for selected papers", expanded=False):
-        for label, pid in [(l, p) for (l, p) in note_options if p in selected_pids]:
-            colu1, colu2 = st.columns([3, 2])
-            with colu1:
-                st.write(label)
-            with colu2:
-                uf = st.file_uploader(
-                    f"Upload PDF for [{pid}]",
-                    type=["pdf"],
-                    key=f"upload_{pid}",
-                    accept_multiple_files=False,
-                    label_visibility='collapsed'
-                )
-                if uf is not None:
-                    # Save to a stable path per pid
-                    save_path = uploads_root / f"{pid}.pdf"
-                    try:
-                        with open(save_path, 'wb') as f:
-                            f.write(uf.read())
-                        st.session_state.uploaded_pdfs[pid] = save_path
-                        st.success(f"Saved upload for {pid}")
-                    except Exception as e:
-                        st.error(f"Failed to save {pid}: {e}")
-            # If we already have an uploaded file, show a short abstract preview
-            existing = st.session_state.uploaded_pdfs.get(pid)
-            if existing and existing.exists():
-                try:
-                    snippet = try_extract_abstract_from_pdf(existing)
-                    if snippet:
-                        st.caption(f"Abstract preview: {snippet[:200]}{'…' if len(snippet) > 200 else ''}")
-                    else:
-                        st.caption("No abstract text detected in first pages.")
-                except Exception:
-                    st.caption("Could not read uploaded PDF.")
+# --- Caching ---
+# Corpus-level entries are keyed by ``corpus_key()``: the notes directory stamp
+# (one stat, changes when notes are added/removed) plus a shared generation
+# bumped when this app rewrites a note in place or "Refresh list" is pressed.
+# Per-note and per-PDF entries are keyed by file fingerprint / content hash, so
+# an updated note or PDF only misses its own entry.
 
-    cols = st.columns(2)
-    with cols[0]:
-        if st.button("Clear all uploads"):
-            st.session_state.uploaded_pdfs = {}
-            st.rerun()
+class CorpusVersion:
+    def __init__(self) -> None:
+        self.generation = 0
+        self._lock = threading.Lock()
 
-st.markdown("---")
+    def bump(self) -> None:
+        with self._lock:
+            self.generation += 1
 
-generate = st.button("Generate Review", type="primary")
 
-if generate:
-    # Build mapping for uploaded PDFs only for selected papers
-    uploaded_map = {pid: Path(p) for pid, p in (st.session_state.uploaded_pdfs or {}).items() if pid in selected_pids}
-    content, items = generate_review(title, sel_tags, sel_year, selected_pids, include_abstract, uploaded_pdfs=uploaded_map)
-    if not items:
-        st.warning("No matching notes found. Adjust filters or selections.")
-    else:
-        # Preview and save
-        st.success(f"Generated {len(items)} items")
-        with st.expander("Preview Markdown", expanded=True):
-            st.code(content, language="markdown")
-        # Save to file
-        try:
-            out_path.parent.mkdir(parents=True, exist_ok=True)
-            out_path.write_text(content, encoding='utf-8')
-            st.info(f"Saved to {out_path}")
-        except Exception as e:
-            st.error(f"Failed to save: {e}")
-        st.download_button("Download Markdown", data=content, file_name=out_path.name, mime="text/markdown")
-
-st.markdown("---")
-st.caption("Tip: Ensure ONEDRIVE_PAPERS_ROOT is set for local PDF abstract extraction.")
-st.markdown("---")
-
-# --- Add New Paper (Upload) ---
-st.subheader("Add New Paper (Upload)")
-st.caption("Upload a new paper PDF to create a note and register it.")
-
-new_pdfs = st.file_uploader(
-    "Upload PDF(s)", type=["pdf"], accept_multiple_files=True, key="new_pdfs_uploader"
-)
+@st.cache_resource
+def corpus_version() -> CorpusVersion:
+    return CorpusVersion()
+
+
+def corpus_key() -> Tuple[Tuple[int, int], int]:
+    return notes_stamp(NOTES_DIR), corpus_version().generation
+
+
+@st.cache_resource(max_entries=1)
+def filter_index(key: tuple) -> NoteFilterIndex:
+    # ``key`` is only there to re-run the incremental refresh when the corpus changes
+    return get_filter_index(NOTES_DIR)
+
+
+@st.cache_resource(max_entries=1)
+def search_index(key: tuple) -> SearchIndex:
+    return get_search_index(NOTES_DIR)
+
+
+@st.cache_data(max_entries=4)
+def get_tags_years(key: tuple):
+    index = filter_index(key)
+    return index.values('tags'), index.all_years()
+
+
+@st.cache_data(max_entries=64)
+def list_note_options(key: tuple, tags: List[str], year: int | None, tag_expr: str = '',
+                      year_range: tuple | None = None):
+    names = filter_index(key).select(tags, year, [], tag_expr=tag_expr, year_range=year_range)
+    return [(rec.label, rec.paper_id) for rec in list_records([NOTES_DIR / n for n in names])]
+
+
+@st.cache_data(max_entries=64)
+def search_hits(key: tuple, query: str):
+    return search_notes(query, k=50, index=search_index(key))
+
+
+@st.cache_data(max_entries=4096)
+def note_doc(path: str, mtime_ns: int, size: int) -> Tuple[str, str]:
+    note = load_note(Path(path))
+    return note.paper_id, note.body
+
+
+@st.cache_data(max_entries=1024)
+def pdf_extraction(sha256: str, _path: str) -> Dict[str, object]:
+    res = extract_one(Path(_path))
+    return {'abstract': str(res['abstract']), 'error': str(res['error']), 'metadata': res['metadata']}
+
+
+def uploaded_pdf_sha(pid: str, path: Path) -> str:
+    """Content hash of an uploaded PDF, computed once per session."""
+    shas = st.session_state.setdefault('upload_sha', {})
+    if pid not in shas:
+        shas[pid] = file_sha256(path)
+    return shas[pid]
+
+
+def invalidate_notes() -> None:
+    """Call after rewriting notes in place; per-note entries refresh via their fingerprints."""
+    corpus_version().bump()
+
+
+# collect() also resets the tracer when st.rerun(), st.stop() or an error ends the rerun early.
+with trace.collect() as tracer:
+    tags_all, years_all = get_tags_years(corpus_key())
+
+    with st.sidebar:
+        st.header("Filters")
+        sel_tags = st.multiselect("Tags", options=tags_all)
+        sel_year = st.selectbox("Year", options=[None] + years_all, format_func=lambda x: "Any" if x is None else str(x))
+        sel_year_range = None
+        if sel_year is None and len(years_all) > 1:
+            lo, hi = st.select_slider("Year range", options=years_all, value=(years_all[0], years_all[-1]))
+            if (lo, hi) != (years_all[0], years_all[-1]):
+                sel_year_range = (lo, hi)
+        sel_expr = st.text_input("Tag expression", value="", help="例: multi-agent AND (safety OR methods:debate) AND NOT rlhf")
+        refresh = st.button("Refresh list")
+
+    if refresh:
+        invalidate_notes()
+        st.rerun()
+    try:
+        note_options = list_note_options(corpus_key(), sel_tags, sel_year, sel_expr, sel_year_range)
+    except ValueError as e:
+        st.sidebar.error(f"Invalid tag expression (ignored): {e}")
+        sel_expr = ''
+        note_options = list_note_options(corpus_key(), sel_tags, sel_year, sel_expr, sel_year_range)
+
+    st.subheader("Select Papers")
+    search_q = st.text_input("Search notes", value="", placeholder="全文検索（BM25）: e.g. debate 評価")
+    if search_q.strip():
+        hits = search_hits(corpus_key(), search_q)
+        rank = {str(h['paper_id']): i for i, h in enumerate(hits)}
+        note_options = sorted([opt for opt in note_options if opt[1] in rank], key=lambda opt: rank[opt[1]])
+        shown = {opt[1] for opt in note_options}
+        with st.expander(f"Search results ({len(note_options)})", expanded=False):
+            for h in hits:
+                if h['paper_id'] in shown:
+                    st.markdown(f"**{h['paper_id']}** · {float(h['score']):.2f}  \n{h['snippet']}")
+    selected = st.multiselect("Papers", options=[opt[0] for opt in note_options], default=[opt[0] for opt in note_options])
+    selected_pids = [pid for label, pid in note_options if label in selected]
+
+    st.subheader("Output Settings")
+    col1, col2 = st.columns(2)
+    with col1:
+        title = st.text_input("Review Title", value="Literature Review")
+        include_abstract = st.checkbox("Include Abstract (auto-extract from local PDFs)")
+        group_by = st.selectbox("Group sections by", options=["", "citations", "topics"],
+                                format_func=lambda v: {"": "None (selection order)", "citations": "Citation graph",
+                                                       "topics": "Topics (TF-IDF clustering)"}[v])
+    with col2:
+        slug_parts: List[str] = []
+        if sel_tags:
+            slug_parts.append('-'.join(sorted(set([t.lower() for t in sel_tags]))))
+        if sel_year:
+            slug_parts.append(str(sel_year))
+        if not slug_parts:
+            slug_parts.append('custom')
+        default_out = Path('reviews') / f"review-{'-'.join(slug_parts)}.md"
+        out_path = Path(st.text_input("Output Path", value=str(default_out)))
+
+    st.markdown("---")
+
+    # --- PDF Uploads (Optional) ---
+    st.subheader("Upload PDFs (optional)")
+    st.caption("Attach PDFs to selected papers to auto-extract abstracts even without local files.")
+
+    if 'uploaded_pdfs' not in st.session_state:
+        st.session_state.uploaded_pdfs = {}
 
-if new_pdfs:
-    created = []
     uploads_root = Path('data') / 'uploads'
     uploads_root.mkdir(parents=True, exist_ok=True)
-    manifest = load_manifest()
-    for uf in new_pdfs:
-        try:
-            pid, year = infer_paper_id(uf.name)
-            # Avoid conflicts
-            note_file = Path('notes') / f"{pid}.md"
-            if pid in manifest or note_file.exists():
-                st.warning(f"Skip: {uf.name} → {pid} already exists")
+
+    if selected_pids:
+        with st.expander("Manage uploads for selected papers", expanded=False):
+            for label, pid in [(l, p) for (l, p) in note_options if p in selected_pids]:
+                colu1, colu2 = st.columns([3, 2])
+                with colu1:
+                    st.write(label)
+                with colu2:
+                    uf = st.file_uploader(
+                        f"Upload PDF for [{pid}]",
+                        type=["pdf"],
+                        key=f"upload_{pid}",
+                        accept_multiple_files=False,
+                        label_visibility='collapsed'
+                    )
+                    if uf is not None:
+                        # The uploader keeps its file across reruns: only write it once per uploaded file
+                        upload_key = getattr(uf, 'file_id', None) or (uf.name, uf.size)
+                        save_path = uploads_root / f"{pid}.pdf"
+                        if st.session_state.setdefault('upload_keys', {}).get(pid) != upload_key or not save_path.exists():
+                            try:
+                                sha, _ = hash_stream(uf, save_path)
+                                st.session_state.uploaded_pdfs[pid] = save_path
+                                st.session_state.setdefault('upload_sha', {})[pid] = sha
+                                st.session_state.upload_keys[pid] = upload_key
+                                st.success(f"Saved upload for {pid}")
+                            except Exception as e:
+                                st.error(f"Failed to save {pid}: {e}")
+                # If we already have an uploaded file, show a short abstract preview
+                existing = st.session_state.uploaded_pdfs.get(pid)
+                if existing and existing.exists():
+                    res = pdf_extraction(uploaded_pdf_sha(pid, existing), str(existing))
+                    snippet = str(res['abstract'])
+                    if snippet:
+                        st.caption(f"Abstract preview: {snippet[:200]}{'…' if len(snippet) > 200 else ''}")
+                    elif res['error']:
+                        st.caption(f"Could not read uploaded PDF: {res['error']}")
+                    else:
+                        st.caption("No abstract text detected in first pages.")
+
+        cols = st.columns(2)
+        with cols[0]:
+            if st.button("Clear all uploads"):
+                st.session_state.uploaded_pdfs = {}
+                st.session_state.upload_sha = {}
+                st.session_state.upload_keys = {}
+                st.rerun()
+
+    st.markdown("---")
+
+    generate = st.button("Generate Review", type="primary")
+
+    if generate:
+        # Build mapping for uploaded PDFs only for selected papers
+        uploaded_map = {pid: Path(p) for pid, p in (st.session_state.uploaded_pdfs or {}).items() if pid in selected_pids}
+        chunks, items = generate_review(title, sel_tags, sel_year, selected_pids, include_abstract, uploaded_pdfs=uploaded_map,
+                                        tag_expr=sel_expr, year_range=sel_year_range, stream=True, group_by=group_by)
+        if not items:
+            st.warning("No matching notes found. Adjust filters or selections.")
+        else:
+            # Stream straight to the output file, then preview only its head
+            try:
+                out_path.parent.mkdir(parents=True, exist_ok=True)
+                with out_path.open('w', encoding='utf-8') as f:
+                    size = write_review(chunks, f)
+                st.success(f"Generated {len(items)} items")
+                st.info(f"Saved to {out_path}")
+            except Exception as e:
+                st.error(f"Failed to save: {e}")
+                size = 0
+            if include_abstract:
+                results = [it.extraction for it in items if it.extraction]
+                with st.expander("PDF extraction report", expanded=any(r['error'] for r in results)):
+                    st.text('\n'.join(format_report(results, verbose=True)))
+            if size:
+                with out_path.open(encoding='utf-8') as f:
+                    preview = f.read(PREVIEW_CHARS)
+                with st.expander("Preview Markdown", expanded=True):
+                    if size > PREVIEW_CHARS:
+                        st.caption(f"Showing the first {PREVIEW_CHARS:,} of {size:,} characters")
+                    st.code(preview, language="markdown")
+                with out_path.open('rb') as f:
+                    st.download_button("Download Markdown", data=f, file_name=out_path.name, mime="text/markdown")
+
+    st.markdown("---")
+    st.caption("Tip: Ensure ONEDRIVE_PAPERS_ROOT is set for local PDF abstract extraction.")
+    st.markdown("---")
+
+    # --- Add New Paper (Upload) ---
+    st.subheader("Add New Paper (Upload)")
+    st.caption("Upload a new paper PDF to create a note and register it.")
+
+    new_pdfs = st.file_uploader(
+        "Upload PDF(s)", type=["pdf"], accept_multiple_files=True, key="new_pdfs_uploader"
+    )
+
+    # Registration (ID inference, metadata extraction, note + manifest updates) runs in a
+    # background worker; the uploader keeps its files across reruns, so each is queued once.
+    job_runner = get_runner()
+    submitted = st.session_state.setdefault('submitted_uploads', set())
+    if new_pdfs:
+        queued = 0
+        for uf in new_pdfs:
+            upload_key = getattr(uf, 'file_id', None) or (uf.name, uf.size)
+            if upload_key in submitted:
                 continue
-            dest = uploads_root / f"{pid}.pdf"
-            with open(dest, 'wb') as f:
-                f.write(uf.read())
-            # Register to manifest
-            append_manifest({
-                'paper_id': pid,
-                'title': '',
-                'year': year,
-                'one_drive_path': str(dest),
-                'share_link': ''
-            })
-            # Create initial note with local_hint pointing to the saved file
-            create_note(pid, year, str(dest))
-            created.append((pid, dest))
-        except Exception as e:
-            st.error(f"Failed to add {uf.name}: {e}")
-    if created:
-        # Extract metadata and update note/manifest for each created
-        updated = []
-        for pid, dest in created:
-            md = extract_pdf_metadata(dest)
-            # Update note front matter with extracted fields
-            note_file = Path('notes') / f"{pid}.md"
             try:
-                updates = {}
-                if md.get('title'): updates['title'] = md['title']
-                if md.get('authors'): updates['authors'] = md['authors']
-                if md.get('year'): updates['year'] = md['year']
-                if md.get('doi'): updates['doi'] = md['doi']
-                if dest: updates['local_hint'] = str(dest)
-                update_note_front_matter(note_file, updates)
-                updated.append(pid)
+                _, is_new = job_runner.store.submit(uf.name, uf)
+                queued += int(is_new)
+                submitted.add(upload_key)
             except Exception as e:
-                st.warning(f"Note update failed for {pid}: {e}")
-        st.success(f"Added {len(created)} paper(s): {', '.join(pid for pid,_ in created)}")
-        # Clear caches so new notes appear in selection
-        st.cache_data.clear()
-        st.rerun()
-
-st.markdown("---")
-
-# --- Prompt Studio (Experimental) ---
-st.subheader("Prompt Studio (Experimental)")
-st.caption("Notebook LM風: 複数ノート/アップロードPDFを参照してプロンプトを実行。LLMは任意。")
-
-if 'doc_weights' not in st.session_state:
-    st.session_state.doc_weights = {}
-
-prompt = st.text_area("Prompt", value="Compare the contributions and limitations of the selected papers.", height=120)
-use_llm = st.toggle("Use AI (LangChain)", value=False, help="OPENAI_API_KEY または AZURE_OPENAI_API_KEY が必要")
-model_name = st.text_input("Model (OpenAI)", value="gpt-4o-mini", help="LangChain ChatOpenAI用のモデル名") if use_llm else ""
-
-if selected_pids:
-    with st.expander("Selected documents & weights", expanded=False):
-        for label, pid in [(l, p) for (l, p) in note_options if p in selected_pids]:
-            w = st.slider(f"{label}", min_value=0.0, max_value=2.0, value=float(st.session_state.doc_weights.get(pid, 1.0)), step=0.1)
-            st.session_state.doc_weights[pid] = w
-
-run_prompt = st.button("Run Prompt")
-
-if run_prompt:
-    # Prepare simple contexts (note body + optional abstract)
-    docs = []
-    for p in find_notes(sel_tags, sel_year, selected_pids):
-        info = load_note_info(p)
-        m = info['meta']  # type: ignore
-        pid = str(m.get('paper_id',''))
-        abstract = ''
-        local_pdf = None
-        try:
-            local_pdf = (Path('data')/ 'uploads' / f"{pid}.pdf")
-            if local_pdf.exists():
-                abstract = try_extract_abstract_from_pdf(local_pdf)
-        except Exception:
+                st.error(f"Failed to queue {uf.name}: {e}")
+        if queued:
+            job_runner.wake()
+            st.info(f"Queued {queued} PDF(s) for registration")
+
+    job_counts = job_runner.store.counts()
+    if any(job_counts.values()):
+        pending = job_counts['queued'] + job_counts['running']
+        finished = job_counts['done'] + job_counts['linked'] + job_counts['skipped'] + job_counts['failed']
+        st.progress(finished / max(1, finished + pending),
+                    text=f"{job_counts['done']} added, {job_counts['linked']} linked to existing papers, "
+                         f"{job_counts['skipped']} skipped, {job_counts['failed']} failed, {pending} pending")
+        # Newly registered notes are rewritten in place after creation: refresh corpus-level entries once
+        registered = job_counts['done'] + job_counts['linked']
+        if registered != st.session_state.get('jobs_done_seen'):
+            if 'jobs_done_seen' in st.session_state:
+                invalidate_notes()
+            st.session_state.jobs_done_seen = registered
+        colj1, colj2, colj3 = st.columns(3)
+        with colj1:
+            if st.button("Refresh status"):
+                st.rerun()
+        with colj2:
+            if job_counts['failed'] and st.button("Retry failed"):
+                job_runner.store.retry_failed()
+                job_runner.wake()
+                st.rerun()
+        with colj3:
+            if not pending and st.button("Clear finished"):
+                job_runner.store.clear_finished()
+                st.rerun()
+        with st.expander("Upload jobs", expanded=bool(job_counts['failed'])):
+            st.dataframe(job_runner.store.recent(200), use_container_width=True)
+
+    st.markdown("---")
+
+    # --- Prompt Studio (Experimental) ---
+    st.subheader("Prompt Studio (Experimental)")
+    st.caption("Notebook LM風: 複数ノート/アップロードPDFを参照してプロンプトを実行。LLMは任意。")
+
+    if 'doc_weights' not in st.session_state:
+        st.session_state.doc_weights = {}
+
+    prompt = st.text_area("Prompt", value="Compare the contributions and limitations of the selected papers.", height=120)
+    use_llm = st.toggle("Use AI (LangChain)", value=False, help="OPENAI_API_KEY または AZURE_OPENAI_API_KEY が必要")
+    use_retrieval = st.toggle("Retrieve relevant chunks", value=True, help="プロンプトとの類似度×重みでチャンクを選択（ローカル埋め込み＋ベクタ索引）")
+    model_name = st.text_input("Model (OpenAI)", value="gpt-4o-mini",
+                               help="LangChain ChatOpenAI用のモデル名（'fake' でAPIキー不要のオフライン動作確認）") if use_llm else ""
+    use_response_cache = st.toggle("Cache LLM responses", value=True,
+                                   help="同じプロンプト・コンテキスト・モデルの回答を data/cache に保存して再利用") if use_llm else False
+    token_budget = st.number_input("Context token budget", min_value=256, max_value=200_000, step=256,
+                                   value=default_budget(model_name or "gpt-4o-mini"),
+                                   help="コンテキストに詰めるトークン数の上限（関連度×重みの高い順に文境界で詰める）")
+
+    if selected_pids:
+        with st.expander("Selected documents & weights", expanded=False):
+            for label, pid in [(l, p) for (l, p) in note_options if p in selected_pids]:
+                w = st.slider(f"{label}", min_value=0.0, max_value=2.0, value=float(st.session_state.doc_weights.get(pid, 1.0)), step=0.1)
+                st.session_state.doc_weights[pid] = w
+
+    run_prompt = st.button("Run Prompt")
+
+    if run_prompt:
+        # Prepare simple contexts (note body + optional abstract)
+        docs = []
+        names = filter_index(corpus_key()).select(sel_tags, sel_year, selected_pids, tag_expr=sel_expr,
+                                                  year_range=sel_year_range)
+        for p in [NOTES_DIR / n for n in names]:
+            st_note = p.stat()
+            pid, body = note_doc(str(p), st_note.st_mtime_ns, st_note.st_size)
             abstract = ''
-        weight = float(st.session_state.doc_weights.get(pid, 1.0))
-        text = (abstract + "\n\n" + info['body']) if abstract else info['body']  # type: ignore
-        docs.append((pid, text, weight))
-
-    # Build context from weighted docs
-    k = min(5, len(docs))
-    context = build_context_from_docs(docs, top_k=k)
-    if use_llm:
-        try:
-            resp = generate_with_langchain(prompt, context, model=model_name or "gpt-4o-mini")
-            st.markdown("## Output (LLM)")
-            st.markdown(resp)
-        except Exception as e:
-            st.error(f"LLM実行に失敗しました: {e}")
-            st.caption("環境変数 OPENAI_API_KEY などが未設定の可能性があります。")
-            with st.expander("Context Preview", expanded=False):
-                st.code(context)
+            local_pdf = None
+            try:
+                local_pdf = (Path('data')/ 'uploads' / f"{pid}.pdf")
+                if local_pdf.exists():
+                    abstract = str(pdf_extraction(uploaded_pdf_sha(pid, local_pdf), str(local_pdf))['abstract'])
+            except Exception:
+                abstract = ''
+            weight = float(st.session_state.doc_weights.get(pid, 1.0))
+            text = (abstract + "\n\n" + body) if abstract else body
+            docs.append((pid, text, weight))
+
+        # Build context from weighted docs
+        context, pack_stats = build_packed_context(docs, prompt=prompt if use_retrieval else None,
+                                                   model=model_name or "gpt-4o-mini", token_budget=int(token_budget))
+        k = pack_stats['chunks_used']
+        st.caption(
+            f"Context: {pack_stats['tokens_used']}/{pack_stats['budget']} tokens, {pack_stats['chunks_used']} chunk(s) used, "
+            f"{pack_stats['dropped_duplicate']} duplicate(s) and {pack_stats['dropped_budget']} over budget dropped, "
+            f"{pack_stats['truncated']} truncated"
+        )
+        if use_llm:
+            try:
+                st.markdown("## Output (LLM)")
+                st.write_stream(stream_with_langchain(prompt, context, model=model_name or "gpt-4o-mini",
+                                                      use_cache=use_response_cache))
+                cache_stats = get_response_cache().stats()
+                st.caption(f"Response cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es), "
+                           f"{cache_stats['entries']} stored")
+            except Exception as e:
+                st.error(f"LLM実行に失敗しました: {e}")
+                st.caption("環境変数 OPENAI_API_KEY などが未設定の可能性があります。")
+                with st.expander("Context Preview", expanded=False):
+                    st.code(context)
+        else:
+            output = f"## Prompt\n{prompt}\n\n## Context (top {k})\n{context}\n\n## Output (placeholder)\nWrite your reasoning here or enable AI mode."
+            with st.expander("Prompt Result", expanded=True):
+                st.markdown(output)
+
+    st.markdown("---")
+
+with st.expander("Performance", expanded=False):
+    st.caption(f"Last rerun: {(time.perf_counter() - _rerun_started) * 1000:.0f} ms "
+               f"(cached calls do not record spans)")
+    rows = tracer.summary() if tracer else []
+    if rows:
+        st.dataframe(
+            [{"span": r["name"], "calls": r["calls"], "total ms": round(r["total_s"] * 1000, 1),
+              "self ms": round(r["self_s"] * 1000, 1),
+              "counters": ", ".join(f"{k}={v:g}" for k, v in r["counters"].items())} for r in rows],
+            use_container_width=True,
+        )
+        st.download_button("Download Chrome trace", data=json.dumps(tracer.to_chrome_trace()),
+                           file_name="paper-notes-trace.json", mime="application/json")
     else:
-        output = f"## Prompt\n{prompt}\n\n## Context (top {k})\n{context}\n\n## Output (placeholder)\nWrite your reasoning here or enable AI mode."
-        with st.expander("Prompt Result", expanded=True):
-            st.markdown(output)
-
-st.markdown("---")
+        st.caption("No instrumented work ran in this rerun.")